@@ -7,6 +7,40 @@ def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
 
+    # Configure shared caches and download tuning
+    from downloaders.utils.info_cache import configure_info_cache
+    from downloaders.utils.thumbnail_utils import configure_thumbnail_cache
+    from downloaders.tuning import configure_transfer_tuner
+    from downloaders.bandwidth import configure_bandwidth_scheduler
+    from downloaders.utils.library import configure_library
+
+    configure_info_cache(
+        ttl=app.config['INFO_CACHE_TTL'],
+        max_memory_entries=app.config['INFO_CACHE_MEMORY_ENTRIES'],
+        max_disk_entries=app.config['INFO_CACHE_DISK_ENTRIES'],
+    )
+    configure_thumbnail_cache(
+        max_bytes=app.config['THUMBNAIL_CACHE_MAX_BYTES'],
+        max_size=app.config['THUMBNAIL_MAX_SIZE'],
+    )
+    configure_transfer_tuner(
+        fragments=app.config['CONCURRENT_FRAGMENTS'],
+        min_fragments=app.config['MIN_CONCURRENT_FRAGMENTS'],
+        max_fragments=app.config['MAX_CONCURRENT_FRAGMENTS'],
+        chunk_size=app.config['HTTP_CHUNK_SIZE'],
+        min_chunk_size=app.config['MIN_HTTP_CHUNK_SIZE'],
+        max_chunk_size=app.config['MAX_HTTP_CHUNK_SIZE'],
+        buffer_size=app.config['DOWNLOAD_BUFFER_SIZE'],
+    )
+    configure_bandwidth_scheduler(
+        max_rate=app.config['MAX_BANDWIDTH'],
+        burst=app.config['BANDWIDTH_BURST'],
+    )
+    configure_library(
+        archive_path=app.config['DOWNLOAD_ARCHIVE'],
+        refresh_interval=app.config['LIBRARY_REFRESH_INTERVAL'],
+    )
+
     # Register blueprints
     from app.routes.main import main_bp
     from app.routes.api import api_bp
@@ -0,0 +1,355 @@
+import asyncio
+import contextvars
+import io
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from flask import Flask
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import Map, Rule
+from werkzeug.wrappers import Request
+
+from app.services.job_queue import JobStateError, QuotaExceededError
+from app.services.scheduler import MAX_PRIORITY, MIN_PRIORITY
+from app.services.progress_broadcaster import ProgressBroadcaster
+from app.utils.clients import API_KEY_HEADER, get_client_id, is_known_api_key
+from downloaders.bandwidth import get_bandwidth_scheduler
+from downloaders.utils.metrics import register_gauge
+
+SSE_HEADERS = [
+    (b'content-type', b'text/event-stream; charset=utf-8'),
+    (b'cache-control', b'no-cache'),
+    (b'x-accel-buffering', b'no'),
+]
+
+
+class AsyncAPI:
+    """ASGI application for serving many clients from one process.
+
+    The download, progress, job and open_* endpoints run on the asyncio loop:
+    progress streams wait on a shared broadcaster instead of holding a thread,
+    and blocking work (yt-dlp extraction, journal reads, launching programs)
+    goes to a thread pool. Every other request is handed to the Flask app in
+    that pool, so pages, static files and the remaining API behave the same."""
+
+    def __init__(self, flask_app: Flask, threads: int = 16):
+        from app.routes import download_service
+        from app.routes.api import file_service
+
+        self.flask_app = flask_app
+        self.config = flask_app.config
+        self.service = download_service
+        self.file_service = file_service
+        self.executor = ThreadPoolExecutor(max_workers=max(1, threads), thread_name_prefix='api')
+        self.broadcaster: Optional[ProgressBroadcaster] = None  # Created on the serving loop
+        self.url_map = Map([
+            Rule('/api/download', methods=['POST'], endpoint='download'),
+            Rule('/api/progress', methods=['GET'], endpoint='progress'),
+            Rule('/api/progress/stream', methods=['GET'], endpoint='stream_progress'),
+            Rule('/api/progress/<job_id>', methods=['GET'], endpoint='job_progress'),
+            Rule('/api/jobs', methods=['GET'], endpoint='jobs'),
+            Rule('/api/jobs/<job_id>/priority', methods=['POST'], endpoint='job_priority'),
+            Rule('/api/batch/<batch_id>', methods=['GET'], endpoint='batch_progress'),
+            Rule('/api/open_location/<path:filename>', methods=['GET'], endpoint='open_location'),
+            Rule('/api/open_file/<path:filename>', methods=['GET'], endpoint='open_file'),
+        ]).bind('localhost')
+
+        register_gauge('ytdl_progress_subscribers', 'Clients following job progress over the ASGI API',
+                       lambda: self.broadcaster.subscribers if self.broadcaster else 0)
+
+    async def __call__(self, scope: Dict, receive: Callable, send: Callable):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        if self.broadcaster is None:
+            self.broadcaster = ProgressBroadcaster(asyncio.get_running_loop())
+
+        try:
+            endpoint, args = self.url_map.match(scope['path'], method=scope['method'])
+        except HTTPException:
+            # Not one of ours (or a wrong method): Flask answers as usual
+            await self._call_flask(scope, receive, send)
+            return
+
+        request = Request(self._environ(scope, await self._read_body(receive)))
+        api_key = request.headers.get(API_KEY_HEADER)
+        if api_key and not is_known_api_key(api_key, self.config['API_KEYS']):
+            await self._send_json(send, {'error': 'Unknown API key'}, 401)
+            return
+        client_id = get_client_id(request.headers, request.remote_addr)
+        if endpoint == 'stream_progress':
+            await self._stream_progress(request, client_id, receive, send)
+            return
+
+        handler = getattr(self, f'_{endpoint}')
+        try:
+            result = await handler(request, client_id, **args)
+        except QuotaExceededError as e:
+            result = {'error': str(e)}, 429
+        except Exception as e:
+            result = {'error': str(e)}, 500
+        payload, status = result if isinstance(result, tuple) else (result, 200)
+        await self._send_json(send, payload, status)
+
+    async def _lifespan(self, receive: Callable, send: Callable):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _blocking(self, function: Callable, *args, **kwargs):
+        """Run blocking work in the thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, lambda: function(*args, **kwargs))
+
+    # Endpoints, matching app/routes/api.py
+
+    async def _download(self, request: Request, client_id: str):
+        """Start a download"""
+        url = request.form.get('url')
+        format_id = request.form.get('format')
+        if not url:
+            return {'error': 'No video selected'}
+        if not format_id:
+            return {'error': 'No format selected'}, 400
+
+        weight = request.form.get('weight', 1.0, type=float)
+        if weight <= 0:
+            return {'error': 'Weight must be positive'}, 400
+        priority = request.form.get('priority', 0, type=int)
+        if not MIN_PRIORITY <= priority <= MAX_PRIORITY:
+            return {'error': f'Priority must be between {MIN_PRIORITY} and {MAX_PRIORITY}'}, 400
+
+        options = {}
+        if request.form.get('audio_mode'):
+            options['passthrough'] = request.form['audio_mode'] == 'passthrough'
+        # Extracting the video info can take seconds
+        return await self._blocking(self.service.start_download, url, format_id,
+                                    weight=weight, client_id=client_id, priority=priority, **options)
+
+    async def _progress(self, request: Request, client_id: str):
+        """Get download progress of the latest job"""
+        return self.service.get_progress(client_id=client_id)
+
+    async def _job_progress(self, request: Request, client_id: str, job_id: str):
+        """Get download progress of a job"""
+        job = self.service.job_queue.get(job_id, client_id)
+        if job:
+            return job.get_progress()
+        try:
+            # Jobs of other processes are read from the journal
+            return await self._blocking(self.service.get_progress, job_id, client_id)
+        except ValueError as e:
+            return {'error': str(e)}, 404
+
+    async def _jobs(self, request: Request, client_id: str):
+        """List the download jobs of the caller"""
+        return {
+            'jobs': self.service.list_jobs(client_id),
+            'usage': self.service.job_queue.client_usage(client_id),
+            'stats': self.service.job_queue.stats(),
+            'max_workers': self.service.job_queue.max_workers,
+            'postprocess_workers': self.service.job_queue.postprocess_workers,
+            'bandwidth': get_bandwidth_scheduler().allocation(),
+        }
+
+    async def _job_priority(self, request: Request, client_id: str, job_id: str):
+        """Change the priority of a queued job"""
+        priority = request.form.get('priority', type=int)
+        if priority is None:
+            return {'error': 'No priority given'}, 400
+        if not MIN_PRIORITY <= priority <= MAX_PRIORITY:
+            return {'error': f'Priority must be between {MIN_PRIORITY} and {MAX_PRIORITY}'}, 400
+        try:
+            # Re-recording the job in the journal writes to SQLite
+            return await self._blocking(self.service.set_priority, job_id, priority, client_id)
+        except ValueError as e:
+            return {'error': str(e)}, 404
+        except JobStateError as e:
+            return {'error': str(e)}, 409
+
+    async def _batch_progress(self, request: Request, client_id: str, batch_id: str):
+        """Get the progress of a playlist or channel download"""
+        try:
+            return self.service.get_batch_progress(batch_id, client_id)
+        except ValueError as e:
+            return {'error': str(e)}, 404
+
+    async def _open_location(self, request: Request, client_id: str, filename: str):
+        """Open file location"""
+        return await self._blocking(self.file_service.open_file_location, filename)
+
+    async def _open_file(self, request: Request, client_id: str, filename: str):
+        """Open file with default application"""
+        return await self._blocking(self.file_service.open_file, filename)
+
+    async def _stream_progress(self, request: Request, client_id: str,
+                               receive: Callable, send: Callable):
+        """Stream download progress of a job as Server-Sent Events"""
+        job_id = request.args.get('job_id')
+        coalesce = self.config['PROGRESS_STREAM_COALESCE']
+        heartbeat = self.config['PROGRESS_STREAM_HEARTBEAT']
+        queue = self.service.job_queue
+        job = queue.get(job_id, client_id) if job_id else queue.latest(client_id)
+        if job:
+            events = self.broadcaster.watch(job, coalesce, heartbeat)
+        elif job_id:
+            events = self._poll_progress(job_id, client_id, heartbeat)
+        else:
+            await self._send_json(send, {'error': 'Job not found'}, 404)
+            return
+
+        try:
+            first = await events.__anext__()
+        except ValueError as e:
+            await self._send_json(send, {'error': str(e)}, 404)
+            return
+        except Exception as e:
+            await self._send_json(send, {'error': str(e)}, 500)
+            return
+
+        async def forward():
+            await send({'type': 'http.response.start', 'status': 200, 'headers': SSE_HEADERS})
+            await send({'type': 'http.response.body', 'body': _event(first), 'more_body': True})
+            async for progress in events:
+                await send({'type': 'http.response.body', 'body': _event(progress), 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+
+        async def disconnected():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+
+        # Stop following the job as soon as the client goes away
+        tasks = [asyncio.ensure_future(forward()), asyncio.ensure_future(disconnected())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await events.aclose()
+
+    async def _poll_progress(self, job_id: str, client_id: str,
+                             heartbeat: float) -> AsyncIterator[Optional[Dict]]:
+        """Follow a job run by another process through the progress it publishes"""
+        interval = self.service.sync_interval
+        progress = await self._blocking(self.service.get_progress, job_id, client_id)
+        yield progress
+
+        quiet = 0.0
+        while progress['status'] not in ('done', 'error'):
+            await asyncio.sleep(interval)
+            latest = await self._blocking(self.service.get_progress, job_id, client_id)
+            if latest != progress:
+                progress, quiet = latest, 0.0
+                yield progress
+            else:
+                quiet += interval
+                if quiet >= heartbeat:
+                    quiet = 0.0
+                    yield None
+
+    # HTTP plumbing
+
+    @staticmethod
+    async def _read_body(receive: Callable) -> bytes:
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        return b''.join(chunks)
+
+    @staticmethod
+    def _environ(scope: Dict, body: bytes) -> Dict:
+        """Build the WSGI environ of an ASGI request"""
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope['headers']:
+            name, value = name.decode('latin-1'), value.decode('latin-1')
+            if name == 'content-length':
+                continue
+            key = 'CONTENT_TYPE' if name == 'content-type' else 'HTTP_' + name.upper().replace('-', '_')
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+    async def _call_flask(self, scope: Dict, receive: Callable, send: Callable):
+        """Run the request through the Flask app in the thread pool"""
+        environ = self._environ(scope, await self._read_body(receive))
+        started: List[Tuple[str, List[Tuple[str, str]]]] = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [(status, headers)]
+
+        # Each step may run on another pool thread; one context keeps Flask's
+        # request context (e.g. of stream_with_context) valid across them
+        context = contextvars.copy_context()
+        iterable = await self._blocking(context.run, self.flask_app, environ, start_response)
+        try:
+            iterator = iter(iterable)
+            # Streamed responses (e.g. /api/info) are read chunk by chunk in the pool
+            streamed = not isinstance(iterable, list)
+            chunk = await self._blocking(context.run, next, iterator, None) if streamed else next(iterator, None)
+            status, headers = started[0]
+            await send({
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                            for name, value in headers],
+            })
+            while chunk is not None:
+                chunk = chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await self._blocking(context.run, next, iterator, None) if streamed else next(iterator, None)
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(iterable, 'close'):
+                await self._blocking(context.run, iterable.close)
+
+    @staticmethod
+    async def _send_json(send: Callable, payload: Dict, status: int = 200):
+        body = (json.dumps(payload) + '\n').encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json'),
+                        (b'content-length', str(len(body)).encode('latin-1'))],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+
+def _event(progress: Optional[Dict]) -> bytes:
+    """Encode a progress update (or a heartbeat for None) as a Server-Sent Event"""
+    if progress is None:
+        return b': heartbeat\n\n'
+    return f'data: {json.dumps(progress)}\n\n'.encode('utf-8')
+
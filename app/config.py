@@ -1,5 +1,6 @@
 import os
 from downloaders.utils.file_utils import get_base_download_path
+from app.utils.formatters import parse_size
 
 
 class Config:
@@ -8,6 +9,12 @@ class Config:
         'SECRET_KEY') or 'dev-secret-key-change-in-production'
     DEBUG = os.environ.get('FLASK_DEBUG', 'True').lower() == 'true'
 
+    # Server settings ('development' runs Flask's server, 'production' runs waitress,
+    # 'asgi' runs the async API on uvicorn)
+    SERVE_MODE = os.environ.get('SERVE_MODE', 'development').lower()
+    SERVER_THREADS = int(os.environ.get('SERVER_THREADS', 16))  # Request threads, or blocking-work threads with ASGI
+    SHUTDOWN_TIMEOUT = float(os.environ.get('SHUTDOWN_TIMEOUT', 30))  # Seconds running jobs get to finish
+
     # Download settings
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024 * 1024  # 16GB max file size
     DOWNLOAD_FOLDER = get_base_download_path()
@@ -15,5 +22,81 @@ class Config:
     # FFmpeg settings
     FFMPEG_PATH = None  # Will be auto-detected
 
+    # Keep the original audio stream (m4a/opus) instead of converting to MP3
+    AUDIO_PASSTHROUGH = os.environ.get(
+        'AUDIO_PASSTHROUGH', 'False').lower() == 'true'
+
     # Threading settings
     MAX_DOWNLOAD_THREADS = 3
+    EXTRACTION_WORKERS = os.cpu_count() or 1  # Processes used for video info extraction
+    MAX_INFO_BATCH = 100  # Most URLs accepted by one /api/info request
+    MAX_LIBRARY_PAGE = 500  # Most files returned by one /api/library request
+
+    # Per-client limits; a client is an X-API-Key header, or the caller's address without one
+    API_KEYS = frozenset(key.strip() for key in os.environ.get('API_KEYS', '').split(',') if key.strip())
+    CLIENT_MAX_RUNNING_JOBS = int(os.environ.get('CLIENT_MAX_RUNNING_JOBS', 2))  # Download slots per client (0 = no limit)
+    CLIENT_MAX_QUEUED_BYTES = parse_size(os.environ.get('CLIENT_MAX_QUEUED_BYTES'))  # e.g. '20GB'; None = unlimited
+
+    # Order of a client's queued jobs: priority, then waiting time and expected size (shortest first)
+    PRIORITY_AGING = float(os.environ.get('PRIORITY_AGING', 300))  # Seconds of waiting worth one priority level
+    SJF_BYTES_PER_SECOND = parse_size(os.environ.get('SJF_BYTES_PER_SECOND')) or 10 * 1024 * 1024  # Size worth a second of waiting
+    FAST_LANE_SLOTS = int(os.environ.get('FAST_LANE_SLOTS', 1))  # Download slots kept for small audio jobs
+    FAST_LANE_MAX_BYTES = parse_size(os.environ.get('FAST_LANE_MAX_BYTES')) or 50 * 1024 * 1024
+
+    # Subscriptions: channels and playlists whose new videos are downloaded on every sync
+    SUBSCRIPTION_SYNC_INTERVAL = float(os.environ.get('SUBSCRIPTION_SYNC_INTERVAL', 3600))  # Default seconds between syncs
+    SUBSCRIPTION_MIN_INTERVAL = float(os.environ.get('SUBSCRIPTION_MIN_INTERVAL', 300))
+    SUBSCRIPTION_SYNC_WORKERS = int(os.environ.get('SUBSCRIPTION_SYNC_WORKERS', 2))  # Subscriptions synced at the same time
+
+    # Post-processing settings (ffmpeg merge/encode/tag runs apart from downloads)
+    POSTPROCESS_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+    POSTPROCESS_NICE = 10  # Nice level of ffmpeg processes (0 to disable)
+    FFMPEG_THREADS = 2  # Threads each ffmpeg process may use
+
+    # Finished jobs stay in the job journal this long (seconds)
+    JOB_JOURNAL_RETENTION = 7 * 24 * 60 * 60
+
+    # Finished jobs stay in memory this long (seconds); older ones are read from
+    # the journal, which lists at most JOB_HISTORY_LIMIT of them in /api/jobs
+    JOB_MEMORY_RETENTION = 60 * 60
+    JOB_HISTORY_LIMIT = 100
+
+    # Processes sharing the data folder share jobs through the journal: progress
+    # is published every PROGRESS_SYNC_INTERVAL seconds, and unfinished jobs of a
+    # process silent for JOB_STALE_AFTER seconds are taken over by another one
+    PROGRESS_SYNC_INTERVAL = float(os.environ.get('PROGRESS_SYNC_INTERVAL', 1.0))
+    JOB_STALE_AFTER = float(os.environ.get('JOB_STALE_AFTER', 30))
+
+    # yt-dlp download archive kept in sync with the library (default: .data/archive.txt)
+    DOWNLOAD_ARCHIVE = os.environ.get('DOWNLOAD_ARCHIVE')
+
+    # Least seconds between checks of the download folders for files added,
+    # deleted or moved outside the app
+    LIBRARY_REFRESH_INTERVAL = 5
+
+    # Bandwidth shared by all downloads, split between them by weight
+    MAX_BANDWIDTH = parse_size(os.environ.get('MAX_BANDWIDTH'))  # Bytes/s, e.g. '10MB'; None = unlimited
+    BANDWIDTH_BURST = 1.0  # Seconds of bandwidth a download may use at once
+
+    # Transfer tuning: parallel DASH/HLS fragments and HTTP chunk size are
+    # adjusted between streams within these bounds from measured throughput
+    CONCURRENT_FRAGMENTS = 4
+    MIN_CONCURRENT_FRAGMENTS = 1
+    MAX_CONCURRENT_FRAGMENTS = 16
+    HTTP_CHUNK_SIZE = 10 * 1024 * 1024
+    MIN_HTTP_CHUNK_SIZE = 1024 * 1024
+    MAX_HTTP_CHUNK_SIZE = 64 * 1024 * 1024
+    DOWNLOAD_BUFFER_SIZE = 64 * 1024
+
+    # Video info cache settings
+    INFO_CACHE_TTL = 3 * 60 * 60  # Stream URLs expire after a few hours
+    INFO_CACHE_MEMORY_ENTRIES = 64
+    INFO_CACHE_DISK_ENTRIES = 1000
+
+    # Thumbnail cache settings
+    THUMBNAIL_CACHE_MAX_BYTES = 200 * 1024 * 1024
+    THUMBNAIL_MAX_SIZE = 1280  # Cover art is shrunk to fit this many pixels
+
+    # Progress stream settings (seconds)
+    PROGRESS_STREAM_COALESCE = 0.25
+    PROGRESS_STREAM_HEARTBEAT = 15
@@ -1,11 +1,46 @@
-from flask import Blueprint, request, jsonify
+import json
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
 from app.routes import download_service
 from app.services.file_service import FileService
+from app.services.job_queue import JobStateError, QuotaExceededError
+from app.services.scheduler import MAX_PRIORITY, MIN_PRIORITY
+from app.utils.clients import API_KEY_HEADER, get_client_id, is_known_api_key
+from app.utils.formatters import parse_size
+from downloaders.bandwidth import get_bandwidth_scheduler
 
 api_bp = Blueprint('api', __name__)
 file_service = FileService()
 
 
+@api_bp.before_request
+def check_api_key():
+    """Reject requests sending an API key that isn't configured"""
+    api_key = request.headers.get(API_KEY_HEADER)
+    if api_key and not is_known_api_key(api_key, current_app.config['API_KEYS']):
+        return jsonify({'error': 'Unknown API key'}), 401
+    return None
+
+
+def _client_id() -> str:
+    """Namespace of the jobs of the current caller"""
+    return get_client_id(request.headers, request.remote_addr)
+
+
+def _audio_options() -> dict:
+    """Read the audio mode of a download request ('mp3' or 'passthrough')"""
+    audio_mode = request.form.get('audio_mode')
+    if not audio_mode:
+        return {}
+    return {'passthrough': audio_mode == 'passthrough'}
+
+
+def _priority_error(priority: int):
+    """Error response for a priority out of range, or None"""
+    if not MIN_PRIORITY <= priority <= MAX_PRIORITY:
+        return jsonify({'error': f'Priority must be between {MIN_PRIORITY} and {MAX_PRIORITY}'}), 400
+    return None
+
+
 @api_bp.route('/download', methods=['POST'])
 def download():
     """Start a download"""
@@ -17,22 +52,286 @@ def download():
         if not format_id:
             return jsonify({'error': 'No format selected'}), 400
 
-        result = download_service.start_download(url, format_id)
+        weight = request.form.get('weight', 1.0, type=float)
+        if weight <= 0:
+            return jsonify({'error': 'Weight must be positive'}), 400
+        priority = request.form.get('priority', 0, type=int)
+        if _priority_error(priority):
+            return _priority_error(priority)
+
+        result = download_service.start_download(
+            url, format_id, weight=weight, client_id=_client_id(), priority=priority,
+            **_audio_options())
         return jsonify(result)
+    except QuotaExceededError as e:
+        return jsonify({'error': str(e)}), 429
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@api_bp.route('/video')
+def video_info():
+    """Get the title, duration, thumbnail and format lists of a video"""
+    try:
+        url = request.args.get('url')
+        if not url:
+            return jsonify({'error': 'No video selected'}), 400
+
+        return jsonify(download_service.get_video_info(url))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@api_bp.route('/info', methods=['POST'])
+def batch_info():
+    """Get video information for many URLs, streamed as newline-delimited JSON"""
+    try:
+        payload = request.get_json(silent=True) or {}
+        urls = payload.get('urls') or request.form.get('urls', '').split()
+        urls = [url.strip() for url in urls if url and url.strip()]
+        if not urls:
+            return jsonify({'error': 'No URLs provided'}), 400
+        if len(urls) > current_app.config['MAX_INFO_BATCH']:
+            return jsonify({'error': f"At most {current_app.config['MAX_INFO_BATCH']} URLs per request"}), 400
+
+        results = download_service.get_video_infos(urls)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    def generate():
+        for result in results:
+            yield json.dumps(result) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@api_bp.route('/formats')
+def find_formats():
+    """Find the formats of a video matching constraints, best first"""
+    try:
+        url = request.args.get('url')
+        if not url:
+            return jsonify({'error': 'No video selected'}), 400
+
+        result = download_service.find_formats(
+            url,
+            kind=request.args.get('type', 'video'),
+            max_height=request.args.get('max_height', type=int),
+            min_height=request.args.get('min_height', type=int),
+            container=request.args.get('container'),
+            max_filesize=parse_size(request.args.get('max_size')),
+            max_abr=request.args.get('max_abr', type=float),
+        )
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@api_bp.route('/batch', methods=['POST'])
+def batch_download():
+    """Start downloading every video of a playlist or channel"""
+    try:
+        url = request.form.get('url')
+        kind = request.form.get('type', 'video')
+        max_height = request.form.get('max_height', type=int)
+        if not url:
+            return jsonify({'error': 'No playlist selected'}), 400
+        priority = request.form.get('priority', 0, type=int)
+        if _priority_error(priority):
+            return _priority_error(priority)
+
+        result = download_service.start_batch(
+            url, kind, max_height, client_id=_client_id(), priority=priority,
+            **_audio_options())
+        return jsonify(result)
+    except QuotaExceededError as e:
+        return jsonify({'error': str(e)}), 429
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@api_bp.route('/batch/<batch_id>')
+def get_batch_progress(batch_id):
+    """Get the progress of a playlist or channel download"""
+    try:
+        return jsonify(download_service.get_batch_progress(batch_id, _client_id()))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @api_bp.route('/progress')
 def get_progress():
-    """Get download progress"""
+    """Get download progress of the latest job"""
     try:
-        progress = download_service.get_progress()
+        progress = download_service.get_progress(client_id=_client_id())
         return jsonify(progress)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@api_bp.route('/progress/stream')
+def stream_progress():
+    """Stream download progress of a job as Server-Sent Events"""
+    try:
+        events = download_service.watch_progress(
+            request.args.get('job_id'),
+            coalesce=current_app.config['PROGRESS_STREAM_COALESCE'],
+            heartbeat=current_app.config['PROGRESS_STREAM_HEARTBEAT'],
+            client_id=_client_id(),
+        )
+        first = next(events)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    def generate():
+        yield f"data: {json.dumps(first)}\n\n"
+        for progress in events:
+            if progress is None:
+                yield ": heartbeat\n\n"
+            else:
+                yield f"data: {json.dumps(progress)}\n\n"
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+
+@api_bp.route('/progress/<job_id>')
+def get_job_progress(job_id):
+    """Get download progress of a job"""
+    try:
+        progress = download_service.get_progress(job_id, _client_id())
+        return jsonify(progress)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@api_bp.route('/jobs')
+def list_jobs():
+    """List the download jobs of the caller"""
+    try:
+        client_id = _client_id()
+        return jsonify({
+            'jobs': download_service.list_jobs(client_id),
+            'usage': download_service.job_queue.client_usage(client_id),
+            'stats': download_service.job_queue.stats(),
+            'max_workers': download_service.job_queue.max_workers,
+            'postprocess_workers': download_service.job_queue.postprocess_workers,
+            'bandwidth': get_bandwidth_scheduler().allocation(),
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@api_bp.route('/jobs/<job_id>/priority', methods=['POST'])
+def set_job_priority(job_id):
+    """Change the priority of a queued job"""
+    try:
+        priority = request.form.get('priority', type=int)
+        if priority is None:
+            return jsonify({'error': 'No priority given'}), 400
+        if _priority_error(priority):
+            return _priority_error(priority)
+
+        return jsonify(download_service.set_priority(job_id, priority, _client_id()))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+    except JobStateError as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@api_bp.route('/subscriptions')
+def list_subscriptions():
+    """List the caller's subscriptions with the state of their last sync"""
+    try:
+        return jsonify({'subscriptions': download_service.list_subscriptions(_client_id())})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@api_bp.route('/subscriptions', methods=['POST'])
+def add_subscription():
+    """Mirror a playlist or channel, downloading its new videos on every sync"""
+    try:
+        url = request.form.get('url')
+        if not url:
+            return jsonify({'error': 'No playlist selected'}), 400
+        priority = request.form.get('priority', 0, type=int)
+        if _priority_error(priority):
+            return _priority_error(priority)
+
+        result = download_service.add_subscription(
+            url,
+            kind=request.form.get('type', 'video'),
+            max_height=request.form.get('max_height', type=int),
+            priority=priority,
+            interval=request.form.get('interval', current_app.config['SUBSCRIPTION_SYNC_INTERVAL'], type=float),
+            client_id=_client_id(),
+            **_audio_options(),
+        )
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@api_bp.route('/subscriptions/<subscription_id>', methods=['DELETE'])
+def remove_subscription(subscription_id):
+    """Stop mirroring a playlist or channel"""
+    try:
+        return jsonify(download_service.remove_subscription(subscription_id, _client_id()))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@api_bp.route('/subscriptions/<subscription_id>/sync', methods=['POST'])
+def sync_subscription(subscription_id):
+    """Sync a subscription now instead of at its next interval"""
+    try:
+        return jsonify(download_service.request_subscription_sync(subscription_id, _client_id()))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@api_bp.route('/library')
+def library():
+    """List downloaded files with full-text search, sorting and cursor pagination"""
+    try:
+        kind = request.args.get('type')
+        if kind and kind not in ('video', 'audio'):
+            return jsonify({'error': "Type must be 'video' or 'audio'"}), 400
+        limit = min(max(request.args.get('limit', 50, type=int), 1),
+                    current_app.config['MAX_LIBRARY_PAGE'])
+
+        result = file_service.list_library(
+            search=request.args.get('q'),
+            kind=kind,
+            sort=request.args.get('sort', 'date'),
+            descending=request.args.get('order', 'desc') != 'asc',
+            limit=limit,
+            cursor=request.args.get('cursor'),
+        )
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @api_bp.route('/open_location/<path:filename>')
 def open_location(filename):
     """Open file location"""
@@ -1,5 +1,7 @@
-from flask import Blueprint, render_template, request
+from flask import Blueprint, Response, render_template, request
 from app.routes import download_service
+from app.utils.validators import is_valid_youtube_playlist_url, is_valid_youtube_url
+from downloaders.utils.metrics import registry
 
 main_bp = Blueprint('main', __name__)
 
@@ -9,14 +11,26 @@ def index():
     """Main page route"""
     url = request.form.get('url') or ''
     video_info = None
+    playlist_info = None
     error = None
 
     if request.method == 'POST':
         url = request.form.get('url')
         if url:
             try:
-                video_info = download_service.get_video_info(url)
+                if not is_valid_youtube_url(url) and is_valid_youtube_playlist_url(url):
+                    playlist_info = download_service.get_playlist_info(url)
+                else:
+                    # Formats are fetched by the page from /api/video once extracted
+                    video_info = download_service.get_video_preview(url)
             except Exception as e:
                 error = str(e)
 
-    return render_template('index.html', url=url, video_info=video_info, error=error)
+    return render_template('index.html', url=url, video_info=video_info,
+                           playlist_info=playlist_info, error=error)
+
+
+@main_bp.route('/metrics')
+def metrics():
+    """Prometheus metrics of the download pipeline"""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
@@ -1,28 +1,74 @@
 import threading
-from typing import Dict, Optional
+import time
+from typing import Dict, Iterator, List, Optional
 from downloaders.utils import raise_on_error
-from downloaders.utils.file_utils import prepare_output_template
+from downloaders.extraction import ExtractionEngine
+from downloaders.utils.info_cache import get_info_cache
+from downloaders.utils.library import get_library
+from downloaders.utils.metrics import register_gauge
 from downloaders.youtube import YouTubeDownloader
-from app.utils.validators import is_valid_youtube_url
-import os
+from app.config import Config
+from app.services.job_journal import JobJournal
+from app.services.job_queue import DownloadBatch, DownloadJob, JobQueue, is_visible, summarize_batch
+from app.services.scheduler import JobScheduler
+from app.services.subscriptions import SubscriptionScheduler, SubscriptionStore
+from app.utils.validators import extract_video_id, is_valid_youtube_playlist_url, is_valid_youtube_url
 
 
 class DownloadService:
     """Service for managing download operations"""
 
-    def __init__(self):
-        self.current_downloader: Optional[YouTubeDownloader] = None
-        self.download_thread_obj: Optional[threading.Thread] = None
-        self.file_path: Optional[str] = None
+    def __init__(self, max_workers: int = Config.MAX_DOWNLOAD_THREADS,
+                 extraction_workers: Optional[int] = Config.EXTRACTION_WORKERS,
+                 postprocess_workers: int = Config.POSTPROCESS_WORKERS):
+        self.journal = JobJournal(retention=Config.JOB_JOURNAL_RETENTION)
+        self.job_queue = JobQueue(max_workers, postprocess_workers,
+                                  postprocess_nice=Config.POSTPROCESS_NICE or None,
+                                  ffmpeg_threads=Config.FFMPEG_THREADS or None,
+                                  journal=self.journal,
+                                  max_client_jobs=Config.CLIENT_MAX_RUNNING_JOBS,
+                                  max_client_queued_bytes=Config.CLIENT_MAX_QUEUED_BYTES,
+                                  scheduler=JobScheduler(
+                                      max_workers, Config.CLIENT_MAX_RUNNING_JOBS,
+                                      fast_lane_slots=Config.FAST_LANE_SLOTS,
+                                      fast_lane_max_bytes=Config.FAST_LANE_MAX_BYTES,
+                                      aging=Config.PRIORITY_AGING,
+                                      sjf_bytes_per_second=Config.SJF_BYTES_PER_SECOND),
+                                  retention=Config.JOB_MEMORY_RETENTION)
+        self.extraction_engine = ExtractionEngine(extraction_workers)
+        self.subscriptions = SubscriptionStore()
+        self.subscription_scheduler = SubscriptionScheduler(
+            self.subscriptions, self.sync_subscription, Config.SUBSCRIPTION_SYNC_WORKERS)
+        self.sync_interval = Config.PROGRESS_SYNC_INTERVAL
+        self._synced_versions: Dict[str, int] = {}
+        self._sync_stop = threading.Event()
+        self._sync_thread: Optional[threading.Thread] = None
+
+        register_gauge('ytdl_active_jobs', 'Jobs extracting, downloading or post-processing',
+                       lambda: self._count_jobs('extracting', 'downloading', 'processing'))
+        register_gauge('ytdl_queued_jobs', 'Jobs waiting for a download slot',
+                       lambda: self._count_jobs('queued'))
+        register_gauge('ytdl_download_bytes_per_second', 'Combined speed of all running downloads',
+                       self._total_speed)
+
+    def _count_jobs(self, *statuses: str) -> int:
+        """Count the jobs in any of the given statuses"""
+        return sum(1 for job in self.job_queue.list() if job.status in statuses)
+
+    def _total_speed(self) -> float:
+        """Get the combined smoothed speed of all downloading jobs in bytes/s"""
+        return sum(job.downloader.progress_hook.snapshot().speed
+                   for job in self.job_queue.list() if job.status == 'downloading')
 
     @raise_on_error()
     def create_downloader(self, url: str) -> YouTubeDownloader:
-        """Create a new downloader instance"""
+        """Create a new downloader instance.
+        Every request gets its own, so concurrent clients never share state;
+        the info cache keeps repeated lookups of a video cheap."""
         if not is_valid_youtube_url(url):
             raise ValueError("Invalid YouTube URL")
 
-        self.current_downloader = YouTubeDownloader(url)
-        return self.current_downloader
+        return YouTubeDownloader(url, self.extraction_engine.extract_info)
 
     @raise_on_error()
     def get_video_info(self, url: str) -> Dict:
@@ -33,71 +79,415 @@ class DownloadService:
         except Exception as e:
             raise Exception(f"Could not fetch video information: {str(e)}")
 
-    @raise_on_error()
-    def start_download(self, url: str, format_id: str) -> Dict:
-        """Start a download with the specified format"""
-        if not self.current_downloader:
-            self.create_downloader(url)
+    def get_video_preview(self, url: str) -> Dict:
+        """Get what can be shown of a video without waiting for extraction.
+        From the info cache this is the full video info; otherwise only the
+        thumbnail is known (from the video ID), and the title and formats are
+        left None while the extraction starts in the background."""
+        if not is_valid_youtube_url(url):
+            raise ValueError("Invalid YouTube URL")
+
+        cached = get_info_cache().get(url)
+        if cached is not None:
+            downloader = YouTubeDownloader(url)
+            downloader.info = cached
+            return downloader.get_video_info()
+
+        # The format request of the page picks up this extraction
+        self.extraction_engine.submit(url)
+        return {
+            'title': None,
+            'duration': '',
+            'thumbnail': f'https://i.ytimg.com/vi/{extract_video_id(url)}/hqdefault.jpg',
+            'formats': None,
+            'audio_formats': None,
+        }
+
+    def get_video_infos(self, urls: List[str]) -> Iterator[Dict]:
+        """Get video information for many URLs, yielding each as soon as it is ready"""
+        valid_urls = []
+        for url in dict.fromkeys(urls):
+            if is_valid_youtube_url(url):
+                valid_urls.append(url)
+            else:
+                yield {'url': url, 'error': 'Invalid YouTube URL'}
+
+        for url, result in self.extraction_engine.extract_many(valid_urls):
+            if isinstance(result, Exception):
+                yield {'url': url, 'error': f"Could not fetch video information: {str(result)}"}
+                continue
+
+            downloader = YouTubeDownloader(url)
+            downloader.info = result
+            yield {'url': url, 'id': result.get('id'), 'info': downloader.get_video_info()}
+
+    def start_download(self, url: str, format_id: str, passthrough: bool = Config.AUDIO_PASSTHROUGH,
+                       weight: float = 1.0, client_id: Optional[str] = None, priority: int = 0) -> Dict:
+        """Queue a download with the specified format.
+        With passthrough, audio keeps its original codec instead of becoming MP3.
+        The weight sets its share of the bandwidth relative to other downloads,
+        the priority its place among the client's queued jobs.
+        :raises QuotaExceededError: If the client has too many bytes queued already."""
+        job = self.create_job(url, format_id, passthrough, weight, client_id, priority)
+        self.job_queue.submit(job)
+
+        return {'status': 'started', 'job_id': job.job_id, 'filename': job.file_path}
 
-        # Find the format object
-        format_obj = self._find_format(format_id)
+    @raise_on_error()
+    def create_job(self, url: str, format_id: str, passthrough: bool = Config.AUDIO_PASSTHROUGH,
+                   weight: float = 1.0, client_id: Optional[str] = None,
+                   priority: int = 0) -> DownloadJob:
+        """Create the job downloading a format of a video"""
+        downloader = self.create_downloader(url)
+        format_obj = downloader.format_index.get(format_id)
         if not format_obj:
             raise ValueError("Selected format not found")
 
-        format_obj.update({
-            'title': self.current_downloader.info.get('title', 'Unknown Title'),
-        })
+        job = DownloadJob(url, downloader, format_obj, passthrough=passthrough,
+                          weight=weight, client_id=client_id, priority=priority)
+        if job.is_downloaded():
+            job.mark_done()
+        return job
+
+    @raise_on_error()
+    def find_formats(self, url: str, kind: str = 'video', **constraints) -> Dict:
+        """Query the formats of a video, e.g. best video up to 1080p in mp4 under 500 MB"""
+        if kind not in ('video', 'audio'):
+            raise ValueError("Format type must be 'video' or 'audio'")
+        downloader = self.create_downloader(url)
+
+        constraints = {key: value for key,
+                       value in constraints.items() if value is not None}
+        matches = downloader.format_index.filter(kind, **constraints)
+        summarize = (downloader.summarize_video_format if kind == 'video'
+                     else downloader.summarize_audio_format)
+        return {
+            'best': summarize(matches[0]) if matches else None,
+            'formats': [summarize(fmt) for fmt in matches],
+        }
+
+    @raise_on_error()
+    def get_playlist_info(self, url: str) -> Dict:
+        """Get a flat listing of the videos in a playlist or channel"""
+        if not is_valid_youtube_playlist_url(url):
+            raise ValueError("Invalid YouTube playlist or channel URL")
+
+        try:
+            return YouTubeDownloader(url).get_playlist_info()
+        except Exception as e:
+            raise Exception(f"Could not fetch playlist information: {str(e)}")
+
+    def start_batch(self, url: str, kind: str = 'video', max_height: Optional[int] = None,
+                    passthrough: bool = Config.AUDIO_PASSTHROUGH, client_id: Optional[str] = None,
+                    priority: int = 0) -> Dict:
+        """Queue a download for every video in a playlist or channel.
+        :raises QuotaExceededError: If the client has too many bytes queued already."""
+        batch = self.job_queue.submit_batch(
+            self.create_batch(url, kind, max_height, passthrough, client_id, priority))
+
+        return {'status': 'started', 'batch_id': batch.batch_id, 'total': len(batch.jobs)}
+
+    @raise_on_error()
+    def create_batch(self, url: str, kind: str = 'video', max_height: Optional[int] = None,
+                     passthrough: bool = Config.AUDIO_PASSTHROUGH,
+                     client_id: Optional[str] = None, priority: int = 0) -> DownloadBatch:
+        """Create the jobs downloading every video in a playlist or channel"""
+        if kind not in ('video', 'audio'):
+            raise ValueError("Download type must be 'video' or 'audio'")
 
-        is_video = format_obj.get('vcodec') != 'none'
+        playlist = self.get_playlist_info(url)
+        if not playlist['entries']:
+            raise ValueError("The playlist has no videos")
 
-        # Reset progress
-        self.current_downloader.progress_hook.reset()
+        # Extraction runs per entry inside the worker pool
+        jobs = [
+            DownloadJob(entry['url'], YouTubeDownloader(entry['url'], self.extraction_engine.extract_info),
+                        selector={'kind': kind, 'max_height': max_height},
+                        title=entry['title'], passthrough=passthrough, priority=priority)
+            for entry in playlist['entries']
+        ]
+        return DownloadBatch(url, playlist['title'], jobs, client_id=client_id)
 
-        outtmpl = prepare_output_template(format_obj, is_video)
-        self.file_path = os.path.splitext(
-            outtmpl)[0] + ('.mp4' if is_video else '.mp3')
+    def add_subscription(self, url: str, kind: str = 'video', max_height: Optional[int] = None,
+                         passthrough: bool = Config.AUDIO_PASSTHROUGH, priority: int = 0,
+                         interval: float = Config.SUBSCRIPTION_SYNC_INTERVAL,
+                         client_id: Optional[str] = None) -> Dict:
+        """Mirror a playlist or channel: new videos are downloaded on every sync"""
+        if not is_valid_youtube_playlist_url(url):
+            raise ValueError("Invalid YouTube playlist or channel URL")
+        if kind not in ('video', 'audio'):
+            raise ValueError("Download type must be 'video' or 'audio'")
 
-        if not os.path.exists(self.file_path):
-            # Start download in background thread
-            def download_thread():
-                try:
-                    self.current_downloader.download(format_obj)
-                    if not self.file_path or not os.path.exists(self.file_path):
-                        raise FileNotFoundError("Downloaded file not found")
-                except Exception as e:
-                    self.current_downloader.progress_hook.set_error(str(e))
+        subscription = self.subscriptions.add(
+            url, kind, max_height, passthrough, priority,
+            max(interval, Config.SUBSCRIPTION_MIN_INTERVAL), client_id)
+        self.subscription_scheduler.wake()
+        return subscription
 
-            # Start the download thread
-            self.download_thread_obj = threading.Thread(target=download_thread)
-            self.download_thread_obj.daemon = True
-            self.download_thread_obj.start()
+    def list_subscriptions(self, client_id: Optional[str] = None) -> List[Dict]:
+        """Get the subscriptions of a client with the state of their last sync"""
+        return self.subscriptions.list(client_id)
 
-        return {'status': 'started', 'filename': self.file_path}
+    def remove_subscription(self, subscription_id: str, client_id: Optional[str] = None) -> Dict:
+        """Stop mirroring a playlist or channel"""
+        if not self.subscriptions.remove(subscription_id, client_id):
+            raise ValueError("Subscription not found")
+        return {'status': 'removed', 'subscription_id': subscription_id}
 
-    def get_progress(self) -> Dict:
-        """Get current download progress"""
-        if not self.current_downloader:
+    def request_subscription_sync(self, subscription_id: str, client_id: Optional[str] = None) -> Dict:
+        """Sync a subscription as soon as a sync worker is free"""
+        if not self.subscriptions.request_sync(subscription_id, client_id):
+            raise ValueError("Subscription not found")
+        self.subscription_scheduler.wake()
+        return {'status': 'scheduled', 'subscription_id': subscription_id}
+
+    def sync_subscription(self, subscription: Dict) -> Dict:
+        """Queue the videos of a subscription that are neither in the library
+        nor being downloaded. Only the flat listing is fetched here; videos are
+        extracted in full by their jobs, so known videos cost nothing."""
+        playlist = self.get_playlist_info(subscription['url'])
+        library = get_library()
+        pending = self.journal.unfinished_urls()
+        new_entries = [entry for entry in playlist['entries']
+                       if not library.in_archive(entry['id']) and entry['url'] not in pending]
+
+        result = {'title': playlist['title'], 'video_count': len(playlist['entries']),
+                  'new_count': len(new_entries)}
+        if new_entries:
+            kind = subscription['kind']
+            jobs = [
+                DownloadJob(entry['url'], YouTubeDownloader(entry['url'], self.extraction_engine.extract_info),
+                            selector={'kind': kind, 'max_height': subscription['max_height']},
+                            title=entry['title'], passthrough=subscription['passthrough'],
+                            priority=subscription['priority'])
+                for entry in new_entries
+            ]
+            batch = self.job_queue.submit_batch(DownloadBatch(
+                subscription['url'], playlist['title'], jobs, client_id=subscription['client_id']))
+            result['batch_id'] = batch.batch_id
+            print(f"[Subscriptions] Queued {len(jobs)} new video(s) from {playlist['title']}")
+        return result
+
+    def start_subscriptions(self):
+        """Sync subscriptions in the background as they become due"""
+        self.subscription_scheduler.start()
+
+    def resume_jobs(self, stale_after: float = Config.JOB_STALE_AFTER) -> int:
+        """Queue the unfinished jobs no running process owns: those of the last
+        run, and those of processes silent for `stale_after` seconds.
+        Interrupted downloads continue from their partial files in the temp folder.
+        :return: The number of resumed jobs."""
+        self.journal.prune()
+        batches: Dict[str, Dict] = {}
+        rows = self.journal.claim_unfinished(stale_after)
+        for row in rows:
+            selector = dict(row['selector'])
+            if row['format_id']:
+                selector['format_id'] = row['format_id']
+
+            job = DownloadJob(row['url'], YouTubeDownloader(row['url'], self.extraction_engine.extract_info),
+                              selector=selector, title=row['title'] or 'Unknown Title',
+                              passthrough=row['passthrough'], weight=row['weight'],
+                              job_id=row['job_id'], client_id=row['client_id'],
+                              priority=row['priority'] or 0)
+            job.created_at = row['created_at']
+
+            if row['batch_id'] and row['batch_url']:
+                batch = batches.setdefault(row['batch_id'], {
+                    'url': row['batch_url'], 'title': row['batch_title'], 'jobs': []})
+                batch['jobs'].append(job)
+            else:
+                self.job_queue.submit(job, check_quota=False)
+
+        for batch_id, batch in batches.items():
+            self.job_queue.submit_batch(DownloadBatch(
+                batch['url'], batch['title'], batch['jobs'], batch_id=batch_id,
+                client_id=batch['jobs'][0].client_id), check_quota=False)
+
+        return len(rows)
+
+    def sync_progress(self):
+        """Publish the progress of jobs that changed since the last sync to the journal"""
+        changed = []
+        for job in self.job_queue.list():
+            if job.status in ('done', 'error'):
+                # Finishing journals the final progress already
+                self._synced_versions.pop(job.job_id, None)
+                continue
+            version = job.downloader.progress_hook.version
+            if self._synced_versions.get(job.job_id) != version:
+                self._synced_versions[job.job_id] = version
+                changed.append(job)
+        self.journal.sync(changed)
+
+    def start_sync(self, interval: float = Config.PROGRESS_SYNC_INTERVAL,
+                   stale_after: float = Config.JOB_STALE_AFTER):
+        """Keep the journal up to date in the background, so other processes
+        sharing the data folder can report on our jobs, and take over the jobs
+        of processes that stopped without handing theirs back"""
+        if self._sync_thread is not None:
+            return
+        self.sync_interval = interval
+        self._sync_stop.clear()
+        self._sync_thread = threading.Thread(
+            target=self._sync_loop, args=(interval, stale_after), name='job-sync', daemon=True)
+        self._sync_thread.start()
+
+    def _sync_loop(self, interval: float, stale_after: float):
+        """Sync progress every `interval` seconds and look for orphaned jobs every `stale_after`"""
+        next_claim = time.monotonic() + stale_after
+        while not self._sync_stop.wait(interval):
+            try:
+                self.sync_progress()
+                if time.monotonic() >= next_claim:
+                    next_claim = time.monotonic() + stale_after
+                    adopted = self.resume_jobs(stale_after)
+                    if adopted:
+                        print(f"[Journal] Took over {adopted} job(s) of a stopped process")
+                    # Old finished jobs are served from the journal from now on
+                    for job_id in self.job_queue.prune():
+                        self._synced_versions.pop(job_id, None)
+            except Exception as e:
+                print(f"[Journal] Could not sync jobs: {e}")
+
+    def shutdown(self, timeout: float = Config.SHUTDOWN_TIMEOUT) -> int:
+        """Stop gracefully: running jobs get `timeout` seconds to finish, the
+        rest are interrupted and handed back to the journal for the next process.
+        :return: The number of jobs left unfinished."""
+        self.subscription_scheduler.shutdown()
+        self._sync_stop.set()
+        if self._sync_thread is not None:
+            self._sync_thread.join()
+            self._sync_thread = None
+
+        unfinished = self.job_queue.drain(timeout)
+        try:
+            self.sync_progress()
+            self.journal.release(job.job_id for job in unfinished)
+        except Exception as e:
+            print(f"[Journal] Could not release jobs: {e}")
+        self.extraction_engine.shutdown(wait=False)
+        return len(unfinished)
+
+    def set_priority(self, job_id: str, priority: int, client_id: Optional[str] = None) -> Dict:
+        """Move a queued job ahead of or behind the client's other queued jobs.
+        :raises ValueError: If the job doesn't exist.
+        :raises JobStateError: If the job has left the queue."""
+        job = self.job_queue.set_priority(job_id, priority, client_id)
+        return {'job_id': job.job_id, 'priority': job.priority, 'status': job.status}
+
+    def get_batch_progress(self, batch_id: str, client_id: Optional[str] = None) -> Dict:
+        """Get the overall and per-entry progress of a batch"""
+        batch = self.job_queue.get_batch(batch_id, client_id)
+        if batch:
+            return batch.get_progress()
+
+        # Batches pruned from memory or run by another process
+        row = self.journal.get_batch(batch_id)
+        if not row or not row['jobs'] or not is_visible(row['jobs'][0]['client_id'], client_id):
+            raise ValueError("Batch not found")
+        return summarize_batch(batch_id, row['url'], row['title'],
+                               [self._journal_job(job) for job in row['jobs']])
+
+    def get_progress(self, job_id: Optional[str] = None, client_id: Optional[str] = None) -> Dict:
+        """Get download progress for a job (defaults to the client's latest one)"""
+        job = self.job_queue.get(
+            job_id, client_id) if job_id else self.job_queue.latest(client_id)
+        if not job:
+            if job_id:
+                return self._journal_progress(job_id, client_id)
             return {'status': 'not_started'}
 
-        progress = self.current_downloader.progress_hook.progress.copy()
+        return job.get_progress()
 
-        # Update status if thread is not alive
-        if not self.download_thread_obj.is_alive():
-            # if progress['status'] == 'downloading':
-            progress['filename'] = self.file_path
-            progress['status'] = 'done'
+    def _journal_progress(self, job_id: str, client_id: Optional[str] = None) -> Dict:
+        """Get the progress of a job run by another process from the journal"""
+        row = self.journal.get(job_id)
+        if not row or not is_visible(row['client_id'], client_id):
+            raise ValueError("Job not found")
 
-        return progress
+        return self._row_progress(row)
 
-    @raise_on_error()
-    def _find_format(self, format_id: str) -> Optional[Dict]:
-        """Find format object by format ID"""
-        if not self.current_downloader:
-            raise ValueError("No downloader instance available")
+    @staticmethod
+    def _row_progress(row: Dict) -> Dict:
+        """Get the progress a journaled job last published"""
+        return row['progress'] or {
+            'job_id': row['job_id'], 'status': row['stage'], 'filename': row['file_path'],
+            **({'error': row['error']} if row['error'] else {}),
+        }
+
+    def watch_progress(self, job_id: Optional[str] = None, coalesce: float = 0.25,
+                       heartbeat: float = 15.0, client_id: Optional[str] = None) -> Iterator[Optional[Dict]]:
+        """Yield job progress each time it changes, and None as a heartbeat
+        when nothing changed for `heartbeat` seconds. Stops once the job ends."""
+        job = self.job_queue.get(
+            job_id, client_id) if job_id else self.job_queue.latest(client_id)
+        if not job:
+            if not job_id:
+                raise ValueError("Job not found")
+            yield from self._poll_progress(job_id, heartbeat, client_id)
+            return
+
+        hook = job.downloader.progress_hook
+        version = hook.version
+        progress = job.get_progress()
+        yield progress
+
+        while progress['status'] not in ('done', 'error'):
+            if not hook.wait_for_change(version, heartbeat):
+                yield None
+                continue
+
+            # Coalesce bursts of chunk updates into a single event
+            time.sleep(coalesce)
+            version = hook.version
+            progress = job.get_progress()
+            yield progress
+
+    def _poll_progress(self, job_id: str, heartbeat: float,
+                       client_id: Optional[str] = None) -> Iterator[Optional[Dict]]:
+        """Follow a job run by another process through the progress it publishes"""
+        progress = self._journal_progress(job_id, client_id)
+        yield progress
+
+        quiet = 0.0
+        while progress['status'] not in ('done', 'error'):
+            time.sleep(self.sync_interval)
+            latest = self._journal_progress(job_id, client_id)
+            if latest != progress:
+                progress, quiet = latest, 0.0
+                yield progress
+            else:
+                quiet += self.sync_interval
+                if quiet >= heartbeat:
+                    quiet = 0.0
+                    yield None
 
-        # Search in video formats
-        for fmt in self.current_downloader.info.get('formats', []):
-            if fmt.get('format_id') == format_id:
-                return fmt
+    def list_jobs(self, client_id: Optional[str] = None) -> List[Dict]:
+        """Get a summary of the jobs a client may see (all without a client),
+        including up to JOB_HISTORY_LIMIT finished ones only the journal still has"""
+        jobs = [job.to_dict() for job in self.job_queue.list(client_id)]
+        known = {job['job_id'] for job in jobs}
+        history = [self._journal_job(row)
+                   for row in self.journal.list_finished(client_id, Config.JOB_HISTORY_LIMIT)
+                   if row['job_id'] not in known]
+        return sorted(history, key=lambda job: job['created_at']) + jobs
 
-        return None
+    def _journal_job(self, row: Dict) -> Dict:
+        """Summarize a journaled job the way DownloadJob.to_dict() does"""
+        return {
+            **self._row_progress(row),
+            'url': row['url'],
+            'title': row['title'],
+            'format_id': row['format_id'],
+            'type': row['kind'] or row['selector'].get('kind', 'video'),
+            'batch_id': row['batch_id'],
+            'pipeline': None,
+            'weight': row['weight'],
+            'priority': row['priority'] or 0,
+            'expected_bytes': None,
+            'bandwidth': None,
+            'created_at': row['created_at'],
+            'started_at': None,
+            'finished_at': row['updated_at'] if row['stage'] in ('done', 'error') else None,
+        }
@@ -1,5 +1,8 @@
 import os
+from typing import Optional
+from downloaders.utils.library import get_library
 from downloaders.utils.platform_utils import open_file, open_file_location
+from app.utils.formatters import format_size
 
 
 class FileService:
@@ -59,3 +62,17 @@ class FileService:
             }
         except Exception as e:
             return {'error': str(e)}
+
+    @staticmethod
+    def list_library(search: Optional[str] = None, kind: Optional[str] = None, sort: str = 'date',
+                     descending: bool = True, limit: int = 50, cursor: Optional[str] = None) -> dict:
+        """Get one page of downloaded files. The index is kept current by the
+        downloads themselves, and synced with the folders at most every
+        LIBRARY_REFRESH_INTERVAL seconds for changes made outside the app."""
+        library = get_library()
+        library.refresh_if_stale()
+        page = library.query(search=search, kind=kind, sort=sort,
+                             descending=descending, limit=limit, cursor=cursor)
+        for item in page['items']:
+            item['filesize'] = format_size(item['size'])
+        return page
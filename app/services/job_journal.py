@@ -0,0 +1,239 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Set
+
+from downloaders.utils.file_utils import get_downloader_paths
+
+
+# Stages a job can be left in when the app stops before it finishes
+UNFINISHED_STAGES = ('queued', 'extracting', 'downloading', 'processing')
+
+# Columns added after the first release, created on older databases
+MIGRATED_COLUMNS = (('progress', 'TEXT'), ('owner', 'TEXT'), ('heartbeat_at', 'REAL'),
+                    ('client_id', 'TEXT'), ('priority', 'INTEGER'), ('kind', 'TEXT'))
+
+# Stages of a job that has ended
+FINISHED_STAGES = ('done', 'error')
+
+
+class JobJournal:
+    """Write-ahead journal of download jobs (SQLite in WAL mode), so jobs
+    interrupted by a restart or crash can be resumed.
+
+    It is also the job store shared by every process using the same data
+    folder: each row names the process that owns the job and carries its last
+    published progress, so any process can report on any job."""
+
+    def __init__(self, db_path: Optional[str] = None, retention: int = 7 * 24 * 60 * 60):
+        self.db_path = db_path or os.path.join(
+            get_downloader_paths()['data'], 'jobs.sqlite3')
+        self.retention = retention
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Lazy initialization of the SQLite connection"""
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._connection = sqlite3.connect(
+                self.db_path, check_same_thread=False)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    format_id TEXT,
+                    selector TEXT NOT NULL,
+                    passthrough INTEGER NOT NULL,
+                    weight REAL NOT NULL,
+                    title TEXT,
+                    batch_id TEXT,
+                    file_path TEXT,
+                    stage TEXT NOT NULL,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )''')
+            columns = {row[1] for row in self._connection.execute('PRAGMA table_info(jobs)')}
+            for column, kind in MIGRATED_COLUMNS:
+                if column not in columns:
+                    try:
+                        self._connection.execute(f'ALTER TABLE jobs ADD COLUMN {column} {kind}')
+                    except sqlite3.OperationalError as e:
+                        # Another process may have added it first
+                        if 'duplicate column' not in str(e):
+                            raise
+            self._connection.execute(
+                'CREATE INDEX IF NOT EXISTS jobs_stage ON jobs (stage)')
+            self._connection.execute('''
+                CREATE TABLE IF NOT EXISTS batches (
+                    batch_id TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    title TEXT,
+                    created_at REAL NOT NULL
+                )''')
+            self._connection.commit()
+        return self._connection
+
+    def record(self, job) -> None:
+        """Write the current state of a job"""
+        format_id = job.format_obj.get('format_id') if job.format_obj else None
+        now = time.time()
+        with self._lock:
+            self.connection.execute('''
+                INSERT INTO jobs (job_id, url, format_id, selector, passthrough, weight, title,
+                                  batch_id, file_path, stage, error, created_at, updated_at,
+                                  progress, owner, heartbeat_at, client_id, priority, kind)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (job_id) DO UPDATE SET
+                    format_id = excluded.format_id, title = excluded.title,
+                    batch_id = excluded.batch_id, file_path = excluded.file_path,
+                    stage = excluded.stage, error = excluded.error,
+                    updated_at = excluded.updated_at, progress = excluded.progress,
+                    owner = excluded.owner, heartbeat_at = excluded.heartbeat_at,
+                    client_id = excluded.client_id, priority = excluded.priority,
+                    kind = excluded.kind''',
+                (job.job_id, job.url, format_id, json.dumps(job.selector), int(job.passthrough),
+                 job.weight, job.title, job.batch_id, job.file_path, job.status, job.error,
+                 job.created_at, now, json.dumps(job.get_progress()), self.owner, now, job.client_id,
+                 job.priority, 'video' if job.is_video else 'audio'))
+            self.connection.commit()
+
+    def sync(self, jobs: Iterable) -> None:
+        """Publish the progress of the given jobs and renew the heartbeat of
+        every unfinished job this process owns"""
+        now = time.time()
+        placeholders = ', '.join('?' * len(UNFINISHED_STAGES))
+        updates = [(json.dumps(job.get_progress()), job.job_id, self.owner) for job in jobs]
+        with self._lock:
+            self.connection.executemany(
+                'UPDATE jobs SET progress = ? WHERE job_id = ? AND owner = ?', updates)
+            self.connection.execute(
+                f'UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND stage IN ({placeholders})',
+                (now, self.owner, *UNFINISHED_STAGES))
+            self.connection.commit()
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Get the journaled state of a job, whichever process runs it"""
+        with self._lock:
+            cursor = self.connection.execute(
+                'SELECT job_id, client_id, stage, error, file_path, progress, owner, heartbeat_at '
+                'FROM jobs WHERE job_id = ?', (job_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            row = dict(zip([column[0] for column in cursor.description], row))
+
+        row['progress'] = json.loads(row['progress']) if row['progress'] else None
+        return row
+
+    def list_finished(self, client_id: Optional[str] = None, limit: int = 100) -> List[Dict]:
+        """Get the most recently finished jobs a client may see (all without a
+        client), by any process, newest first"""
+        placeholders = ', '.join('?' * len(FINISHED_STAGES))
+        visible = '' if client_id is None else 'AND (client_id IS NULL OR client_id = ?)'
+        with self._lock:
+            cursor = self.connection.execute(
+                f'SELECT * FROM jobs WHERE stage IN ({placeholders}) {visible} '
+                f'ORDER BY updated_at DESC LIMIT ?',
+                (*FINISHED_STAGES, *([] if client_id is None else [client_id]), limit))
+            return self._to_dicts(cursor)
+
+    def get_batch(self, batch_id: str) -> Optional[Dict]:
+        """Get a journaled batch with its jobs, whichever process ran them"""
+        with self._lock:
+            batch = self.connection.execute(
+                'SELECT batch_id, url, title, created_at FROM batches WHERE batch_id = ?',
+                (batch_id,)).fetchone()
+            if batch is None:
+                return None
+            cursor = self.connection.execute(
+                'SELECT * FROM jobs WHERE batch_id = ? ORDER BY created_at', (batch_id,))
+            jobs = self._to_dicts(cursor)
+        return {**dict(zip(('batch_id', 'url', 'title', 'created_at'), batch)), 'jobs': jobs}
+
+    @staticmethod
+    def _to_dicts(cursor: sqlite3.Cursor) -> List[Dict]:
+        """Read job rows, decoding their JSON columns"""
+        columns = [column[0] for column in cursor.description]
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        for row in rows:
+            row['selector'] = json.loads(row['selector'])
+            row['passthrough'] = bool(row['passthrough'])
+            row['progress'] = json.loads(row['progress']) if row['progress'] else None
+        return rows
+
+    def release(self, job_ids: Iterable[str]) -> None:
+        """Give up unfinished jobs so the next process to look claims them at once"""
+        with self._lock:
+            self.connection.executemany(
+                'UPDATE jobs SET owner = NULL WHERE job_id = ? AND owner = ?',
+                [(job_id, self.owner) for job_id in job_ids])
+            self.connection.commit()
+
+    def record_batch(self, batch) -> None:
+        """Write a batch so its jobs can be grouped again after a restart"""
+        with self._lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO batches (batch_id, url, title, created_at) VALUES (?, ?, ?, ?)',
+                (batch.batch_id, batch.url, batch.title, batch.created_at))
+            self.connection.commit()
+
+    def claim_unfinished(self, stale_after: float) -> List[Dict]:
+        """Take over the unfinished jobs no running process owns, oldest first:
+        those released on shutdown and those whose owner has not renewed its
+        heartbeat for `stale_after` seconds (it crashed or was killed)"""
+        placeholders = ', '.join('?' * len(UNFINISHED_STAGES))
+        now = time.time()
+        with self._lock:
+            connection = self.connection
+            # Take the write lock first, so two processes can't claim the same job
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                cursor = connection.execute(f'''
+                    SELECT jobs.*, batches.url AS batch_url, batches.title AS batch_title
+                    FROM jobs LEFT JOIN batches USING (batch_id)
+                    WHERE stage IN ({placeholders}) AND owner IS NOT ?
+                      AND (owner IS NULL OR COALESCE(heartbeat_at, updated_at) < ?)
+                    ORDER BY created_at''', (*UNFINISHED_STAGES, self.owner, now - stale_after))
+                columns = [column[0] for column in cursor.description]
+                rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+                connection.executemany(
+                    'UPDATE jobs SET owner = ?, heartbeat_at = ? WHERE job_id = ?',
+                    [(self.owner, now, row['job_id']) for row in rows])
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+
+        for row in rows:
+            row['selector'] = json.loads(row['selector'])
+            row['passthrough'] = bool(row['passthrough'])
+        return rows
+
+    def unfinished_urls(self) -> Set[str]:
+        """Get the URLs of the jobs any process still has to finish"""
+        placeholders = ', '.join('?' * len(UNFINISHED_STAGES))
+        with self._lock:
+            rows = self.connection.execute(
+                f'SELECT DISTINCT url FROM jobs WHERE stage IN ({placeholders})', UNFINISHED_STAGES)
+            return {row[0] for row in rows}
+
+    def prune(self) -> None:
+        """Forget finished jobs older than the retention period"""
+        placeholders = ', '.join('?' * len(UNFINISHED_STAGES))
+        with self._lock:
+            self.connection.execute(
+                f'DELETE FROM jobs WHERE stage NOT IN ({placeholders}) AND updated_at < ?',
+                (*UNFINISHED_STAGES, time.time() - self.retention))
+            self.connection.execute(
+                'DELETE FROM batches WHERE batch_id NOT IN (SELECT batch_id FROM jobs WHERE batch_id IS NOT NULL)')
+            self.connection.commit()
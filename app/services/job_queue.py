@@ -0,0 +1,543 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from app.services.job_journal import FINISHED_STAGES, UNFINISHED_STAGES, JobJournal
+from app.services.scheduler import JobScheduler
+from app.utils.formatters import format_size
+from downloaders.bandwidth import get_bandwidth_scheduler
+from downloaders.formats import get_filesize
+from downloaders.utils.library import get_library
+from downloaders.utils.metrics import JOBS_FAILED, JOBS_FINISHED, JOBS_STARTED
+from downloaders.youtube import YouTubeDownloader
+
+
+# Stages in which a job still has bytes to download
+PENDING_STAGES = ('queued', 'extracting', 'downloading')
+
+
+class QuotaExceededError(Exception):
+    """A client asked for more than its share of the download queue"""
+
+
+class JobStateError(Exception):
+    """A job is past the stage an operation applies to"""
+
+
+def summarize_batch(batch_id: str, url: str, title: Optional[str], entries: List[Dict]) -> Dict:
+    """Get the overall progress of a batch from the summaries of its jobs"""
+    counts: Dict[str, int] = {}
+    percent_total = 0.0
+    for entry in entries:
+        counts[entry['status']] = counts.get(entry['status'], 0) + 1
+        if entry['status'] in FINISHED_STAGES:
+            percent_total += 100
+        else:
+            percent_total += float(str(entry.get('percentage') or '0').rstrip('%') or 0)
+
+    finished = counts.get('done', 0) + counts.get('error', 0)
+    percentage = percent_total / len(entries) if entries else 100.0
+
+    return {
+        'batch_id': batch_id,
+        'url': url,
+        'title': title,
+        'status': 'done' if finished == len(entries) else 'downloading',
+        'percentage': "{:.2f}%".format(percentage),
+        'total': len(entries),
+        'completed': counts.get('done', 0),
+        'failed': counts.get('error', 0),
+        'counts': counts,
+        'entries': entries,
+    }
+
+
+def is_visible(job_client_id: Optional[str], client_id: Optional[str]) -> bool:
+    """Check if a client may see a job: its own, or one created without a
+    client (e.g. by a script). No client ID means no restriction."""
+    return client_id is None or job_client_id is None or job_client_id == client_id
+
+
+class DownloadJob:
+    """A single download request tracked by the job queue"""
+
+    def __init__(self, url: str, downloader: YouTubeDownloader, format_obj: Optional[Dict] = None,
+                 selector: Optional[Dict] = None, title: str = 'Unknown Title',
+                 batch_id: Optional[str] = None, passthrough: bool = False, weight: float = 1.0,
+                 job_id: Optional[str] = None, client_id: Optional[str] = None, priority: int = 0):
+        self.job_id = job_id or uuid.uuid4().hex[:12]
+        self.client_id = client_id  # Session or API key namespace the job belongs to
+        self.priority = priority  # Higher runs first among the client's queued jobs
+        self.url = url
+        self.downloader = downloader
+        self.selector = selector or {}
+        self.title = title
+        self.batch_id = batch_id
+        self.passthrough = passthrough
+        self.weight = weight  # Share of the bandwidth relative to other jobs
+        self.format_obj: Optional[Dict] = None
+        self.file_path: Optional[str] = None
+        self.expected_bytes = 0  # Estimated download size, 0 until known
+        self.pipeline: Optional[Dict] = None
+        self.fetched: Optional[Dict] = None
+        self.is_video = self.selector.get('kind', 'video') == 'video'
+        self.status = 'queued'
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.interrupted = False
+        self.journal: Optional[JobJournal] = None
+
+        if format_obj:
+            self._set_format(format_obj)
+
+    def _set_format(self, format_obj: Dict):
+        """Set the format to download and derive the output path from it"""
+        format_obj = dict(format_obj)
+        format_obj.update({
+            'title': self.downloader.info.get('title', 'Unknown Title'),
+        })
+
+        self.format_obj = format_obj
+        self.title = format_obj['title']
+        self.is_video = format_obj.get('vcodec') != 'none'
+
+        self.file_path = self.downloader.get_output_path(
+            format_obj, self.passthrough)
+
+        # Video-only formats get the best audio merged in
+        self.expected_bytes = get_filesize(format_obj)
+        if self.is_video and format_obj.get('acodec', 'none') == 'none':
+            audio = self.downloader.format_index.merge_audio()
+            self.expected_bytes += get_filesize(audio) if audio else 0
+
+    def resolve(self):
+        """Extract the video info and pick a format if none was given"""
+        if self.format_obj:
+            return
+
+        self._set_status('extracting')
+        if self.selector.get('format_id'):
+            # Jobs resumed from the journal already know their exact format
+            format_obj = self.downloader.format_index.get(self.selector['format_id'])
+        else:
+            format_obj = self.downloader.select_format(**self.selector)
+        if not format_obj:
+            raise ValueError("No matching format found")
+        self._set_format(format_obj)
+
+    def run(self):
+        """Run the whole download in the calling worker thread"""
+        if self.fetch():
+            self.postprocess()
+
+    def fetch(self) -> bool:
+        """Run the network stage of the download.
+        :return: True if the job still needs post-processing."""
+        self.started_at = time.time()
+        JOBS_STARTED.inc()
+        try:
+            self.resolve()
+            if self.is_downloaded():
+                self._add_to_library()
+                self._set_status('done')
+                return False
+
+            self._set_status('downloading')
+            self.downloader.bandwidth_lease = get_bandwidth_scheduler().register(
+                self.job_id, self.weight)
+            self.fetched = self.downloader.fetch(self.format_obj, self.passthrough)
+            self.pipeline = self.downloader.pipeline
+            self._set_status('processing')
+            return True
+        except Exception as e:
+            if self.interrupted:
+                # Stopped by a shutdown: queued again for the next run
+                self._set_status('queued')
+            else:
+                self._fail(e)
+            return False
+        finally:
+            if self.downloader.bandwidth_lease is not None:
+                get_bandwidth_scheduler().unregister(self.job_id)
+                self.downloader.bandwidth_lease = None
+
+    def postprocess(self, threads: Optional[int] = None, nice: Optional[int] = None):
+        """Run the CPU stage of the download: merge, encode and tag the file"""
+        try:
+            self.downloader.postprocess(self.fetched, threads, nice)
+            if not self.file_path or not os.path.exists(self.file_path):
+                raise FileNotFoundError("Downloaded file not found")
+            self._add_to_library()
+            self._set_status('done')
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self.fetched = None
+
+    def requeue(self):
+        """Leave a fetched job for the next run instead of post-processing it.
+        The raw streams stay in the temp folder under the same names, so
+        yt-dlp finds them already downloaded when the job is resumed."""
+        self.fetched = None
+        self._set_status('queued')
+
+    def interrupt(self):
+        """Stop the download at its next block and leave the job queued"""
+        self.interrupted = True
+        self.downloader.cancelled = True
+
+    def _fail(self, error: Exception):
+        """Mark the job as failed"""
+        self.error = str(error)
+        self.downloader.progress_hook.set_error(self.error)
+        self._set_status('error')
+
+    def is_downloaded(self) -> bool:
+        """Check if the library already has this video in this format at file_path"""
+        return self.downloader.get_downloaded_path(self.format_obj, self.passthrough) == self.file_path
+
+    def mark_done(self):
+        """Mark the job as finished without downloading (file already exists)"""
+        self.started_at = time.time()
+        JOBS_STARTED.inc()
+        self._add_to_library()
+        self._set_status('done')
+
+    def _add_to_library(self):
+        """Record the finished file in the library index"""
+        info = self.downloader.info
+        metadata = self.downloader.get_metadata()
+        try:
+            get_library().add(
+                self.file_path, info.get('id'), self.format_obj.get('format_id'),
+                extractor=(info.get('extractor_key') or 'youtube').lower(),
+                title=self.title, artist=metadata['artist'], album=metadata['album'])
+        except Exception as e:
+            print(f"[Library] Could not index {self.file_path}: {e}")
+
+    def _set_status(self, status: str):
+        """Change the job status, journal it and wake up progress watchers"""
+        self.status = status
+        if status in ('done', 'error'):
+            self.finished_at = time.time()
+            (JOBS_FINISHED if status == 'done' else JOBS_FAILED).inc()
+        if self.journal is not None:
+            try:
+                self.journal.record(self)
+            except Exception as e:
+                print(f"[Journal] Could not record job {self.job_id}: {e}")
+        self.downloader.progress_hook.notify()
+
+    def get_progress(self) -> Dict:
+        """Get the job progress merged with its queue state"""
+        progress = self.downloader.progress_hook.progress
+        progress.update({
+            'job_id': self.job_id,
+            'status': self.status,
+            'filename': self.file_path,
+        })
+        if self.status == 'done':
+            progress['percentage'] = '100.00%'
+        if self.error:
+            progress['error'] = self.error
+        return progress
+
+    def to_dict(self) -> Dict:
+        """Get a summary of the job for listings"""
+        lease = self.downloader.bandwidth_lease
+        return {
+            **self.get_progress(),
+            'url': self.url,
+            'title': self.title,
+            'format_id': self.format_obj.get('format_id') if self.format_obj else None,
+            'type': 'video' if self.is_video else 'audio',
+            'batch_id': self.batch_id,
+            'pipeline': self.pipeline,
+            'weight': self.weight,
+            'priority': self.priority,
+            'expected_bytes': self.expected_bytes,
+            'bandwidth': lease.rate if lease else None,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class DownloadBatch:
+    """A group of jobs created from one playlist or channel"""
+
+    def __init__(self, url: str, title: str, jobs: List[DownloadJob],
+                 batch_id: Optional[str] = None, client_id: Optional[str] = None):
+        self.batch_id = batch_id or uuid.uuid4().hex[:12]
+        self.client_id = client_id
+        self.url = url
+        self.title = title
+        self.jobs = jobs
+        self.created_at = time.time()
+
+        for job in jobs:
+            job.batch_id = self.batch_id
+            job.client_id = client_id
+
+    def get_progress(self) -> Dict:
+        """Get the overall progress of the batch with per-entry details"""
+        return summarize_batch(self.batch_id, self.url, self.title,
+                               [job.to_dict() for job in self.jobs])
+
+    def finished_at(self) -> Optional[float]:
+        """Time the last job of the batch finished, or None while any runs"""
+        if any(job.status not in FINISHED_STAGES for job in self.jobs):
+            return None
+        return max((job.finished_at or 0 for job in self.jobs), default=self.created_at)
+
+
+class JobQueue:
+    """Two-stage download pipeline: a bounded pool of network workers hands
+    fetched streams to a separate, lower-priority pool for ffmpeg work.
+
+    Download slots go to the clients in turn, so a client with a long queue
+    can't starve the others, and each client's jobs run in the order the
+    JobScheduler ranks them. A client may hold at most `max_client_jobs`
+    slots and have `max_client_queued_bytes` waiting; jobs without a client
+    (e.g. from scripts) are not limited.
+
+    Finished jobs are kept for `retention` seconds, then prune() drops them
+    (and their yt-dlp info) from memory; the journal still has them."""
+
+    def __init__(self, max_workers: int = 3, postprocess_workers: int = 2,
+                 postprocess_nice: Optional[int] = None, ffmpeg_threads: Optional[int] = None,
+                 journal: Optional[JobJournal] = None, max_client_jobs: Optional[int] = None,
+                 max_client_queued_bytes: Optional[int] = None, scheduler: Optional[JobScheduler] = None,
+                 retention: Optional[float] = None):
+        self.max_workers = max(1, int(max_workers))
+        self.postprocess_workers = max(1, int(postprocess_workers))
+        self.postprocess_nice = postprocess_nice
+        self.ffmpeg_threads = ffmpeg_threads
+        self.journal = journal
+        self.max_client_jobs = max_client_jobs or None
+        self.max_client_queued_bytes = max_client_queued_bytes or None
+        self.scheduler = scheduler or JobScheduler(self.max_workers, self.max_client_jobs)
+        self.retention = retention  # Seconds finished jobs stay in memory (None = until exit)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix='download')
+        self._postprocess_executor = ThreadPoolExecutor(
+            max_workers=self.postprocess_workers, thread_name_prefix='postprocess')
+        self._jobs: Dict[str, DownloadJob] = {}
+        self._client_jobs: Dict[Optional[str], Dict[str, DownloadJob]] = {}
+        self._batches: Dict[str, DownloadBatch] = {}
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def submit(self, job: DownloadJob, check_quota: bool = True) -> DownloadJob:
+        """Queue a job for download.
+        :raises QuotaExceededError: If the client has too many bytes queued already."""
+        with self._lock:
+            if check_quota and job.status == 'queued':
+                self._check_quota(job.client_id, job.expected_bytes)
+            self._add(job)
+        if self.journal is not None:
+            job.journal = self.journal
+            try:
+                self.journal.record(job)
+            except Exception as e:
+                print(f"[Journal] Could not record job {job.job_id}: {e}")
+        if job.status == 'queued':
+            with self._lock:
+                self.scheduler.push(job)
+            self._dispatch()
+        return job
+
+    def _add(self, job: DownloadJob):
+        """Register a job for lookups (lock must be held)"""
+        self._jobs[job.job_id] = job
+        self._client_jobs.setdefault(job.client_id, {})[job.job_id] = job
+
+    def _remove(self, job: DownloadJob):
+        """Drop a job from the lookups (lock must be held)"""
+        self._jobs.pop(job.job_id, None)
+        client_jobs = self._client_jobs.get(job.client_id)
+        if client_jobs is not None:
+            client_jobs.pop(job.job_id, None)
+            if not client_jobs:
+                del self._client_jobs[job.client_id]
+
+    def prune(self) -> List[str]:
+        """Drop jobs that finished more than `retention` seconds ago. Jobs of a
+        batch go together with it, once the whole batch has finished.
+        :return: The IDs of the dropped jobs."""
+        if self.retention is None:
+            return []
+        cutoff = time.time() - self.retention
+        pruned: List[str] = []
+        with self._lock:
+            for batch in list(self._batches.values()):
+                finished_at = batch.finished_at()
+                if finished_at is not None and finished_at < cutoff:
+                    del self._batches[batch.batch_id]
+                    for job in batch.jobs:
+                        self._remove(job)
+                        pruned.append(job.job_id)
+            for job in list(self._jobs.values()):
+                if (job.status in FINISHED_STAGES and job.finished_at and job.finished_at < cutoff
+                        and job.batch_id not in self._batches):
+                    self._remove(job)
+                    pruned.append(job.job_id)
+        return pruned
+
+    def _check_quota(self, client_id: Optional[str], size: int):
+        """Refuse more work once a client's queue is full (lock must be held).
+        A single job may exceed the limit, so large files can still be downloaded."""
+        if client_id is None or not self.max_client_queued_bytes:
+            return
+        queued = sum(job.expected_bytes for job in self._client_jobs.get(client_id, {}).values()
+                     if job.status in PENDING_STAGES)
+        if queued and queued + size > self.max_client_queued_bytes:
+            raise QuotaExceededError(
+                f"Download queue limit of {format_size(self.max_client_queued_bytes)} reached "
+                f"({format_size(queued)} waiting); try again when some downloads have finished")
+
+    def _dispatch(self):
+        """Hand queued jobs to free download slots"""
+        with self._lock:
+            while not self._closed:
+                job = self.scheduler.pop()
+                if job is None:
+                    break
+                self._executor.submit(self._run, job)
+
+    def _run(self, job: DownloadJob):
+        """Fetch a job, then free the network slot while it is post-processed"""
+        try:
+            if job.fetch():
+                with self._lock:
+                    # drain() closes the queue before it shuts the ffmpeg pool down
+                    if not self._closed:
+                        self._postprocess_executor.submit(
+                            job.postprocess, self.ffmpeg_threads, self.postprocess_nice)
+                        return
+                job.requeue()
+        finally:
+            with self._lock:
+                self.scheduler.release(job)
+            self._dispatch()
+
+    def set_priority(self, job_id: str, priority: int, client_id: Optional[str] = None) -> DownloadJob:
+        """Change the priority of a queued job
+        :raises ValueError: If the job doesn't exist.
+        :raises JobStateError: If the job has left the queue."""
+        job = self.get(job_id, client_id)
+        if not job:
+            raise ValueError("Job not found")
+        with self._lock:
+            if not self.scheduler.is_queued(job):
+                raise JobStateError("Only queued jobs can change priority")
+            job.priority = priority
+            self.scheduler.push(job)
+        if self.journal is not None:
+            try:
+                self.journal.record(job)
+            except Exception as e:
+                print(f"[Journal] Could not record job {job.job_id}: {e}")
+        return job
+
+    def submit_batch(self, batch: DownloadBatch, check_quota: bool = True) -> DownloadBatch:
+        """Queue every job of a batch.
+        :raises QuotaExceededError: If the client has too many bytes queued already."""
+        if check_quota:
+            with self._lock:
+                self._check_quota(batch.client_id, sum(job.expected_bytes for job in batch.jobs))
+        with self._lock:
+            self._batches[batch.batch_id] = batch
+        if self.journal is not None:
+            try:
+                self.journal.record_batch(batch)
+            except Exception as e:
+                print(f"[Journal] Could not record batch {batch.batch_id}: {e}")
+        for job in batch.jobs:
+            self.submit(job, check_quota=False)
+        return batch
+
+    def get(self, job_id: str, client_id: Optional[str] = None) -> Optional[DownloadJob]:
+        """Get a job by its ID, if the client may see it"""
+        job = self._jobs.get(job_id)
+        return job if job and is_visible(job.client_id, client_id) else None
+
+    def get_batch(self, batch_id: str, client_id: Optional[str] = None) -> Optional[DownloadBatch]:
+        """Get a batch by its ID, if the client may see it"""
+        batch = self._batches.get(batch_id)
+        return batch if batch and is_visible(batch.client_id, client_id) else None
+
+    def list(self, client_id: Optional[str] = None) -> List[DownloadJob]:
+        """Get the jobs a client may see (all without a client), oldest first"""
+        with self._lock:
+            if client_id is None:
+                return list(self._jobs.values())
+            jobs = {**self._client_jobs.get(None, {}), **self._client_jobs.get(client_id, {})}
+        return sorted(jobs.values(), key=lambda job: job.created_at)
+
+    def latest(self, client_id: Optional[str] = None) -> Optional[DownloadJob]:
+        """Get the most recently submitted job of a client, or else the latest job without one"""
+        with self._lock:
+            for jobs in ([self._jobs] if client_id is None else
+                         [self._client_jobs.get(client_id, {}), self._client_jobs.get(None, {})]):
+                job = next(reversed(jobs.values()), None)
+                if job:
+                    return job
+        return None
+
+    def stats(self) -> Dict[str, int]:
+        """Count jobs by status"""
+        counts = {'queued': 0, 'extracting': 0, 'downloading': 0,
+                  'processing': 0, 'done': 0, 'error': 0}
+        for job in self.list():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
+
+    def client_usage(self, client_id: str) -> Dict:
+        """Get how much of its limits a client is using"""
+        with self._lock:
+            jobs = list(self._client_jobs.get(client_id, {}).values())
+            running = self.scheduler.running(client_id)
+        return {
+            'running_jobs': running,
+            'max_running_jobs': self.max_client_jobs,
+            'queued_bytes': sum(job.expected_bytes for job in jobs if job.status in PENDING_STAGES),
+            'max_queued_bytes': self.max_client_queued_bytes,
+        }
+
+    def drain(self, timeout: float, grace: float = 5.0) -> List[DownloadJob]:
+        """Stop taking jobs and give running ones `timeout` seconds to finish.
+        Downloads still running then are interrupted (their partial files are
+        kept) and ffmpeg runs not started yet are dropped; both stay unfinished
+        in the journal. ffmpeg runs already started are allowed to finish.
+        :return: The jobs left unfinished."""
+        with self._lock:
+            self._closed = True  # Queued jobs stay queued
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        active = ('extracting', 'downloading', 'processing')
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and any(job.status in active for job in self.list()):
+            time.sleep(0.1)
+
+        for job in self.list():
+            if job.status in ('extracting', 'downloading'):
+                print(f"[Queue] Interrupting job {job.job_id}")
+                job.interrupt()
+        # Extractions can't be interrupted; give them a moment before moving on
+        deadline = time.monotonic() + grace
+        while time.monotonic() < deadline and any(
+                job.status in ('extracting', 'downloading') for job in self.list()):
+            time.sleep(0.1)
+
+        self._postprocess_executor.shutdown(wait=True, cancel_futures=True)
+        return [job for job in self.list() if job.status in UNFINISHED_STAGES]
+
+    def shutdown(self, wait: bool = True):
+        """Stop accepting jobs and optionally wait for running ones"""
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+        self._postprocess_executor.shutdown(wait=wait, cancel_futures=not wait)
@@ -0,0 +1,94 @@
+import asyncio
+from typing import AsyncIterator, Dict, Optional
+
+from downloaders.progress import ProgressHook
+
+
+class ProgressChannel:
+    """Wake-up signal of one job shared by all its subscribers"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, hook: ProgressHook):
+        self.loop = loop
+        self.hook = hook
+        self.event = asyncio.Event()
+        self.subscribers = 0
+        self._scheduled = False
+
+    def listener(self):
+        """Progress hook listener, called from the download thread"""
+        if self._scheduled:
+            return  # A wake-up is already on its way
+        self._scheduled = True
+        try:
+            self.loop.call_soon_threadsafe(self._wake)
+        except RuntimeError:
+            pass  # The loop has been closed
+
+    def _wake(self):
+        """Release every subscriber waiting on the current event (runs on the loop)"""
+        self._scheduled = False
+        event, self.event = self.event, asyncio.Event()
+        event.set()
+
+
+class ProgressBroadcaster:
+    """Fan progress changes of jobs out to subscribers on an asyncio loop.
+
+    Each watched job gets a single listener on its progress hook. The download
+    thread only schedules a wake-up on the loop, which then releases all
+    subscribers of that job together, so an idle subscriber costs a pending
+    event wait instead of a thread."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self._channels: Dict[str, ProgressChannel] = {}
+
+    @property
+    def subscribers(self) -> int:
+        """Number of subscribers over all jobs"""
+        return sum(channel.subscribers for channel in list(self._channels.values()))
+
+    def _subscribe(self, job) -> ProgressChannel:
+        channel = self._channels.get(job.job_id)
+        if channel is None:
+            channel = ProgressChannel(self.loop, job.downloader.progress_hook)
+            channel.hook.add_listener(channel.listener)
+            self._channels[job.job_id] = channel
+        channel.subscribers += 1
+        return channel
+
+    def _unsubscribe(self, job):
+        channel = self._channels[job.job_id]
+        channel.subscribers -= 1
+        if not channel.subscribers:
+            channel.hook.remove_listener(channel.listener)
+            del self._channels[job.job_id]
+
+    async def watch(self, job, coalesce: float = 0.25,
+                    heartbeat: float = 15.0) -> AsyncIterator[Optional[Dict]]:
+        """Yield job progress each time it changes, and None as a heartbeat
+        when nothing changed for `heartbeat` seconds. Stops once the job ends."""
+        hook = job.downloader.progress_hook
+        channel = self._subscribe(job)
+        try:
+            version = hook.version
+            progress = job.get_progress()
+            yield progress
+
+            while progress['status'] not in ('done', 'error'):
+                # Take the event before checking the version, so no change slips between
+                event = channel.event
+                if hook.version == version:
+                    try:
+                        await asyncio.wait_for(event.wait(), heartbeat)
+                    except asyncio.TimeoutError:
+                        yield None
+                        continue
+
+                # Coalesce bursts of chunk updates into a single event
+                await asyncio.sleep(coalesce)
+                version = hook.version
+                progress = job.get_progress()
+                yield progress
+        finally:
+            self._unsubscribe(job)
@@ -0,0 +1,130 @@
+import heapq
+import itertools
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# Sizes assumed for jobs whose format is not picked yet (e.g. playlist entries)
+UNKNOWN_VIDEO_BYTES = 500 * 1024 * 1024
+UNKNOWN_AUDIO_BYTES = 10 * 1024 * 1024
+
+# Range of the priorities clients may give their jobs
+MIN_PRIORITY = -10
+MAX_PRIORITY = 10
+
+
+class JobScheduler:
+    """Picks the queued job that gets the next free download slot.
+
+    Clients take turns, and each client's jobs are ranked by
+
+        priority * aging - queued_at - expected_bytes / sjf_bytes_per_second
+
+    so higher priorities go first and smaller downloads go before bigger
+    ones (shortest job first). Every `aging` seconds of waiting is worth one
+    priority level, so a big job can't be overtaken by smaller ones forever.
+    The rank never changes while a job waits, so each client's queue is a
+    heap. `fast_lane_slots` slots are kept for small audio jobs, so an MP3
+    never waits for a 4K video to finish.
+
+    Not thread-safe: the job queue calls it under its own lock."""
+
+    def __init__(self, slots: int, max_client_jobs: Optional[int] = None,
+                 fast_lane_slots: int = 1, fast_lane_max_bytes: int = 50 * 1024 * 1024,
+                 aging: float = 300, sjf_bytes_per_second: float = 10 * 1024 * 1024):
+        self.slots = max(1, int(slots))
+        self.max_client_jobs = max_client_jobs or None
+        # At least one slot stays open to every job
+        self.fast_lane_slots = min(max(0, int(fast_lane_slots)), self.slots - 1)
+        self.fast_lane_max_bytes = fast_lane_max_bytes
+        self.aging = aging
+        self.sjf_bytes_per_second = sjf_bytes_per_second
+        # (fast lane heap, regular heap) per client, in the order the clients get their turn
+        self._pending: OrderedDict[Optional[str], Tuple[List, List]] = OrderedDict()
+        self._entries: Dict[str, List] = {}  # Current heap entry of each queued job
+        self._sequence = itertools.count()
+        self._running: Dict[Optional[str], int] = {}
+        self._fast_lane: Dict[str, bool] = {}  # Whether a running job holds a fast lane slot
+        self._fast_running = 0
+        self._regular_running = 0
+
+    @staticmethod
+    def estimate(job) -> int:
+        """Expected download size of a job in bytes"""
+        return job.expected_bytes or (UNKNOWN_VIDEO_BYTES if job.is_video else UNKNOWN_AUDIO_BYTES)
+
+    def is_small_audio(self, job) -> bool:
+        """Check if a job may use the fast lane"""
+        return not job.is_video and self.estimate(job) <= self.fast_lane_max_bytes
+
+    def rank(self, job) -> float:
+        """Rank of a queued job; the highest goes first"""
+        return (job.priority * self.aging - job.created_at
+                - self.estimate(job) / self.sjf_bytes_per_second)
+
+    def push(self, job):
+        """Queue a job, or re-rank it if it is queued already (e.g. its priority changed)"""
+        entry = [-self.rank(job), next(self._sequence), job]
+        # An older entry of the job is left in its heap and skipped when it surfaces
+        self._entries[job.job_id] = entry
+        fast, regular = self._pending.setdefault(job.client_id, ([], []))
+        heapq.heappush(fast if self.is_small_audio(job) else regular, entry)
+
+    def is_queued(self, job) -> bool:
+        """Check if a job is waiting for a slot"""
+        return job.job_id in self._entries
+
+    def pop(self):
+        """Take the next job for a free slot, or None if no slot is free or no job may run"""
+        fast_open = self._fast_running < self.fast_lane_slots
+        regular_open = self._regular_running < self.slots - self.fast_lane_slots
+        if not fast_open and not regular_open:
+            return None
+
+        for client_id in list(self._pending):
+            if (client_id is not None and self.max_client_jobs
+                    and self._running.get(client_id, 0) >= self.max_client_jobs):
+                continue
+            fast, regular = self._pending[client_id]
+            self._discard_stale(fast)
+            self._discard_stale(regular)
+            heaps = [heap for heap, open_ in ((fast, True), (regular, regular_open)) if heap and open_]
+            if not heaps:
+                if not fast and not regular:
+                    del self._pending[client_id]
+                continue
+
+            job = heapq.heappop(min(heaps, key=lambda heap: heap[0]))[2]
+            del self._entries[job.job_id]
+            if fast or regular:
+                self._pending.move_to_end(client_id)  # Back of the line
+            else:
+                del self._pending[client_id]
+
+            in_fast_lane = fast_open and self.is_small_audio(job)
+            self._fast_lane[job.job_id] = in_fast_lane
+            if in_fast_lane:
+                self._fast_running += 1
+            else:
+                self._regular_running += 1
+            self._running[job.client_id] = self._running.get(job.client_id, 0) + 1
+            return job
+        return None
+
+    def release(self, job):
+        """Free the slot of a job that left the network stage"""
+        if self._fast_lane.pop(job.job_id):
+            self._fast_running -= 1
+        else:
+            self._regular_running -= 1
+        self._running[job.client_id] -= 1
+        if not self._running[job.client_id]:
+            del self._running[job.client_id]
+
+    def running(self, client_id: Optional[str]) -> int:
+        """Number of slots a client holds"""
+        return self._running.get(client_id, 0)
+
+    def _discard_stale(self, heap: List):
+        """Drop replaced entries from the top of a heap"""
+        while heap and self._entries.get(heap[0][2].job_id) is not heap[0]:
+            heapq.heappop(heap)
@@ -0,0 +1,266 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Set
+
+from downloaders.utils.file_utils import get_downloader_paths
+
+# A sync claimed longer ago than this is taken to have died with its process
+SYNC_TIMEOUT = 60 * 60
+
+
+class SubscriptionStore:
+    """Channels and playlists mirrored into the library, with the state of
+    their last sync (SQLite in WAL mode, shared by every process using the
+    same data folder)"""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or os.path.join(
+            get_downloader_paths()['data'], 'subscriptions.sqlite3')
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Lazy initialization of the SQLite connection"""
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._connection = sqlite3.connect(
+                self.db_path, check_same_thread=False)
+            self._connection.row_factory = sqlite3.Row
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.execute('''
+                CREATE TABLE IF NOT EXISTS subscriptions (
+                    subscription_id TEXT PRIMARY KEY,
+                    client_id TEXT,
+                    url TEXT NOT NULL,
+                    title TEXT,
+                    kind TEXT NOT NULL,
+                    max_height INTEGER,
+                    passthrough INTEGER NOT NULL,
+                    priority INTEGER NOT NULL,
+                    interval REAL NOT NULL,
+                    created_at REAL NOT NULL,
+                    next_sync_at REAL NOT NULL,
+                    syncing_at REAL,
+                    synced_at REAL,
+                    video_count INTEGER,
+                    new_count INTEGER,
+                    batch_id TEXT,
+                    error TEXT
+                )''')
+            self._connection.execute(
+                'CREATE INDEX IF NOT EXISTS subscriptions_due ON subscriptions (next_sync_at)')
+            self._connection.commit()
+        return self._connection
+
+    def add(self, url: str, kind: str, max_height: Optional[int], passthrough: bool,
+            priority: int, interval: float, client_id: Optional[str] = None) -> Dict:
+        """Subscribe to a channel or playlist; its first sync is due at once
+        :raises ValueError: If the client is subscribed to it already."""
+        subscription_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._lock:
+            existing = self.connection.execute(
+                'SELECT 1 FROM subscriptions WHERE url = ? AND client_id IS ?', (url, client_id)).fetchone()
+            if existing:
+                raise ValueError("Already subscribed to this playlist or channel")
+            self.connection.execute('''
+                INSERT INTO subscriptions (subscription_id, client_id, url, kind, max_height,
+                                           passthrough, priority, interval, created_at, next_sync_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                (subscription_id, client_id, url, kind, max_height, int(passthrough),
+                 priority, interval, now, now))
+            self.connection.commit()
+        return self.get(subscription_id)
+
+    def get(self, subscription_id: str, client_id: Optional[str] = None) -> Optional[Dict]:
+        """Get a subscription, if it belongs to the client (any client if None)"""
+        with self._lock:
+            row = self.connection.execute(
+                'SELECT * FROM subscriptions WHERE subscription_id = ?', (subscription_id,)).fetchone()
+        if row is None or (client_id is not None and row['client_id'] != client_id):
+            return None
+        return self._to_dict(row)
+
+    def list(self, client_id: Optional[str] = None) -> List[Dict]:
+        """List the subscriptions of a client (all if None), oldest first"""
+        with self._lock:
+            if client_id is None:
+                rows = self.connection.execute(
+                    'SELECT * FROM subscriptions ORDER BY created_at').fetchall()
+            else:
+                rows = self.connection.execute(
+                    'SELECT * FROM subscriptions WHERE client_id = ? ORDER BY created_at',
+                    (client_id,)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def remove(self, subscription_id: str, client_id: Optional[str] = None) -> bool:
+        """Unsubscribe; jobs already queued keep running"""
+        if not self.get(subscription_id, client_id):
+            return False
+        with self._lock:
+            self.connection.execute(
+                'DELETE FROM subscriptions WHERE subscription_id = ?', (subscription_id,))
+            self.connection.commit()
+        return True
+
+    def request_sync(self, subscription_id: str, client_id: Optional[str] = None) -> bool:
+        """Make a subscription due for sync now"""
+        if not self.get(subscription_id, client_id):
+            return False
+        with self._lock:
+            self.connection.execute(
+                'UPDATE subscriptions SET next_sync_at = ? WHERE subscription_id = ?',
+                (time.time(), subscription_id))
+            self.connection.commit()
+        return True
+
+    def claim_due(self, limit: int) -> List[Dict]:
+        """Take up to `limit` subscriptions that are due and not being synced,
+        longest waiting first. Claiming marks them as syncing until release()
+        and moves their next sync a full interval ahead."""
+        now = time.time()
+        with self._lock:
+            connection = self.connection
+            # Take the write lock first, so two processes can't claim the same subscription
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                rows = connection.execute('''
+                    SELECT * FROM subscriptions
+                    WHERE next_sync_at <= ? AND (syncing_at IS NULL OR syncing_at < ?)
+                    ORDER BY next_sync_at LIMIT ?''', (now, now - SYNC_TIMEOUT, limit)).fetchall()
+                connection.executemany(
+                    'UPDATE subscriptions SET next_sync_at = ?, syncing_at = ? WHERE subscription_id = ?',
+                    [(now + row['interval'], now, row['subscription_id']) for row in rows])
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+        return [self._to_dict(row) for row in rows]
+
+    def record_sync(self, subscription_id: str, result: Dict, error: Optional[str] = None) -> None:
+        """Write the outcome of a sync and schedule the next one, unless a
+        sync was requested while it ran"""
+        now = time.time()
+        with self._lock:
+            self.connection.execute('''
+                UPDATE subscriptions SET
+                    title = COALESCE(?, title), synced_at = ?,
+                    next_sync_at = MIN(next_sync_at, ? + interval),
+                    video_count = COALESCE(?, video_count), new_count = ?,
+                    batch_id = COALESCE(?, batch_id), error = ?
+                WHERE subscription_id = ?''',
+                (result.get('title'), now, now, result.get('video_count'), result.get('new_count', 0),
+                 result.get('batch_id'), error, subscription_id))
+            self.connection.commit()
+
+    def release(self, subscription_id: str) -> None:
+        """Mark a claimed subscription as no longer syncing"""
+        with self._lock:
+            self.connection.execute(
+                'UPDATE subscriptions SET syncing_at = NULL WHERE subscription_id = ?', (subscription_id,))
+            self.connection.commit()
+
+    def next_due(self) -> Optional[float]:
+        """Time the next subscription is due, or None without subscriptions"""
+        with self._lock:
+            row = self.connection.execute(
+                'SELECT MIN(next_sync_at) FROM subscriptions WHERE syncing_at IS NULL').fetchone()
+        return row[0]
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict:
+        subscription = dict(row)
+        subscription['passthrough'] = bool(subscription['passthrough'])
+        return subscription
+
+
+class SubscriptionScheduler:
+    """Syncs due subscriptions on a small pool of workers.
+
+    Only as many subscriptions are claimed as workers are free, so a long
+    list of subscriptions is worked through a few at a time, and other
+    processes sharing the store can pick up the rest."""
+
+    def __init__(self, store: SubscriptionStore, sync: Callable[[Dict], Dict],
+                 workers: int = 2, poll_interval: float = 60.0):
+        self.store = store
+        self.sync = sync
+        self.workers = max(1, int(workers))
+        self.poll_interval = poll_interval  # Longest sleep, to notice subscriptions added elsewhere
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._running: Set[str] = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start syncing in the background"""
+        if self._thread is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='subscription')
+        self._thread = threading.Thread(target=self._loop, name='subscriptions', daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        """Check for due subscriptions now (e.g. one was added)"""
+        self._wake.set()
+
+    def shutdown(self):
+        """Stop claiming subscriptions; syncs in progress finish in the background"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._thread = None
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            free, due, next_due = 0, [], None
+            try:
+                with self._lock:
+                    free = self.workers - len(self._running)
+                due = self.store.claim_due(free) if free > 0 else []
+                for subscription in due:
+                    with self._lock:
+                        self._running.add(subscription['subscription_id'])
+                    self._executor.submit(self._sync, subscription)
+                next_due = self.store.next_due()
+            except Exception as e:
+                print(f"[Subscriptions] Could not check subscriptions: {e}")
+
+            timeout = self.poll_interval
+            if next_due is not None:
+                timeout = min(timeout, max(0.0, next_due - time.time()))
+            if free <= len(due):
+                timeout = self.poll_interval  # All workers busy; a finished sync wakes the loop
+            self._wake.wait(timeout)
+
+    def _sync(self, subscription: Dict):
+        """Sync one subscription and record the outcome"""
+        subscription_id = subscription['subscription_id']
+        try:
+            try:
+                result, error = self.sync(subscription), None
+            except Exception as e:
+                result, error = {}, str(e)
+                print(f"[Subscriptions] Could not sync {subscription['url']}: {e}")
+            self.store.record_sync(subscription_id, result, error)
+        except Exception as e:
+            print(f"[Subscriptions] Could not record sync of {subscription['url']}: {e}")
+        finally:
+            try:
+                self.store.release(subscription_id)
+            except Exception as e:
+                print(f"[Subscriptions] Could not release {subscription['url']}: {e}")
+            with self._lock:
+                self._running.discard(subscription_id)
+            self._wake.set()
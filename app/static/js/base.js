@@ -2,7 +2,10 @@
 
 // Global variables
 let currentFilename = "";
+let currentJobId = null;
+let currentBatchId = null;
 let progressInterval = null;
+let progressSource = null;
 
 // Utility functions
 function formatSize(bytes) {
@@ -41,10 +41,8 @@ function handleDownload(e) {
   // Update status
   updateStatus("downloading", "Downloading...");
 
-  // Clear any existing interval
-  if (progressInterval) {
-    clearInterval(progressInterval);
-  }
+  // Stop any existing progress updates
+  stopProgressUpdates();
 
   // Start download
   fetch("/api/download", {
@@ -54,8 +52,9 @@ function handleDownload(e) {
     .then((response) => response.json())
     .then((data) => {
       if (data.status === "started") {
+        currentJobId = data.job_id;
         // Start progress updates
-        progressInterval = setInterval(updateProgress, 500);
+        startProgressUpdates();
       } else {
         throw new Error(data.error || "Download failed to start");
       }
@@ -76,63 +75,113 @@ function handleDownload(e) {
     });
 }
 
+function startProgressUpdates() {
+  stopProgressUpdates();
+
+  if (!window.EventSource) {
+    progressInterval = setInterval(updateProgress, 500);
+    return;
+  }
+
+  const streamUrl = currentJobId
+    ? `/api/progress/stream?job_id=${encodeURIComponent(currentJobId)}`
+    : "/api/progress/stream";
+
+  progressSource = new EventSource(streamUrl);
+  progressSource.onmessage = (event) => {
+    handleProgress(JSON.parse(event.data));
+  };
+  progressSource.onerror = () => {
+    // The stream ended or could not connect; fall back to polling
+    if (progressSource) {
+      progressSource.close();
+      progressSource = null;
+      progressInterval = setInterval(updateProgress, 500);
+    }
+  };
+}
+
+function stopProgressUpdates() {
+  if (progressSource) {
+    progressSource.close();
+    progressSource = null;
+  }
+  if (progressInterval) {
+    clearInterval(progressInterval);
+    progressInterval = null;
+  }
+}
+
 function updateProgress() {
-  fetch("/api/progress")
+  const progressUrl = currentJobId
+    ? `/api/progress/${encodeURIComponent(currentJobId)}`
+    : "/api/progress";
+
+  fetch(progressUrl)
     .then((response) => response.json())
-    .then((data) => {
-      console.log("Progress data:", data);
-
-      if (data.status === "downloading") {
-        hideLoading();
-        const progressBar = document.getElementById("progressBar");
-        const downloadSize = document.getElementById("downloadSize");
-        const downloadSpeed = document.getElementById("downloadSpeed");
-
-        // Update progress bar
-        const percentage = parseFloat(data.percentage.replace("%", ""));
-        progressBar.style.width = `${percentage}%`;
-        progressBar.textContent = data.percentage;
-
-        // Update size and speed
-        downloadSize.textContent = `${formatSize(
-          data.downloaded_bytes
-        )} / ${formatSize(data.total_bytes)}`;
-        downloadSpeed.textContent = formatSpeed(data.speed);
-
-        // Update status
-        updateStatus("downloading", `Downloading... ${data.percentage}`);
-      } else if (data.status === "done") {
-        hideLoading();
-        clearInterval(progressInterval);
-        currentFilename = data.filename;
-
-        // Hide progress and show file actions
-        document.getElementById("progressSection").style.display = "none";
-        document.getElementById("fileActionsSection").style.display = "block";
-
-        // Update status
-        updateStatus("success", "Download complete");
-
-        // Show success message
-        showSnackbar("Download completed successfully!", "success");
-      } else if (data.status === "error") {
-        clearInterval(progressInterval);
-
-        // Show error and restore download form
-        showSnackbar(`Download error: ${data.error}`, "error");
-        document
-          .getElementById("downloadForm")
-          .closest(".download-form").style.display = "block";
-        document.getElementById("progressSection").style.display = "none";
-        updateStatus("error", "Download failed");
-      }
-    })
+    .then(handleProgress)
     .catch((error) => {
       console.error("Error fetching progress:", error);
       // Don't show error for network issues during progress updates
     });
 }
 
+function handleProgress(data) {
+  console.log("Progress data:", data);
+
+  if (data.status === "queued") {
+    hideLoading();
+    updateStatus("loading", "Waiting in queue...");
+  } else if (data.status === "downloading") {
+    hideLoading();
+    const progressBar = document.getElementById("progressBar");
+    const downloadSize = document.getElementById("downloadSize");
+    const downloadSpeed = document.getElementById("downloadSpeed");
+
+    // Update progress bar
+    const percentage = parseFloat(data.percentage.replace("%", ""));
+    progressBar.style.width = `${percentage}%`;
+    progressBar.textContent = data.percentage;
+
+    // Update size and speed
+    downloadSize.textContent = `${formatSize(
+      data.downloaded_bytes
+    )} / ${formatSize(data.total_bytes)}`;
+    downloadSpeed.textContent = formatSpeed(data.speed);
+
+    // Update status
+    const stage = data.stage ? ` ${data.stage}` : "";
+    updateStatus("downloading", `Downloading${stage}... ${data.percentage}`);
+  } else if (data.status === "processing") {
+    hideLoading();
+    updateStatus("loading", data.stage === "merge" ? "Merging..." : "Processing...");
+  } else if (data.status === "done") {
+    hideLoading();
+    stopProgressUpdates();
+    currentFilename = data.filename;
+
+    // Hide progress and show file actions
+    document.getElementById("progressSection").style.display = "none";
+    document.getElementById("fileActionsSection").style.display = "block";
+
+    // Update status
+    updateStatus("success", "Download complete");
+
+    // Show success message
+    showSnackbar("Download completed successfully!", "success");
+  } else if (data.status === "error") {
+    stopProgressUpdates();
+
+    // Show error and restore download form
+    showSnackbar(`Download error: ${data.error}`, "error");
+    document
+      .getElementById("downloadForm")
+      .closest(".download-form").style.display = "block";
+    document.getElementById("progressSection").style.display = "none";
+    updateStatus("error", "Download failed");
+  }
+}
+
 function handleOpenLocation() {
   if (!currentFilename) {
     showSnackbar("No file to open", "warning");
@@ -171,6 +220,88 @@ function handleOpenFile() {
     });
 }
 
+// Playlist form handling
+document.addEventListener("DOMContentLoaded", function () {
+  const batchForm = document.getElementById("batchForm");
+  if (batchForm) {
+    batchForm.addEventListener("submit", handleBatchDownload);
+  }
+});
+
+function handleBatchDownload(e) {
+  e.preventDefault();
+
+  const formData = new FormData(this);
+  document.getElementById("batchDownloadBtn").disabled = true;
+  document.getElementById("batchProgress").style.display = "flex";
+  updateStatus("downloading", "Fetching playlist...");
+
+  fetch("/api/batch", {
+    method: "POST",
+    body: formData,
+  })
+    .then((response) => response.json())
+    .then((data) => {
+      if (data.status !== "started") {
+        throw new Error(data.error || "Download failed to start");
+      }
+      currentBatchId = data.batch_id;
+      updateBatchProgress();
+      progressInterval = setInterval(updateBatchProgress, 1000);
+    })
+    .catch((error) => {
+      console.error("Batch download error:", error);
+      showSnackbar(error.message || "Failed to start downloads", "error");
+      document.getElementById("batchDownloadBtn").disabled = false;
+      updateStatus("error", "Download failed");
+    });
+}
+
+function updateBatchProgress() {
+  fetch(`/api/batch/${encodeURIComponent(currentBatchId)}`)
+    .then((response) => response.json())
+    .then((data) => {
+      if (data.error) {
+        throw new Error(data.error);
+      }
+
+      const progressBar = document.getElementById("batchProgressBar");
+      progressBar.style.width = data.percentage;
+      progressBar.textContent = `${data.completed} / ${data.total}`;
+
+      const rows = document.querySelectorAll("#playlistEntries .playlist-entry");
+      data.entries.forEach((entry, index) => {
+        const badge = rows[index] && rows[index].querySelector(".playlist-entry-status");
+        if (!badge) return;
+        badge.textContent =
+          entry.status === "downloading" ? entry.percentage : entry.status;
+        badge.className = `playlist-entry-status badge ${
+          entry.status === "done"
+            ? "bg-success"
+            : entry.status === "error"
+            ? "bg-danger"
+            : "bg-light text-dark"
+        }`;
+        badge.title = entry.error || "";
+      });
+
+      if (data.status === "done") {
+        stopProgressUpdates();
+        const message = `Downloaded ${data.completed} of ${data.total} videos`;
+        updateStatus(data.failed ? "error" : "success", message);
+        showSnackbar(
+          data.failed ? `${message} (${data.failed} failed)` : message,
+          data.failed ? "warning" : "success"
+        );
+      } else {
+        updateStatus("downloading", `Downloading... ${data.percentage}`);
+      }
+    })
+    .catch((error) => {
+      console.error("Error fetching batch progress:", error);
+    });
+}
+
 // URL form handling
 document.addEventListener("DOMContentLoaded", function () {
   const urlForm = document.getElementById("urlForm");
@@ -183,6 +314,69 @@ document.addEventListener("DOMContentLoaded", function () {
   }
 });
 
+// Format list loading: the page is sent before the video is extracted
+document.addEventListener("DOMContentLoaded", function () {
+  const formatSelect = document.querySelector("select[data-formats-url]");
+  if (formatSelect) {
+    loadFormats(formatSelect);
+  }
+});
+
+function loadFormats(formatSelect) {
+  fetch(formatSelect.dataset.formatsUrl)
+    .then((response) => response.json())
+    .then((data) => {
+      if (data.error) {
+        throw new Error(data.error);
+      }
+
+      const title = document.getElementById("videoTitle");
+      title.textContent = data.title;
+      document.getElementById("videoDuration").textContent = data.duration;
+      const thumbnail = document.getElementById("videoThumbnail");
+      thumbnail.alt = data.title;
+      if (data.thumbnail && thumbnail.src !== data.thumbnail) {
+        thumbnail.src = data.thumbnail;
+        adjustThumbnailSize();
+      }
+      document.getElementById("videoCard").classList.remove("loading");
+
+      fillFormatGroup(
+        document.getElementById("videoFormats"),
+        data.formats,
+        "video",
+        (format) => `${format.resolution}p (${format.quality})`
+      );
+      fillFormatGroup(
+        document.getElementById("audioFormats"),
+        data.audio_formats,
+        "audio",
+        (format) => format.quality
+      );
+      formatSelect.options[0].textContent = "Select a format...";
+      formatSelect.disabled = false;
+    })
+    .catch((error) => {
+      console.error("Error loading formats:", error);
+      formatSelect.options[0].textContent = "Formats unavailable";
+      document.getElementById("videoCard").classList.remove("loading");
+      showSnackbar(error.message || "Could not load the formats", "error");
+      updateStatus("error", "Could not load the formats");
+    });
+}
+
+function fillFormatGroup(group, formats, type, describe) {
+  formats.forEach((format) => {
+    const option = document.createElement("option");
+    option.value = format.format_id;
+    option.dataset.type = type;
+    option.textContent = format.filesize
+      ? `${describe(format)} - ${format.filesize}`
+      : describe(format);
+    group.appendChild(option);
+  });
+}
+
 // Format selection enhancement
 document.addEventListener("DOMContentLoaded", function () {
   const formatSelect = document.querySelector('select[name="format"]');
@@ -214,7 +408,5 @@ document.addEventListener("DOMContentLoaded", function () {
 
 // Cleanup on page unload
 window.addEventListener("beforeunload", function () {
-  if (progressInterval) {
-    clearInterval(progressInterval);
-  }
+  stopProgressUpdates();
 });
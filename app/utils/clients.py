@@ -0,0 +1,23 @@
+import hashlib
+import hmac
+from typing import Iterable, Mapping, Optional
+
+API_KEY_HEADER = 'X-API-Key'
+
+
+def is_known_api_key(api_key: str, api_keys: Iterable[str]) -> bool:
+    """Check an API key against the configured ones"""
+    return any(hmac.compare_digest(api_key.encode('utf-8'), key.encode('utf-8'))
+               for key in api_keys)
+
+
+def get_client_id(headers: Mapping[str, str], remote_addr: Optional[str]) -> str:
+    """Get the namespace of the caller: its API key if it sent one, else its
+    address. The key isn't checked here; callers reject unknown keys with
+    is_known_api_key before they get this far. Anonymous callers can't get a
+    fresh namespace, and a fresh quota, by dropping a cookie."""
+    api_key = headers.get(API_KEY_HEADER)
+    if api_key:
+        # Only a hash is kept, so keys never end up in the job journal
+        return 'key:' + hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+    return 'ip:' + (remote_addr or 'unknown')
@@ -36,3 +36,18 @@ def format_size(size_bytes: float) -> str:
 def format_speed(bytes_per_second: float) -> str:
     """Format download speed"""
     return f"{format_size(bytes_per_second)}/s"
+
+
+def parse_size(size: str | int | float | None) -> int | None:
+    """Parse a human-readable size such as '500MB' or '1.5 GB' into bytes"""
+    if size is None or size == '':
+        return None
+    if isinstance(size, (int, float)):
+        return int(size)
+
+    match = re.fullmatch(r'\s*([\d.]+)\s*([KMGT]?)i?B?\s*', size, re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid size: {size}")
+
+    number, unit = match.groups()
+    return int(float(number) * 1024 ** 'BKMGT'.index(unit.upper() or 'B'))
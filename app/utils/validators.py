@@ -1,9 +1,10 @@
 import re
+from typing import Optional
 from urllib.parse import urlparse
 
 
-def is_valid_youtube_url(url: str) -> bool:
-    """Validate if the URL is a valid YouTube URL"""
+def is_youtube_domain_url(url: str) -> bool:
+    """Check if the URL is a well-formed URL on a YouTube domain"""
     if not url:
         return False
 
@@ -24,9 +25,44 @@ def is_valid_youtube_url(url: str) -> bool:
     ]
 
     # Check if domain is YouTube
-    if parsed.netloc not in youtube_domains:
+    return parsed.netloc in youtube_domains
+
+
+def is_valid_youtube_url(url: str) -> bool:
+    """Validate if the URL is a valid YouTube URL"""
+    if not is_youtube_domain_url(url):
         return False
 
+    return extract_video_id(url) is not None
+
+
+def is_valid_youtube_playlist_url(url: str) -> bool:
+    """Validate if the URL is a YouTube playlist or channel URL"""
+    if not is_youtube_domain_url(url):
+        return False
+
+    # Check for playlist and channel patterns
+    collection_patterns = [
+        r'[?&]list=([a-zA-Z0-9_-]+)',
+        r'/playlist\b',
+        r'/channel/([a-zA-Z0-9_-]+)',
+        r'/c/([^/?#]+)',
+        r'/user/([^/?#]+)',
+        r'/@([^/?#]+)',
+    ]
+
+    for pattern in collection_patterns:
+        if re.search(pattern, url):
+            return True
+
+    return False
+
+
+def extract_video_id(url: str) -> Optional[str]:
+    """Extract the 11-character YouTube video ID from a URL"""
+    if not url:
+        return None
+
     # Check for video ID patterns
     video_patterns = [
         r'/watch\?v=([a-zA-Z0-9_-]{11})',
@@ -36,10 +72,11 @@ def is_valid_youtube_url(url: str) -> bool:
     ]
 
     for pattern in video_patterns:
-        if re.search(pattern, url):
-            return True
+        match = re.search(pattern, url)
+        if match:
+            return match.group(1)
 
-    return False
+    return None
 
 
 def sanitize_filename(filename: str) -> str:
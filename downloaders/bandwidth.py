@@ -0,0 +1,113 @@
+import threading
+import time
+from typing import Dict, Optional
+
+
+class BandwidthLease:
+    """Token bucket limiting one job to its share of the total bandwidth"""
+
+    def __init__(self, key: str, weight: float = 1.0, burst: float = 1.0):
+        self.key = key
+        self.weight = max(0.01, float(weight))
+        self.burst = burst
+        self.rate: Optional[float] = None  # Bytes/s, None when unlimited
+        self._tokens = 0.0
+        self._updated = time.monotonic()
+        self._last_bytes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate: Optional[float]):
+        """Change the share of this job; takes effect on the next block"""
+        with self._lock:
+            self._refill()
+            self.rate = rate
+            if rate:
+                self._tokens = min(self._tokens, rate * self.burst)
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self._tokens = min(self._tokens + (now - self._updated) * self.rate,
+                               self.rate * self.burst)
+        self._updated = now
+
+    def consume(self, size: int):
+        """Take `size` bytes from the bucket, sleeping while it is in debt"""
+        with self._lock:
+            if not self.rate or size <= 0:
+                return
+            self._refill()
+            self._tokens -= size
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0
+        if delay:
+            time.sleep(delay)
+
+    def __call__(self, d: Dict):
+        """yt-dlp progress hook charging each downloaded block to the bucket"""
+        if d['status'] != 'downloading':
+            return
+        filename = d.get('filename') or ''
+        downloaded = d.get('downloaded_bytes') or 0
+        with self._lock:
+            last = self._last_bytes.get(filename, 0)
+            self._last_bytes[filename] = downloaded
+        # Counters restart when a stream is retried
+        self.consume(downloaded - last if downloaded >= last else downloaded)
+
+
+class BandwidthScheduler:
+    """Split a global bandwidth cap between active jobs by weight.
+    Shares are recomputed as soon as a job starts or finishes downloading."""
+
+    def __init__(self, max_rate: Optional[int] = None, burst: float = 1.0):
+        self.max_rate = max_rate or None
+        self.burst = burst
+        self._leases: Dict[str, BandwidthLease] = {}
+        self._lock = threading.Lock()
+
+    def register(self, key: str, weight: float = 1.0) -> BandwidthLease:
+        """Start limiting a job and rebalance every share"""
+        lease = BandwidthLease(key, weight, self.burst)
+        with self._lock:
+            self._leases[key] = lease
+            self._rebalance()
+        return lease
+
+    def unregister(self, key: str):
+        """Stop limiting a job and hand its share to the others"""
+        with self._lock:
+            if self._leases.pop(key, None) is not None:
+                self._rebalance()
+
+    def _rebalance(self):
+        total_weight = sum(lease.weight for lease in self._leases.values())
+        for lease in self._leases.values():
+            lease.set_rate(self.max_rate * lease.weight / total_weight
+                           if self.max_rate else None)
+
+    def allocation(self) -> Dict:
+        """Get the cap and the current share of every active job"""
+        with self._lock:
+            return {
+                'max_rate': self.max_rate,
+                'jobs': {key: {'weight': lease.weight, 'rate': lease.rate}
+                         for key, lease in self._leases.items()},
+            }
+
+
+_bandwidth_scheduler: Optional[BandwidthScheduler] = None
+
+
+def get_bandwidth_scheduler() -> BandwidthScheduler:
+    """Get the shared bandwidth scheduler"""
+    global _bandwidth_scheduler
+    if _bandwidth_scheduler is None:
+        _bandwidth_scheduler = BandwidthScheduler()
+    return _bandwidth_scheduler
+
+
+def configure_bandwidth_scheduler(**kwargs) -> BandwidthScheduler:
+    """Replace the shared bandwidth scheduler with one using the given settings"""
+    global _bandwidth_scheduler
+    _bandwidth_scheduler = BandwidthScheduler(**kwargs)
+    return _bandwidth_scheduler
@@ -1,30 +1,37 @@
 from abc import ABC, abstractmethod
-from typing import Dict, List, Optional
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
 from downloaders.progress import ProgressHook
-from yt_dlp import YoutubeDL
+from downloaders.utils.info_cache import get_info_cache
+from downloaders.utils.metrics import EXTRACT_SECONDS
+
+if TYPE_CHECKING:
+    from yt_dlp import YoutubeDL
 
 
 class BaseDownloader(ABC):
     """Abstract base class for all downloaders"""
 
-    def __init__(self, url: str):
+    def __init__(self, url: str, extractor: Optional[Callable[[str], Dict]] = None):
         self.url = url
+        self.extractor = extractor
         self.progress_hook = ProgressHook()
         self.youtube_dl_options: Dict = {}
-        self._youtube_dl: Optional[YoutubeDL] = None
+        self._youtube_dl: Optional['YoutubeDL'] = None
         self._info: Dict = {}
 
     @property
-    def youtube_dl(self) -> YoutubeDL:
+    def youtube_dl(self) -> 'YoutubeDL':
         """Lazy initialization of yt-dlp instance"""
         """Return the yt-dlp instance for downloading"""
         if not self._youtube_dl:
+            from yt_dlp import YoutubeDL
             self._youtube_dl = YoutubeDL(self.youtube_dl_options)
         return self._youtube_dl
 
     @youtube_dl.setter
-    def youtube_dl(self, value: YoutubeDL):
+    def youtube_dl(self, value: 'YoutubeDL'):
         """Set the yt-dlp instance"""
+        from yt_dlp import YoutubeDL
         if isinstance(value, YoutubeDL):
             self._youtube_dl = value
         else:
@@ -32,9 +39,17 @@ class BaseDownloader(ABC):
 
     @property
     def info(self) -> Dict:
-        """Get video information"""
+        """Get video information (from the info cache when possible)"""
         if not self._info:
-            self._info = self.youtube_dl.extract_info(self.url, download=False) or {}
+            cache = get_info_cache()
+            info = cache.get(self.url)
+            if info is None and self.extractor:
+                info = self.extractor(self.url)
+            if info is None:
+                with EXTRACT_SECONDS.time():
+                    info = self.youtube_dl.extract_info(self.url, download=False) or {}
+                cache.set(self.url, info)
+            self._info = info
         return self._info
 
     @info.setter
@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from downloaders.utils.info_cache import get_cache_key, get_info_cache
+from downloaders.utils.metrics import EXTRACT_SECONDS
+
+if TYPE_CHECKING:
+    from yt_dlp import YoutubeDL
+
+
+# Info keys the app never reads that can be large (captions alone are often MBs)
+HEAVY_INFO_KEYS = (
+    'automatic_captions',
+    'subtitles',
+    'requested_subtitles',
+    'heatmap',
+)
+
+# Each worker process keeps one YoutubeDL instance alive between extractions
+_worker_youtube_dl: Optional['YoutubeDL'] = None
+
+
+def slim_info(info: Dict) -> Dict:
+    """Drop bulky fields that are never used from an info dict"""
+    info = {key: value for key, value in info.items()
+            if key not in HEAVY_INFO_KEYS}
+    info['formats'] = [fmt for fmt in info.get('formats', [])
+                       if fmt.get('format_note') != 'storyboard']
+    return info
+
+
+def _init_worker(options: Dict):
+    """Create the long-lived yt-dlp instance of a worker process"""
+    global _worker_youtube_dl
+    from yt_dlp import YoutubeDL
+    _worker_youtube_dl = YoutubeDL(options)
+
+
+def _warm_up_worker() -> int:
+    """No-op task that forces a worker process to start"""
+    return os.getpid()
+
+
+def _extract_in_worker(url: str) -> Dict:
+    """Extract info in a worker process and return a picklable, slimmed dict"""
+    try:
+        info = _worker_youtube_dl.extract_info(url, download=False) or {}
+    except Exception as e:
+        # yt-dlp errors carry loggers and tracebacks that can't be pickled
+        raise RuntimeError(str(e)) from None
+    return slim_info(_worker_youtube_dl.sanitize_info(info))
+
+
+class ExtractionEngine:
+    """Run yt-dlp info extraction in a pool of warm worker processes"""
+
+    def __init__(self, max_workers: Optional[int] = None, options: Optional[Dict] = None):
+        self.max_workers = max(1, max_workers or os.cpu_count() or 1)
+        self.options = {
+            'quiet': True,
+            'no_warnings': True,
+            **(options or {}),
+        }
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending: Dict[str, Future] = {}  # Extractions in progress by cache key
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        """Lazy initialization of the worker pool"""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=_init_worker,
+                initargs=(self.options,),
+            )
+        return self._executor
+
+    def warm_up(self):
+        """Start every worker process ahead of the first request"""
+        futures = [self.executor.submit(_warm_up_worker)
+                   for _ in range(self.max_workers)]
+        for future in futures:
+            future.result()
+
+    def submit(self, url: str) -> Future:
+        """Start extracting info for a URL (served from the info cache when possible).
+        Requests for a video that is being extracted already share that extraction."""
+        cached = get_info_cache().get(url)
+        if cached is not None:
+            future: Future = Future()
+            future.set_result(cached)
+            return future
+
+        key = get_cache_key(url)
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                return future
+
+            start = time.perf_counter()
+
+            def store(done: Future):
+                EXTRACT_SECONDS.observe(time.perf_counter() - start)
+                if not done.cancelled() and done.exception() is None:
+                    get_info_cache().set(url, done.result())
+                with self._lock:
+                    if self._pending.get(key) is done:
+                        del self._pending[key]
+
+            future = self.executor.submit(_extract_in_worker, url)
+            self._pending[key] = future
+        future.add_done_callback(store)
+        return future
+
+    def extract_info(self, url: str, timeout: Optional[float] = None) -> Dict:
+        """Extract info for a URL and wait for the result"""
+        return self.submit(url).result(timeout)
+
+    def extract_many(self, urls: Iterable[str]) -> Iterator[Tuple[str, Union[Dict, Exception]]]:
+        """Extract info for many URLs, yielding (url, info or error) as each finishes"""
+        # URLs of the same video share one future
+        futures: Dict[Future, List[str]] = {}
+        for url in urls:
+            futures.setdefault(self.submit(url), []).append(url)
+        for future in as_completed(futures):
+            error = future.exception()
+            for url in futures[future]:
+                yield url, error if error is not None else future.result()
+
+    def shutdown(self, wait: bool = True):
+        """Stop the worker processes"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=not wait)
+            self._executor = None
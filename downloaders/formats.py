@@ -0,0 +1,141 @@
+from bisect import bisect_right
+from typing import Dict, List, Optional
+
+
+# Codec prefixes ffmpeg can stream-copy into each output container
+CONTAINER_CODECS = {
+    'mp4': {
+        'video': ('avc1', 'avc3', 'h264', 'hev1', 'hvc1', 'av01', 'vp09', 'vp9'),
+        'audio': ('mp4a', 'aac', 'ac-3', 'ec-3', 'mp3', 'opus'),
+    },
+    'm4a': {
+        'audio': ('mp4a', 'aac', 'alac'),
+    },
+    'webm': {
+        'video': ('vp8', 'vp9', 'vp09', 'av01'),
+        'audio': ('opus', 'vorbis'),
+    },
+}
+
+
+# File extension that holds an audio codec unchanged, by codec prefix
+AUDIO_CONTAINERS = {
+    'mp4a': 'm4a',
+    'aac': 'm4a',
+    'opus': 'opus',
+    'vorbis': 'ogg',
+    'mp3': 'mp3',
+}
+
+
+def get_audio_container(codec: Optional[str]) -> Optional[str]:
+    """Get the file extension that keeps an audio codec without re-encoding"""
+    for prefix, container in AUDIO_CONTAINERS.items():
+        if codec and codec.lower().startswith(prefix):
+            return container
+    return None
+
+
+def get_filesize(fmt: Dict) -> int:
+    """Get the exact or approximate size of a format in bytes (0 if unknown)"""
+    return fmt.get('filesize') or fmt.get('filesize_approx') or 0
+
+
+def is_codec_compatible(codec: Optional[str], container: str, kind: str) -> bool:
+    """Check if a codec can be stored in a container without re-encoding"""
+    codecs = CONTAINER_CODECS.get(container, {}).get(kind)
+    if codecs is None:
+        return True
+    return bool(codec) and codec.lower().startswith(codecs)
+
+
+class FormatIndex:
+    """Formats of one video, indexed once for lookups and constraint queries"""
+
+    def __init__(self, info: Dict):
+        self.info = info
+        self.by_id: Dict[str, Dict] = {}
+        video: List[Dict] = []
+        audio: List[Dict] = []
+
+        for f in info.get('formats', []):
+            if f.get('format_id'):
+                self.by_id[f['format_id']] = f
+
+            has_video = f.get('vcodec', 'none') != 'none'
+            has_audio = f.get('acodec', 'none') != 'none'
+            if has_video and not has_audio:
+                video.append(f)
+            elif has_audio and not has_video:
+                audio.append(f)
+
+        # Stable sorts keep yt-dlp's own preference order within a quality
+        self.video = sorted(video, key=lambda f: f.get('height') or 0)
+        self.audio = sorted(audio, key=lambda f: f.get('abr') or 0)
+        self._video_heights = [f.get('height') or 0 for f in self.video]
+        self._best_video = self._best_per_quality(self.video, 'height')
+        self._best_audio = self._best_per_quality(self.audio, 'abr')
+
+    @staticmethod
+    def _best_per_quality(formats: List[Dict], quality: str) -> List[Dict]:
+        """Keep one format per quality level, preferring ones with a known size"""
+        best: Dict[float, Dict] = {}
+        for f in formats:
+            level = f.get(quality) or 0
+            if level not in best or (not best[level].get('filesize') and f.get('filesize')):
+                best[level] = f
+        return list(best.values())
+
+    def get(self, format_id: str) -> Optional[Dict]:
+        """Get a format by its ID"""
+        return self.by_id.get(format_id)
+
+    def best_per_quality(self, is_video: bool = True) -> List[Dict]:
+        """Get one video format per height, or one audio format per bitrate"""
+        return list(self._best_video if is_video else self._best_audio)
+
+    def filter(self, kind: str = 'video', max_height: Optional[int] = None,
+               min_height: Optional[int] = None, container: Optional[str] = None,
+               max_filesize: Optional[int] = None, max_abr: Optional[float] = None) -> List[Dict]:
+        """Get the formats of a kind matching every given constraint, best first.
+
+        For video, max_filesize also counts the audio stream that gets merged in."""
+        if kind == 'video':
+            candidates = self.video[:bisect_right(self._video_heights, max_height)] \
+                if max_height else self.video
+            audio_size = 0
+            if max_filesize:
+                audio = self.merge_audio(container or 'mp4')
+                audio_size = get_filesize(audio) if audio else 0
+        else:
+            candidates = self.audio
+            audio_size = 0
+
+        matches = []
+        for f in reversed(candidates):
+            if min_height and (f.get('height') or 0) < min_height:
+                continue
+            if max_abr and (f.get('abr') or 0) > max_abr:
+                continue
+            if container and not is_codec_compatible(
+                    f.get('vcodec' if kind == 'video' else 'acodec'), container, kind):
+                continue
+            if max_filesize:
+                size = get_filesize(f)
+                if not size or size + audio_size > max_filesize:
+                    continue
+            matches.append(f)
+        return matches
+
+    def merge_audio(self, container: str = 'mp4') -> Optional[Dict]:
+        """Get the audio stream merged into a video-only format: AAC if there is
+        one (it plays everywhere mp4 does), else the best one the container can
+        hold, else the best one"""
+        return (self.query('audio', container='m4a')
+                or self.query('audio', container=container)
+                or self.query('audio'))
+
+    def query(self, kind: str = 'video', **constraints) -> Optional[Dict]:
+        """Get the best format of a kind matching every given constraint"""
+        matches = self.filter(kind, **constraints)
+        return matches[0] if matches else None
@@ -1,41 +1,207 @@
-from typing import Dict
+import math
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
 
 
-class ProgressHook:
-    """Track download progress"""
-
-    def __init__(self):
-        self.progress = {
-            'status': 'not_started',
-            'percentage': '0%',
-            'downloaded_bytes': 0,
-            'total_bytes': 0,
-            'speed': 0,
-            'filename': ''
+class ProgressSnapshot(NamedTuple):
+    """Immutable view of a download's progress at one moment"""
+    status: str
+    stage: Optional[str]  # video, audio, merge or postprocess
+    downloaded_bytes: int
+    total_bytes: int
+    speed: float  # Smoothed bytes/s
+    eta: Optional[float]  # Seconds
+    filename: str
+    error: Optional[str]
+
+    @property
+    def fraction(self) -> float:
+        """Completed part of the current stream, from 0 to 1"""
+        if not self.total_bytes:
+            return 0.0
+        return min(self.downloaded_bytes / self.total_bytes, 1.0)
+
+    def to_dict(self) -> Dict:
+        """Get the progress in the JSON shape served by the API"""
+        progress = {
+            'status': self.status,
+            'stage': self.stage,
+            'percentage': "{:.2f}%".format(self.fraction * 100),
+            'downloaded_bytes': self.downloaded_bytes,
+            'total_bytes': self.total_bytes,
+            'speed': self.speed,
+            'eta': self.eta,
+            'filename': self.filename,
         }
+        if self.error:
+            progress['error'] = self.error
+        return progress
+
+
+class ProgressHook:
+    """Track download progress.
+
+    yt-dlp calls the hook for every block it downloads, so the hot path only
+    stores raw counters. Throughput samples go into a fixed-size ring buffer
+    and watchers are notified at most every `min_interval` seconds. Speed
+    (an exponentially weighted moving average), ETA and the percentage are
+    only worked out when a snapshot is read."""
+
+    def __init__(self, min_interval: float = 0.1, speed_half_life: float = 3.0,
+                 sample_size: int = 64):
+        self.min_interval = min_interval
+        self.speed_half_life = speed_half_life
+        self.version = 0
+        self.fragmented = False
+        self.last_throughput: Optional[float] = None
+        self._lock = threading.Lock()
+        self._changed = threading.Condition()
+        # (time, downloaded bytes) of the current stream, overwritten in a circle
+        self._samples: List[Tuple[float, int]] = [(0.0, 0)] * max(2, sample_size)
+        self._snapshot: Optional[Tuple[int, ProgressSnapshot]] = None
+        # Called after every change; replaced rather than mutated so notify() needs no copy
+        self._listeners: Tuple[Callable[[], None], ...] = ()
+        self._clear()
+
+    def _clear(self):
+        """Forget the progress of the current stream (lock must be held)"""
+        self._status = 'not_started'
+        self._stage: Optional[str] = None
+        self._downloaded = 0
+        self._total = 0
+        self._filename = ''
+        self._error: Optional[str] = None
+        self._speed = 0.0
+        self._sample_count = 0
+        self._last_sample = 0.0
 
     def __call__(self, d: Dict):
         """Update progress from yt-dlp callback"""
-        if d['status'] == 'downloading':
-            self.progress['percentage'] = "{:.2f}%".format(
-                d.get('_percent', 0))
-            self.progress['downloaded_bytes'] = d.get('downloaded_bytes', 0)
-            self.progress['total_bytes'] = d.get('total_bytes', 0)
-            self.progress['speed'] = d.get('speed', 0)
-            self.progress['status'] = d.get('status', 'downloading')
+        status = d['status']
+        if status == 'downloading':
+            now = time.monotonic()
+            with self._lock:
+                self._downloaded = d.get('downloaded_bytes') or 0
+                self._total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+                new_stream = self._filename != d.get('filename', '')
+                if (not new_stream and self._status == 'downloading'
+                        and now - self._last_sample < self.min_interval):
+                    return
+
+                if new_stream:
+                    # A new stream (e.g. the audio after the video) starts over
+                    self._filename = d.get('filename', '')
+                    self._sample_count = 0
+                    self._speed = 0.0
+                    info = d.get('info_dict') or {}
+                    self._stage = 'video' if info.get('vcodec', 'none') != 'none' else 'audio'
+                self._status = 'downloading'
+                self.fragmented = 'fragment_count' in d
+                self._add_sample(now, self._downloaded)
+            self.notify()
+        elif status == 'finished':
+            with self._lock:
+                self._downloaded = d.get('downloaded_bytes') or self._downloaded
+                self._total = d.get('total_bytes') or self._total
+                self.last_throughput = self._throughput(d)
+            self.notify()
+
+    def _add_sample(self, now: float, downloaded: int):
+        """Store a sample in the ring buffer and update the smoothed speed (lock must be held)"""
+        if self._sample_count:
+            last_time, last_bytes = self._samples[(self._sample_count - 1) % len(self._samples)]
+            elapsed = now - last_time
+            if elapsed > 0 and downloaded >= last_bytes:
+                speed = (downloaded - last_bytes) / elapsed
+                # Weight by elapsed time, so irregular block intervals smooth the same way
+                weight = 1 - math.exp(-elapsed * math.log(2) / self.speed_half_life)
+                self._speed = speed if self._sample_count == 1 else \
+                    self._speed + weight * (speed - self._speed)
+        self._samples[self._sample_count % len(self._samples)] = (now, downloaded)
+        self._sample_count += 1
+        self._last_sample = now
+
+    def _throughput(self, finished: Optional[Dict] = None) -> Optional[float]:
+        """Get the speed of the current stream in bytes/s over the samples in the
+        ring buffer, or from the finished event when there are too few (lock must be held)"""
+        count = min(self._sample_count, len(self._samples))
+        if count >= 2:
+            oldest = (self._sample_count - count) % len(self._samples)
+            newest = (self._sample_count - 1) % len(self._samples)
+            (start, start_bytes), (end, end_bytes) = self._samples[oldest], self._samples[newest]
+            if end > start and end_bytes > start_bytes:
+                return (end_bytes - start_bytes) / (end - start)
+
+        if finished and finished.get('elapsed'):
+            return (finished.get('total_bytes') or finished.get('downloaded_bytes') or 0) / finished['elapsed']
+        return None
+
+    def snapshot(self) -> ProgressSnapshot:
+        """Get an immutable view of the progress (reused until it changes)"""
+        with self._lock:
+            cached = self._snapshot
+            if cached and cached[0] == self.version:
+                return cached[1]
+
+            remaining = self._total - self._downloaded
+            snapshot = ProgressSnapshot(
+                status=self._status,
+                stage=self._stage,
+                downloaded_bytes=self._downloaded,
+                total_bytes=self._total,
+                speed=self._speed,
+                eta=remaining / self._speed if self._speed and remaining > 0 else None,
+                filename=self._filename,
+                error=self._error,
+            )
+            self._snapshot = (self.version, snapshot)
+            return snapshot
+
+    @property
+    def progress(self) -> Dict:
+        """Get the current progress as a new dict"""
+        return self.snapshot().to_dict()
+
+    def set_stage(self, stage: str):
+        """Set the processing stage after the download (merge or postprocess)"""
+        with self._lock:
+            self._stage = stage
+        self.notify()
 
     def reset(self):
         """Reset progress to initial state"""
-        self.progress = {
-            'status': 'not_started',
-            'percentage': '0%',
-            'downloaded_bytes': 0,
-            'total_bytes': 0,
-            'speed': 0,
-            'filename': ''
-        }
+        with self._lock:
+            self._clear()
+        self.notify()
 
     def set_error(self, error_message: str):
         """Set error state"""
-        self.progress['status'] = 'error'
-        self.progress['error'] = error_message
+        with self._lock:
+            self._status = 'error'
+            self._error = error_message
+        self.notify()
+
+    def add_listener(self, listener: Callable[[], None]):
+        """Call `listener` from the notifying thread each time the progress changes"""
+        with self._lock:
+            self._listeners = (*self._listeners, listener)
+
+    def remove_listener(self, listener: Callable[[], None]):
+        """Stop calling a listener added with add_listener()"""
+        with self._lock:
+            self._listeners = tuple(item for item in self._listeners if item is not listener)
+
+    def notify(self):
+        """Signal watchers that the progress has changed"""
+        with self._changed:
+            self.version += 1
+            self._changed.notify_all()
+        for listener in self._listeners:
+            listener()
+
+    def wait_for_change(self, version: int, timeout: float) -> bool:
+        """Wait until the progress changes past the given version.
+        :return: True if it changed, False on timeout."""
+        with self._changed:
+            return self._changed.wait_for(lambda: self.version != version, timeout)
@@ -0,0 +1,85 @@
+import threading
+from typing import Dict, Optional
+
+
+class TransferTuner:
+    """Tune fragment parallelism and HTTP chunk size from measured throughput.
+
+    Every finished stream is compared with the previous stream of the same kind
+    (fragmented DASH/HLS or plain HTTP): while throughput improves the setting
+    keeps moving the same way, when it drops the direction is reversed, and it
+    holds steady when the difference is within the tolerance."""
+
+    def __init__(self, fragments: int = 4, min_fragments: int = 1, max_fragments: int = 16,
+                 chunk_size: int = 10 * 1024 * 1024, min_chunk_size: int = 1024 * 1024,
+                 max_chunk_size: int = 64 * 1024 * 1024, buffer_size: int = 64 * 1024,
+                 tolerance: float = 0.1):
+        self.min_fragments = max(1, min_fragments)
+        self.max_fragments = max(self.min_fragments, max_fragments)
+        self.min_chunk_size = max(1, min_chunk_size)
+        self.max_chunk_size = max(self.min_chunk_size, max_chunk_size)
+        self.fragments = self._clamp(fragments, self.min_fragments, self.max_fragments)
+        self.chunk_size = self._clamp(chunk_size, self.min_chunk_size, self.max_chunk_size)
+        self.buffer_size = buffer_size
+        self.tolerance = tolerance
+        self._last_throughput: Dict[str, float] = {}
+        self._direction = {'fragments': 1, 'chunk_size': 1}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _clamp(value: int, low: int, high: int) -> int:
+        return max(low, min(high, int(value)))
+
+    def options(self) -> Dict[str, int]:
+        """Get the current yt-dlp download options"""
+        with self._lock:
+            return self._options()
+
+    def _options(self) -> Dict[str, int]:
+        return {
+            'concurrent_fragment_downloads': self.fragments,
+            'http_chunk_size': self.chunk_size,
+            'buffersize': self.buffer_size,
+        }
+
+    def record(self, throughput: Optional[float], fragmented: bool) -> Dict[str, int]:
+        """Feed the throughput (bytes/s) of a finished stream.
+        :return: The options to use for the next stream."""
+        setting = 'fragments' if fragmented else 'chunk_size'
+        with self._lock:
+            if not throughput:
+                return self._options()
+
+            last = self._last_throughput.get(setting)
+            self._last_throughput[setting] = throughput
+            if last is not None:
+                if throughput < last * (1 - self.tolerance):
+                    self._direction[setting] = -self._direction[setting]
+                elif throughput <= last * (1 + self.tolerance):
+                    return self._options()  # No clear difference, keep the setting
+
+            if setting == 'fragments':
+                step = self.fragments * 2 if self._direction[setting] > 0 else self.fragments // 2
+                self.fragments = self._clamp(step, self.min_fragments, self.max_fragments)
+            else:
+                step = self.chunk_size * 2 if self._direction[setting] > 0 else self.chunk_size // 2
+                self.chunk_size = self._clamp(step, self.min_chunk_size, self.max_chunk_size)
+            return self._options()
+
+
+_transfer_tuner: Optional[TransferTuner] = None
+
+
+def get_transfer_tuner() -> TransferTuner:
+    """Get the shared transfer tuner"""
+    global _transfer_tuner
+    if _transfer_tuner is None:
+        _transfer_tuner = TransferTuner()
+    return _transfer_tuner
+
+
+def configure_transfer_tuner(**kwargs) -> TransferTuner:
+    """Replace the shared transfer tuner with one using the given settings"""
+    global _transfer_tuner
+    _transfer_tuner = TransferTuner(**kwargs)
+    return _transfer_tuner
@@ -1,14 +1,20 @@
+import json
 import os
 import re
 import shutil
 import platform
 import tempfile
-import requests
-import urllib.request
 import subprocess
 import sys
-import zipfile
 from pathlib import Path
+from typing import Dict, List, Optional
+
+from downloaders.utils.file_utils import get_downloader_paths
+
+
+# Resolved FFmpeg binary and the result of probing it
+_ffmpeg_path: Optional[str] = None
+_ffmpeg_probe: Optional[Dict] = None
 
 
 def get_system_ffmpeg_path() -> str:
@@ -120,7 +126,16 @@ def _add_to_unix_path(ffmpeg_dir: str) -> bool:
 
 
 def get_ffmpeg_path() -> str:
-    """Get FFmpeg executable path"""
+    """Get FFmpeg executable path (resolved once, and again only if the binary
+    disappears; a missing FFmpeg is looked up again so a later install is found)"""
+    global _ffmpeg_path
+    if _ffmpeg_path is None or not os.path.isfile(_ffmpeg_path):
+        _ffmpeg_path = find_ffmpeg_path()
+    return _ffmpeg_path
+
+
+def find_ffmpeg_path() -> str:
+    """Search the system PATH and the install directory for FFmpeg"""
     # First check if ffmpeg is in system PATH
     ffmpeg_path = get_system_ffmpeg_path()
     if ffmpeg_path:
@@ -141,6 +156,48 @@ def get_ffmpeg_path() -> str:
     return None
 
 
+def probe_ffmpeg() -> Optional[Dict[str, str]]:
+    """Get the path and version of FFmpeg, or None if it doesn't run.
+    `ffmpeg -version` only runs when the binary changed (by path, size and
+    modification time) since the last probe, which is kept in the data folder."""
+    global _ffmpeg_probe
+    path = get_ffmpeg_path()
+    if not path:
+        return None
+
+    stat = os.stat(path)
+    key = {'path': path, 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+    if _ffmpeg_probe and _ffmpeg_probe['key'] == key:
+        return _ffmpeg_probe['probe']
+
+    cache_path = os.path.join(get_downloader_paths()['data'], 'ffmpeg_probe.json')
+    try:
+        with open(cache_path, encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get('key') == key:
+            _ffmpeg_probe = cached
+            return cached['probe']
+    except (OSError, ValueError):
+        pass
+
+    result = subprocess.run([path, '-version'], capture_output=True, text=True, timeout=10)
+    if result.returncode != 0:
+        return None
+    match = re.search(r'ffmpeg version (\S+)', result.stdout)
+    _ffmpeg_probe = {'key': key, 'probe': {
+        'path': path, 'version': match.group(1) if match else 'unknown'}}
+
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        temp_path = f'{cache_path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(_ffmpeg_probe, f)
+        os.replace(temp_path, cache_path)
+    except OSError as e:
+        print(f"[FFmpeg] Could not save probe result: {e}")
+    return _ffmpeg_probe['probe']
+
+
 def download_ffmpeg(install_dir: str = None) -> str:
     """Download and extract FFmpeg to system directory"""
     install_dir = install_dir or get_ffmpeg_install_dir()
@@ -153,6 +210,8 @@ def download_ffmpeg(install_dir: str = None) -> str:
 
         # Download and extract
         print("Downloading FFmpeg...")
+        import requests
+        import zipfile
         try:
             response = requests.get(ffmpeg_url, stream=True)
             response.raise_for_status()
@@ -241,10 +300,9 @@ def ensure_ffmpeg_available() -> bool:
 def verify_ffmpeg_installation() -> bool:
     """Verify that FFmpeg is properly installed and accessible"""
     try:
-        result = subprocess.run(['ffmpeg', '-version'],
-                                capture_output=True, text=True, timeout=10)
-        if result.returncode == 0:
-            print("FFmpeg verification successful")
+        probe = probe_ffmpeg()
+        if probe:
+            print(f"FFmpeg verification successful (version {probe['version']})")
             return True
         else:
             print("FFmpeg verification failed")
@@ -252,3 +310,93 @@ def verify_ffmpeg_installation() -> bool:
     except (subprocess.TimeoutExpired, FileNotFoundError, Exception) as e:
         print(f"FFmpeg verification error: {e}")
         return False
+
+
+# Containers whose ffmpeg muxer can store cover art as an attached picture
+ATTACHED_COVER_CONTAINERS = ('mp3', 'm4a', 'mp4')
+
+
+def run_ffmpeg(args: List[str], input_data: Optional[bytes] = None,
+               threads: Optional[int] = None, nice: Optional[int] = None):
+    """Run ffmpeg with the given arguments, raising on failure.
+    :param threads: Most threads ffmpeg may use for encoding (default: its own choice).
+    :param nice: Nice level of the ffmpeg process, so it yields the CPU to the app."""
+    if threads:
+        # Output options go right before the destination, the last argument
+        args = [*args[:-1], '-threads', str(threads), args[-1]]
+    command = [get_ffmpeg_path() or 'ffmpeg', '-y',
+               '-hide_banner', '-loglevel', 'error', *args]
+
+    creationflags = 0
+    if nice and platform.system() == "Windows":
+        creationflags = subprocess.BELOW_NORMAL_PRIORITY_CLASS
+
+    process = subprocess.Popen(command, stdin=subprocess.PIPE if input_data else None,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               creationflags=creationflags)
+    if nice and hasattr(os, 'setpriority'):
+        try:
+            os.setpriority(os.PRIO_PROCESS, process.pid, nice)
+        except OSError:
+            pass  # The process may already have exited
+    _, stderr = process.communicate(input_data)
+
+    if process.returncode != 0:
+        message = stderr.decode('utf-8', errors='replace').strip()
+        raise RuntimeError(f"ffmpeg failed: {message.splitlines()[-1] if message else process.returncode}")
+
+
+def build_merge_command(video: str, audio: Optional[str], destination: str,
+                        ffmpeg_args: Optional[List[str]] = None,
+                        with_cover: bool = False) -> List[str]:
+    """Build the ffmpeg arguments that merge separately downloaded video and
+    audio streams and (read from stdin as JPEG) the cover art in a single
+    pass, copying the streams unless ffmpeg_args asks for re-encoding"""
+    args = ['-i', video]
+    if audio:
+        args += ['-i', audio]
+    if with_cover:
+        args += ['-f', 'jpeg_pipe', '-i', 'pipe:0']
+
+    args += ['-map', '0:v:0']
+    if audio:
+        args += ['-map', '1:a:0']
+    args += ['-c', 'copy', *(ffmpeg_args or [])]
+
+    if with_cover:
+        # After ffmpeg_args, so a re-encoded video stream leaves the cover as it is
+        args += ['-map', f'{2 if audio else 1}:v:0', '-c:v:1', 'copy',
+                 '-disposition:v:1', 'attached_pic']
+
+    # No -movflags +faststart: it rewrites the whole file to move the index
+    # to the front, which only matters for streaming over HTTP
+    return args + [destination]
+
+
+def build_audio_command(source: str, destination: str, codec: str = 'copy',
+                        bitrate: Optional[str] = None, metadata: Optional[Dict[str, str]] = None,
+                        with_cover: bool = False) -> List[str]:
+    """Build the ffmpeg arguments that write an audio file, its tags and
+    (read from stdin as JPEG) its cover art in a single pass"""
+    args = ['-i', source]
+    if with_cover:
+        args += ['-f', 'jpeg_pipe', '-i', 'pipe:0']
+
+    args += ['-map', '0:a:0', '-c:a', codec]
+    if bitrate:
+        args += ['-b:a', bitrate]
+
+    if with_cover:
+        args += ['-map', '1:v:0', '-c:v', 'copy', '-disposition:v:0', 'attached_pic',
+                 '-metadata:s:v', 'title=Album cover', '-metadata:s:v', 'comment=Cover (front)']
+
+    # Drop the source's own tags and write ours instead
+    args += ['-map_metadata', '-1']
+    for key, value in (metadata or {}).items():
+        args += ['-metadata', f'{key}={value}']
+
+    if destination.lower().endswith('.mp3'):
+        args += ['-id3v2_version', '3']
+    # No -movflags +faststart for m4a either, as in build_merge_command
+
+    return args + [destination]
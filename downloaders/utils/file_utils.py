@@ -1,22 +1,29 @@
 import os
 import platform
 import re
-from typing import Dict
+from types import MappingProxyType
+from typing import Mapping, Optional
 
 from downloaders.utils import raise_on_error
 
 
-def get_downloader_paths() -> Dict[str, str]:
-    """Get download paths for different file types"""
-    base_path = get_base_download_path()
+_downloader_paths: Optional[Mapping[str, str]] = None
 
-    return {
-        'home': base_path,
-        'video': os.path.join(base_path, 'Video'),
-        'audio': os.path.join(base_path, 'Audio'),
-        'thumbnail': os.path.join(base_path, '.thumbnails'),
-        'temp': os.path.join(base_path, '.temp'),
-    }
+
+def get_downloader_paths() -> Mapping[str, str]:
+    """Get download paths for different file types (resolved once, read-only)"""
+    global _downloader_paths
+    if _downloader_paths is None:
+        base_path = get_base_download_path()
+        _downloader_paths = MappingProxyType({
+            'home': base_path,
+            'video': os.path.join(base_path, 'Video'),
+            'audio': os.path.join(base_path, 'Audio'),
+            'thumbnail': os.path.join(base_path, '.thumbnails'),
+            'temp': os.path.join(base_path, '.temp'),
+            'data': os.path.join(base_path, '.data'),
+        })
+    return _downloader_paths
 
 
 def get_base_download_path() -> str:
@@ -104,6 +111,6 @@ def prepare_output_template(format_obj: dict, is_video: bool = True) -> str:
     filetype = 'video' if is_video else 'audio'
     abs_path = get_downloader_paths()[filetype]
     if is_video:
-        return os.path.join(abs_path, f'{format_obj['title']} ({format_obj['height']}p).{format_obj["ext"]}')
+        return os.path.join(abs_path, f'{format_obj["title"]} ({format_obj["height"]}p).{format_obj["ext"]}')
     else:
-        return os.path.join(abs_path, f'{format_obj['title']}.{format_obj["ext"]}')
+        return os.path.join(abs_path, f'{format_obj["title"]}.{format_obj["ext"]}')
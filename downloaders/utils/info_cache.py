@@ -0,0 +1,189 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from app.utils.validators import extract_video_id
+from downloaders.utils.file_utils import get_downloader_paths
+
+
+# Stop serving an entry this long before its stream URLs expire
+EXPIRY_MARGIN = 5 * 60
+
+
+def get_cache_key(url: str) -> str:
+    """Get the canonical cache key for a URL (the video ID when available)"""
+    return extract_video_id(url) or url
+
+
+def get_formats_expiry(info: Dict) -> Optional[float]:
+    """Get the earliest 'expire' timestamp found in the format URLs"""
+    expiry = None
+    for fmt in info.get('formats', []):
+        query = parse_qs(urlparse(fmt.get('url', '')).query)
+        value = (query.get('expire') or [None])[0]
+        if value is None:
+            # Some manifests carry the parameter in the path instead
+            match = re.search(r'/expire/(\d+)', fmt.get('url', ''))
+            value = match.group(1) if match else None
+        if value and value.isdigit():
+            expiry = min(expiry or int(value), int(value))
+    return expiry
+
+
+class InfoCache:
+    """Cache yt-dlp info dicts in an in-memory LRU backed by SQLite"""
+
+    def __init__(self, db_path: Optional[str] = None, ttl: int = 3 * 60 * 60,
+                 max_memory_entries: int = 64, max_disk_entries: int = 1000):
+        self.db_path = db_path or os.path.join(
+            get_downloader_paths()['data'], 'info_cache.sqlite3')
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory: OrderedDict[str, Tuple[float, Dict]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Lazy initialization of the SQLite connection"""
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._connection = sqlite3.connect(
+                self.db_path, check_same_thread=False)
+            self._connection.execute('''
+                CREATE TABLE IF NOT EXISTS info (
+                    key TEXT PRIMARY KEY,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    data BLOB NOT NULL
+                )''')
+            self._connection.execute(
+                'CREATE INDEX IF NOT EXISTS info_accessed ON info (accessed_at)')
+            self._connection.commit()
+        return self._connection
+
+    def get(self, url: str) -> Optional[Dict]:
+        """Get cached info for a URL, or None if missing or expired"""
+        key = get_cache_key(url)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry:
+                expires_at, info = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    return info
+                del self._memory[key]
+
+            try:
+                row = self.connection.execute(
+                    'SELECT expires_at, data FROM info WHERE key = ?', (key,)).fetchone()
+                if not row:
+                    return None
+                expires_at, data = row
+                if expires_at <= now:
+                    self.connection.execute(
+                        'DELETE FROM info WHERE key = ?', (key,))
+                    self.connection.commit()
+                    return None
+                info = json.loads(zlib.decompress(data))
+                self.connection.execute(
+                    'UPDATE info SET accessed_at = ? WHERE key = ?', (now, key))
+                self.connection.commit()
+            except (sqlite3.Error, zlib.error, ValueError) as e:
+                print(f"[InfoCache] Could not read cache entry: {e}")
+                return None
+
+            self._remember(key, expires_at, info)
+            return info
+
+    def set(self, url: str, info: Dict):
+        """Store info for a URL"""
+        if not info:
+            return
+
+        from yt_dlp import YoutubeDL
+        info = YoutubeDL.sanitize_info(info)
+        now = time.time()
+        expires_at = now + self.ttl
+        formats_expiry = get_formats_expiry(info)
+        if formats_expiry:
+            expires_at = min(expires_at, formats_expiry - EXPIRY_MARGIN)
+        if expires_at <= now:
+            return
+
+        key = get_cache_key(url)
+        data = zlib.compress(json.dumps(info).encode('utf-8'))
+
+        with self._lock:
+            self._remember(key, expires_at, info)
+            try:
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO info (key, expires_at, accessed_at, data) VALUES (?, ?, ?, ?)',
+                    (key, expires_at, now, data))
+                self._evict_disk(now)
+                self.connection.commit()
+            except sqlite3.Error as e:
+                print(f"[InfoCache] Could not write cache entry: {e}")
+
+    def invalidate(self, url: str):
+        """Drop the cached info for a URL"""
+        key = get_cache_key(url)
+        with self._lock:
+            self._memory.pop(key, None)
+            try:
+                self.connection.execute(
+                    'DELETE FROM info WHERE key = ?', (key,))
+                self.connection.commit()
+            except sqlite3.Error as e:
+                print(f"[InfoCache] Could not delete cache entry: {e}")
+
+    def clear(self):
+        """Drop every cached entry"""
+        with self._lock:
+            self._memory.clear()
+            self.connection.execute('DELETE FROM info')
+            self.connection.commit()
+
+    def _remember(self, key: str, expires_at: float, info: Dict):
+        """Put an entry in the in-memory LRU (lock must be held)"""
+        self._memory[key] = (expires_at, info)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self, now: float):
+        """Remove expired and least recently used rows (lock must be held)"""
+        self.connection.execute(
+            'DELETE FROM info WHERE expires_at <= ?', (now,))
+        self.connection.execute('''
+            DELETE FROM info WHERE key IN (
+                SELECT key FROM info ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+            )''', (self.max_disk_entries,))
+
+
+_info_cache: Optional[InfoCache] = None
+
+
+def get_info_cache() -> InfoCache:
+    """Get the shared info cache"""
+    global _info_cache
+    if _info_cache is None:
+        _info_cache = InfoCache()
+    return _info_cache
+
+
+def configure_info_cache(**kwargs) -> InfoCache:
+    """Replace the shared info cache with one using the given settings"""
+    global _info_cache
+    _info_cache = InfoCache(**kwargs)
+    return _info_cache
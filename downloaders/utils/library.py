@@ -0,0 +1,461 @@
+import base64
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import IO, Dict, Iterator, List, Optional, Set, Tuple
+
+from downloaders.utils.file_utils import get_downloader_paths
+
+
+# Files that are never finished downloads
+SKIPPED_SUFFIXES = ('.part', '.ytdl', '.tmp', '.temp')
+
+LibraryKey = Tuple[str, str, str]  # (video ID, format ID, output container)
+
+# Columns the library can be sorted by
+SORT_COLUMNS = {
+    'date': 'mtime',
+    'size': 'size',
+    'title': 'title',
+}
+
+
+@contextmanager
+def locked_file(f: IO) -> Iterator[IO]:
+    """Hold an exclusive lock on an open file, shared with other processes"""
+    if os.name == 'nt':
+        import msvcrt
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield f
+        finally:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield f
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def read_tags(path: str) -> Dict[str, Optional[str]]:
+    """Read the title, artist and album tags of a media file (missing ones are None)"""
+    import mutagen
+    try:
+        media = mutagen.File(path, easy=True)
+    except Exception:
+        media = None
+
+    tags = {}
+    for key in ('title', 'artist', 'album'):
+        values = media.get(key) if media is not None and media.tags is not None else None
+        tags[key] = values[0] if values else None
+    return tags
+
+
+def to_fts_query(search: str) -> Optional[str]:
+    """Turn free text into an FTS query matching every word as a prefix"""
+    words = re.findall(r'\w+', search)
+    return ' '.join(f'"{word}"*' for word in words) or None
+
+
+class LibraryIndex:
+    """Persistent index of downloaded files, keyed by video ID, format and
+    output container, so finding an existing download takes one dict lookup.
+
+    Files found on disk that weren't downloaded by the app are tracked by path
+    only. The video IDs are also kept in a yt-dlp download archive
+    ("<extractor> <id>" per line) that can be shared with the yt-dlp CLI."""
+
+    def __init__(self, db_path: Optional[str] = None, archive_path: Optional[str] = None,
+                 refresh_interval: float = 5.0):
+        data_path = get_downloader_paths()['data']
+        self.db_path = db_path or os.path.join(data_path, 'library.sqlite3')
+        self.archive_path = archive_path or os.path.join(data_path, 'archive.txt')
+        self.refresh_interval = refresh_interval  # Least seconds between refresh_if_stale() scans
+        self._refreshed_at: Optional[float] = None
+        self._by_key: Dict[LibraryKey, Dict] = {}
+        self._by_path: Dict[str, Dict] = {}
+        self._archive: Set[str] = set()
+        self._data_version: Optional[int] = None  # Database changes by other processes, as last seen
+        self._archive_stamp: Optional[Tuple[int, int]] = None  # (mtime, size) of the archive as last read
+        self._lock = threading.RLock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Lazy initialization of the SQLite connection and the in-memory index"""
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._connection = sqlite3.connect(
+                self.db_path, check_same_thread=False)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('''
+                CREATE TABLE IF NOT EXISTS library (
+                    path TEXT PRIMARY KEY,
+                    video_id TEXT,
+                    format_id TEXT,
+                    container TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    extractor TEXT,
+                    title TEXT,
+                    artist TEXT,
+                    album TEXT,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    added_at REAL NOT NULL
+                )''')
+            self._connection.execute(
+                'CREATE INDEX IF NOT EXISTS library_video ON library (video_id, format_id, container)')
+            for column in SORT_COLUMNS.values():
+                self._connection.execute(
+                    f'CREATE INDEX IF NOT EXISTS library_{column} ON library ({column}, path)')
+            self._connection.execute('''
+                CREATE TABLE IF NOT EXISTS folders (
+                    path TEXT PRIMARY KEY,
+                    mtime REAL NOT NULL
+                )''')
+            self._create_search_index()
+            self._connection.commit()
+            self._load()
+        return self._connection
+
+    def _create_search_index(self):
+        """Create the full-text index of titles, artists and albums, kept in
+        sync with the library table by triggers"""
+        exists = self._connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'library_fts'").fetchone()
+        if exists:
+            return
+
+        self._connection.executescript('''
+            CREATE VIRTUAL TABLE library_fts USING fts5(
+                title, artist, album, content='library', content_rowid='rowid');
+            CREATE TRIGGER library_ai AFTER INSERT ON library BEGIN
+                INSERT INTO library_fts (rowid, title, artist, album)
+                VALUES (new.rowid, new.title, new.artist, new.album);
+            END;
+            CREATE TRIGGER library_ad AFTER DELETE ON library BEGIN
+                INSERT INTO library_fts (library_fts, rowid, title, artist, album)
+                VALUES ('delete', old.rowid, old.title, old.artist, old.album);
+            END;
+            CREATE TRIGGER library_au AFTER UPDATE OF title, artist, album ON library BEGIN
+                INSERT INTO library_fts (library_fts, rowid, title, artist, album)
+                VALUES ('delete', old.rowid, old.title, old.artist, old.album);
+                INSERT INTO library_fts (rowid, title, artist, album)
+                VALUES (new.rowid, new.title, new.artist, new.album);
+            END;
+            INSERT INTO library_fts (library_fts) VALUES ('rebuild');
+        ''')
+
+    def _ensure_loaded(self):
+        """Open the database and load the index on first use, and load it
+        again when another process (e.g. another server worker) changed the
+        database or the archive since (lock must be held)"""
+        connection = self.connection
+        if connection.execute('PRAGMA data_version').fetchone()[0] != self._data_version:
+            self._by_key.clear()
+            self._by_path.clear()
+            self._load()
+        elif self._get_archive_stamp() != self._archive_stamp:
+            self._load_archive()
+
+    def _load(self):
+        """Read the whole index and the download archive into memory"""
+        # Changes only when another connection commits
+        self._data_version = self._connection.execute('PRAGMA data_version').fetchone()[0]
+        cursor = self._connection.execute('SELECT * FROM library')
+        columns = [column[0] for column in cursor.description]
+        for row in cursor.fetchall():
+            self._remember(dict(zip(columns, row)))
+        self._load_archive()
+
+    def _get_archive_stamp(self) -> Optional[Tuple[int, int]]:
+        """Get the mtime and size of the archive, which change with every append"""
+        try:
+            stat = os.stat(self.archive_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load_archive(self):
+        """Read the download archive into memory (lock must be held)"""
+        self._archive_stamp = self._get_archive_stamp()
+        try:
+            with open(self.archive_path, 'r', encoding='utf-8') as f:
+                self._archive = {line.strip() for line in f if line.strip()}
+        except FileNotFoundError:
+            self._archive = set()
+
+    def _remember(self, entry: Dict):
+        """Add an entry to the in-memory maps (lock must be held)"""
+        self._by_path[entry['path']] = entry
+        if entry['video_id']:
+            self._by_key[(entry['video_id'], entry['format_id'], entry['container'])] = entry
+
+    def _forget(self, path: str):
+        """Remove an entry from the in-memory maps (lock must be held)"""
+        entry = self._by_path.pop(path, None)
+        if entry and entry['video_id']:
+            key = (entry['video_id'], entry['format_id'], entry['container'])
+            if self._by_key.get(key) is entry:
+                del self._by_key[key]
+
+    def lookup(self, video_id: str, format_id: str, container: str) -> Optional[Dict]:
+        """Get the downloaded file of a video in a format and container, if there is one"""
+        with self._lock:
+            self._ensure_loaded()
+            return self._by_key.get((video_id, format_id, container))
+
+    def owner(self, path: str) -> Optional[str]:
+        """Get the video ID a file was downloaded for (None if unknown or untracked)"""
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._by_path.get(os.path.abspath(path))
+            return entry['video_id'] if entry else None
+
+    def in_archive(self, video_id: str, extractor: str = 'youtube') -> bool:
+        """Check if a video is in the download archive"""
+        with self._lock:
+            self._ensure_loaded()
+            return f'{extractor.lower()} {video_id}' in self._archive
+
+    def add(self, path: str, video_id: Optional[str] = None, format_id: Optional[str] = None,
+            extractor: Optional[str] = 'youtube', title: Optional[str] = None,
+            artist: Optional[str] = None, album: Optional[str] = None) -> Dict:
+        """Record a finished download (or an existing file) in the index"""
+        entry = self._make_entry(os.path.abspath(path), os.stat(path), video_id, format_id,
+                                 extractor, title, artist, album)
+        with self._lock:
+            self._store(entry)
+            self.connection.commit()
+            if video_id and extractor:
+                self._add_to_archive(f'{extractor.lower()} {video_id}')
+        return entry
+
+    def _make_entry(self, path: str, stat: os.stat_result, video_id: Optional[str] = None,
+                    format_id: Optional[str] = None, extractor: Optional[str] = None,
+                    title: Optional[str] = None, artist: Optional[str] = None,
+                    album: Optional[str] = None) -> Dict:
+        """Build an index entry for a file"""
+        return {
+            'path': path,
+            'video_id': video_id,
+            'format_id': format_id,
+            'container': os.path.splitext(path)[1].lstrip('.').lower(),
+            'kind': self._kind_of(path),
+            'extractor': extractor if video_id else None,
+            'title': title or os.path.splitext(os.path.basename(path))[0],
+            'artist': artist,
+            'album': album,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'added_at': time.time(),
+        }
+
+    def _store(self, entry: Dict):
+        """Write an entry without committing (lock must be held)"""
+        updates = ', '.join(f'{column} = excluded.{column}' for column in entry if column != 'path')
+        self.connection.execute(
+            f'INSERT INTO library ({", ".join(entry)}) VALUES ({", ".join("?" * len(entry))}) '
+            f'ON CONFLICT (path) DO UPDATE SET {updates}',
+            tuple(entry.values()))
+        self._forget(entry['path'])
+        self._remember(entry)
+
+    def place(self, source: str, destination: str):
+        """Move a finished file into a library folder. If the folder hadn't
+        changed since it was last scanned, its recorded mtime follows the move,
+        so the next refresh() doesn't rescan it for this file."""
+        folder = os.path.abspath(os.path.dirname(destination))
+        os.makedirs(folder, exist_ok=True)
+        before = os.stat(folder).st_mtime
+        shutil.move(source, destination)
+        after = os.stat(folder).st_mtime
+        with self._lock:
+            # Any other change made since the last scan leaves the old mtime,
+            # so refresh() still picks it up
+            self.connection.execute('UPDATE folders SET mtime = ? WHERE path = ? AND mtime = ?',
+                                    (after, folder, before))
+            self.connection.commit()
+
+    def remove(self, path: str):
+        """Forget a file"""
+        path = os.path.abspath(path)
+        with self._lock:
+            self.connection.execute('DELETE FROM library WHERE path = ?', (path,))
+            self.connection.commit()
+            self._forget(path)
+
+    def _add_to_archive(self, line: str):
+        """Append a video to the download archive (lock must be held)"""
+        if line in self._archive:
+            return
+        with open(self.archive_path, 'a', encoding='utf-8') as f, locked_file(f):
+            # Another process may have added it since the archive was read
+            if self._get_archive_stamp() != self._archive_stamp:
+                self._load_archive()
+            if line not in self._archive:
+                f.write(line + '\n')
+                f.flush()
+                self._archive.add(line)
+            self._archive_stamp = self._get_archive_stamp()
+
+    @staticmethod
+    def _kind_of(path: str) -> str:
+        """Get whether a file lives in the Video or the Audio folder"""
+        video_path = os.path.abspath(get_downloader_paths()['video'])
+        return 'video' if os.path.dirname(path) == video_path else 'audio'
+
+    def refresh(self, force: bool = False) -> Dict[str, int]:
+        """Bring the index up to date with the Video and Audio folders.
+        Folders whose mtime hasn't changed since the last refresh are skipped
+        (adding, removing or renaming a file changes it), and in the others only
+        new, changed (size or mtime) or gone files are written.
+        :param force: Scan every folder, e.g. to pick up files edited in place.
+        :return: Counts of added, updated and removed files."""
+        counts = {'added': 0, 'updated': 0, 'removed': 0}
+        paths = get_downloader_paths()
+        with self._lock:
+            # Files another process indexed must not be taken for unknown ones
+            self._ensure_loaded()
+            connection = self.connection
+            for folder in (paths['video'], paths['audio']):
+                folder = os.path.abspath(folder)
+                try:
+                    folder_mtime = os.stat(folder).st_mtime
+                except FileNotFoundError:
+                    folder_mtime = None
+
+                row = connection.execute(
+                    'SELECT mtime FROM folders WHERE path = ?', (folder,)).fetchone()
+                if not force and folder_mtime is not None and row and row[0] == folder_mtime:
+                    continue
+
+                self._refresh_folder(folder, counts)
+                if folder_mtime is not None:
+                    connection.execute('INSERT OR REPLACE INTO folders (path, mtime) VALUES (?, ?)',
+                                       (folder, folder_mtime))
+            connection.commit()
+        return counts
+
+    def refresh_if_stale(self) -> Optional[Dict[str, int]]:
+        """refresh() unless it ran less than refresh_interval seconds ago, so
+        files deleted or moved outside the app drop out of listings soon
+        without every request checking the folders.
+        :return: The refresh counts, or None if it was skipped."""
+        now = time.monotonic()
+        with self._lock:
+            if self._refreshed_at is not None and now - self._refreshed_at < self.refresh_interval:
+                return None
+            self._refreshed_at = now
+            return self.refresh()
+
+    def _refresh_folder(self, folder: str, counts: Dict[str, int]):
+        """Sync the entries of one folder with its files (lock must be held)"""
+        seen = set()
+        try:
+            dir_entries = list(os.scandir(folder))
+        except FileNotFoundError:
+            dir_entries = []
+
+        for dir_entry in dir_entries:
+            if (not dir_entry.is_file() or dir_entry.name.startswith('.')
+                    or dir_entry.name.endswith(SKIPPED_SUFFIXES)):
+                continue
+
+            path = os.path.abspath(dir_entry.path)
+            seen.add(path)
+            stat = dir_entry.stat()
+            entry = self._by_path.get(path)
+            if entry is None:
+                self._store(self._make_entry(path, stat, **read_tags(path)))
+                counts['added'] += 1
+            elif entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+                entry.update(size=stat.st_size, mtime=stat.st_mtime)
+                self.connection.execute('UPDATE library SET size = ?, mtime = ? WHERE path = ?',
+                                        (stat.st_size, stat.st_mtime, path))
+                counts['updated'] += 1
+
+        gone = [path for path in self._by_path
+                if os.path.dirname(path) == folder and path not in seen]
+        for path in gone:
+            self.connection.execute('DELETE FROM library WHERE path = ?', (path,))
+            self._forget(path)
+            counts['removed'] += 1
+
+    def query(self, search: Optional[str] = None, kind: Optional[str] = None,
+              sort: str = 'date', descending: bool = True, limit: int = 50,
+              cursor: Optional[str] = None) -> Dict:
+        """Get one page of the library, optionally filtered by a full-text search
+        over title, artist and album. Pages are addressed by an opaque cursor
+        (keyset pagination), so deep pages cost the same as the first.
+        :return: The page items and the cursor of the next page (None on the last)."""
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"Sort must be one of: {', '.join(SORT_COLUMNS)}")
+        column = SORT_COLUMNS[sort]
+        direction, comparison = ('DESC', '<') if descending else ('ASC', '>')
+
+        conditions: List[str] = []
+        params: List = []
+        if search:
+            fts_query = to_fts_query(search)
+            if fts_query:
+                conditions.append(
+                    'rowid IN (SELECT rowid FROM library_fts WHERE library_fts MATCH ?)')
+                params.append(fts_query)
+        if kind:
+            conditions.append('kind = ?')
+            params.append(kind)
+        if cursor:
+            try:
+                after_value, after_path = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            except (ValueError, TypeError):
+                raise ValueError("Invalid cursor")
+            conditions.append(f'({column}, path) {comparison} (?, ?)')
+            params += [after_value, after_path]
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        with self._lock:
+            result = self.connection.execute(
+                f'SELECT * FROM library {where} ORDER BY {column} {direction}, path {direction} LIMIT ?',
+                (*params, limit + 1))
+            columns = [description[0] for description in result.description]
+            items = [dict(zip(columns, row)) for row in result.fetchall()]
+
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            last = items[-1]
+            next_cursor = base64.urlsafe_b64encode(
+                json.dumps([last[column], last['path']]).encode('utf-8')).decode('ascii')
+
+        for item in items:
+            item['filename'] = os.path.basename(item['path'])
+        return {'items': items, 'next_cursor': next_cursor}
+
+
+_library: Optional[LibraryIndex] = None
+
+
+def get_library() -> LibraryIndex:
+    """Get the shared library index"""
+    global _library
+    if _library is None:
+        _library = LibraryIndex()
+    return _library
+
+
+def configure_library(**kwargs) -> LibraryIndex:
+    """Replace the shared library index with one using the given settings"""
+    global _library
+    _library = LibraryIndex(**kwargs)
+    return _library
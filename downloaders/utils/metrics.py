@@ -0,0 +1,158 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+
+# Histogram buckets in seconds, from quick cache hits to long downloads
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels.items()) + '}'
+
+
+class Metric:
+    """Base of the metrics exposed in the Prometheus text format.
+
+    Updates happen once per job or pipeline stage, never per downloaded block,
+    so each metric only needs its own small lock."""
+
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        """Yield (name, labels, value) for every sample of the metric"""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """Render the metric in the Prometheus text format"""
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        for name, labels, value in self.samples():
+            lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    """Value that only goes up"""
+
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._value = 0.0
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+
+    def samples(self):
+        yield self.name, {}, self._value
+
+
+class Gauge(Metric):
+    """Value read from a callback when the metrics are collected"""
+
+    type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], float]):
+        super().__init__(name, documentation)
+        self.callback = callback
+
+    def samples(self):
+        yield self.name, {}, self.callback()
+
+
+class Histogram(Metric):
+    """Distribution of observed durations"""
+
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # Last one is +Inf
+        self._sum = 0.0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    @contextmanager
+    def time(self):
+        """Observe how long the block takes"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self):
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        cumulative = 0
+        for bound, count in zip([*self.buckets, float('inf')], counts):
+            cumulative += count
+            yield f'{self.name}_bucket', {'le': _format_value(bound)}, cumulative
+        yield f'{self.name}_sum', {}, total
+        yield f'{self.name}_count', {}, cumulative
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together for the /metrics endpoint"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        """Add a metric, replacing one with the same name"""
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text format"""
+        with self._lock:
+            metrics: List[Metric] = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+registry = MetricsRegistry()
+
+JOBS_STARTED = registry.register(Counter(
+    'ytdl_jobs_started_total', 'Download jobs that started running'))
+JOBS_FINISHED = registry.register(Counter(
+    'ytdl_jobs_finished_total', 'Download jobs that finished successfully'))
+JOBS_FAILED = registry.register(Counter(
+    'ytdl_jobs_failed_total', 'Download jobs that failed'))
+EXTRACT_SECONDS = registry.register(Histogram(
+    'ytdl_extract_info_seconds', 'Time to extract video info with yt-dlp'))
+DOWNLOAD_SECONDS = registry.register(Histogram(
+    'ytdl_download_seconds', 'Time spent downloading the streams of a job'))
+POSTPROCESS_SECONDS = registry.register(Histogram(
+    'ytdl_postprocess_seconds', 'Time spent merging, encoding and tagging a file with ffmpeg'))
+THUMBNAIL_FETCH_SECONDS = registry.register(Histogram(
+    'ytdl_thumbnail_fetch_seconds', 'Time to fetch and convert cover art on a cache miss'))
+THUMBNAIL_EMBED_SECONDS = registry.register(Histogram(
+    'ytdl_thumbnail_embed_seconds', 'Time to embed cover art into a file'))
+
+
+def register_gauge(name: str, documentation: str, callback: Callable[[], float]) -> Gauge:
+    """Add a gauge whose value is read from a callback on every scrape"""
+    return registry.register(Gauge(name, documentation, callback))
@@ -1,76 +1,199 @@
+import base64
+import hashlib
+import io
 import os
-import requests
-
-from PIL import Image
-from mutagen.id3 import ID3, APIC, error
-from mutagen.mp3 import MP3
+import threading
+from typing import TYPE_CHECKING, Dict, Optional
 
 from downloaders.utils.file_utils import get_downloader_paths as paths
-from downloaders.utils.file_utils import safe_name
+from downloaders.utils.metrics import THUMBNAIL_EMBED_SECONDS, THUMBNAIL_FETCH_SECONDS
 from downloaders.utils import raise_on_error
 
+# requests, Pillow and mutagen are imported on first use to keep startup fast
+if TYPE_CHECKING:
+    import requests
 
-@raise_on_error()
-def embed_thumbnail(audio_filename: str, thumbnail_path: str):
-    if not audio_filename or not thumbnail_path:
-        raise ValueError("Audio filename and thumbnail path must be provided")
 
-    print(f'[Thumbnail] Adding thumbnail to "{audio_filename}"')
+_session: Optional['requests.Session'] = None
+_session_lock = threading.Lock()
 
-    # Ensure thumbnail is JPEG
-    jpeg_thumb_path = thumbnail_path
-    try:
-        with Image.open(thumbnail_path) as img:
-            if img.format != 'JPEG':
-                jpeg_thumb_path = thumbnail_path.rsplit('.', 1)[0] + '.jpg'
-                img.convert('RGB').save(jpeg_thumb_path, 'JPEG')
-    except:
-        jpeg_thumb_path = thumbnail_path  # fallback
-
-    # Embed the thumbnail image into the audio file
-    try:
-        audio = MP3(audio_filename, ID3=ID3)
-        audio.tags.add(APIC(
-            encoding=3,  # 3 = utf-8
-            mime='image/jpeg',  # MIME type of the image
-            type=3,  # 3 = cover image
-            desc='Cover',
-            data=open(jpeg_thumb_path, 'rb').read()
-        ))
-        audio.save(v2_version=3)
-    except error:
-        # If the file has no existing ID3 tags, add them
-        audio = MP3(audio_filename)
-        audio.add_tags()
-        audio.tags.add(APIC(
-            encoding=3,
-            mime='image/jpeg',
-            type=3,
-            desc='Cover',
-            data=open(jpeg_thumb_path, 'rb').read()
-        ))
-        audio.save(v2_version=3)
 
-    # Clean up the downloaded thumbnail image
-    os.remove(thumbnail_path)
+def get_session() -> 'requests.Session':
+    """Get the shared keep-alive HTTP session used for thumbnails"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
+
+
+def to_jpeg(image_data: bytes, max_size: int) -> bytes:
+    """Decode an image, shrink it to fit max_size and encode it as JPEG in memory"""
+    from PIL import Image
+    with Image.open(io.BytesIO(image_data)) as img:
+        if img.format == 'JPEG' and max(img.size) <= max_size:
+            return image_data
+
+        img = img.convert('RGB')
+        img.thumbnail((max_size, max_size))
+        output = io.BytesIO()
+        img.save(output, 'JPEG', quality=90)
+        return output.getvalue()
+
+
+class ThumbnailCache:
+    """Disk cache of JPEG cover art with least-recently-used eviction"""
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: int = 200 * 1024 * 1024,
+                 max_size: int = 1280):
+        self.directory = directory or paths()['thumbnail']
+        self.max_bytes = max_bytes
+        self.max_size = max_size
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    def _path(self, url: str) -> str:
+        """Get the cache file of a URL, addressed by a hash of the URL and target size"""
+        key = hashlib.sha256(f'{self.max_size}:{url}'.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f'{key}.jpg')
+
+    def _lock_for(self, path: str) -> threading.Lock:
+        """Get the lock that makes concurrent requests for one cover fetch it once"""
+        with self._locks_lock:
+            return self._locks.setdefault(path, threading.Lock())
+
+    def get(self, url: str) -> bytes:
+        """Get JPEG cover art for a URL, downloading it only on a cache miss"""
+        if not url:
+            raise ValueError("No thumbnail URL provided")
+
+        path = self._path(url)
+        with self._lock_for(path):
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                os.utime(path)  # Mark as recently used
+                return data
+            except FileNotFoundError:
+                pass
+
+            print("Downloading thumbnail...")
+            with THUMBNAIL_FETCH_SECONDS.time():
+                response = get_session().get(url, timeout=15)
+                response.raise_for_status()
+                data = to_jpeg(response.content, self.max_size)
+
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = f'{path}.{threading.get_ident()}.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+            print(f"Downloaded thumbnail: {path} ({len(data)} bytes)")
+
+        self.evict()
+        return data
+
+    def evict(self):
+        """Delete least recently used covers until the cache fits in max_bytes"""
+        try:
+            entries = [entry for entry in os.scandir(self.directory)
+                       if entry.is_file() and entry.name.endswith('.jpg')]
+        except FileNotFoundError:
+            return
+
+        stats = [(entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                 for entry in entries]
+        total = sum(size for _, size, _ in stats)
+        for _, size, path in sorted(stats):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+_thumbnail_cache: Optional[ThumbnailCache] = None
+
+
+def get_thumbnail_cache() -> ThumbnailCache:
+    """Get the shared thumbnail cache"""
+    global _thumbnail_cache
+    if _thumbnail_cache is None:
+        _thumbnail_cache = ThumbnailCache()
+    return _thumbnail_cache
+
+
+def configure_thumbnail_cache(**kwargs) -> ThumbnailCache:
+    """Replace the shared thumbnail cache with one using the given settings"""
+    global _thumbnail_cache
+    _thumbnail_cache = ThumbnailCache(**kwargs)
+    return _thumbnail_cache
 
 
 @raise_on_error()
-def download_thumbnail(url: str, title: str = 'thumbnail') -> str:
+def download_thumbnail(url: str) -> bytes:
     """Download the best thumbnail for album cover.
-    :return: The path to the downloaded thumbnail."""
-    if not url:
-        raise ValueError("No thumbnail URL provided")
+    :return: The JPEG bytes of the thumbnail."""
+    return get_thumbnail_cache().get(url)
 
-    path = os.path.join(paths().get('thumbnail'),
-                        f'{safe_name(title)}_thumbnail.png')
-    os.makedirs(paths().get('thumbnail'), exist_ok=True)
 
-    print("Downloading thumbnail...")
+@raise_on_error()
+def embed_thumbnail(filename: str, thumbnail_data: bytes):
+    """Embed JPEG cover art into an MP3, MP4/M4A or Ogg (Opus/Vorbis) file"""
+    if not filename or not thumbnail_data:
+        raise ValueError("Filename and thumbnail data must be provided")
+
+    print(f'[Thumbnail] Adding thumbnail to "{filename}"')
+    with THUMBNAIL_EMBED_SECONDS.time():
+        _embed_thumbnail(filename, thumbnail_data)
+
+
+def _embed_thumbnail(filename: str, thumbnail_data: bytes):
+    """Write the cover art with the tag format of the file's container"""
+    import mutagen
+    from mutagen.flac import Picture
+    from mutagen.id3 import ID3, APIC, error
+    from mutagen.mp3 import MP3
+    from mutagen.mp4 import MP4, MP4Cover
+
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in ('.mp4', '.m4a'):
+        media = MP4(filename)
+        media['covr'] = [MP4Cover(thumbnail_data, imageformat=MP4Cover.FORMAT_JPEG)]
+        media.save()
+        return
 
-    thumbnail_data = requests.get(url).content
-    with open(path, 'wb') as f:
-        f.write(thumbnail_data)
+    if extension in ('.opus', '.ogg'):
+        # ffmpeg can't mux cover art into Ogg, so it goes in a FLAC picture block
+        picture = Picture()
+        picture.type = 3  # 3 = cover image
+        picture.mime = 'image/jpeg'
+        picture.desc = 'Cover'
+        picture.data = thumbnail_data
+        media = mutagen.File(filename)
+        media['metadata_block_picture'] = [
+            base64.b64encode(picture.write()).decode('ascii')]
+        media.save()
+        return
+
+    audio = MP3(filename, ID3=ID3)
+    try:
+        audio.add_tags()
+    except error:
+        pass  # The file already has ID3 tags
 
-    print(f"Downloaded thumbnail: {path} ({len(thumbnail_data)} bytes)")
-    return path
+    audio.tags.add(APIC(
+        encoding=3,  # 3 = utf-8
+        mime='image/jpeg',  # MIME type of the image
+        type=3,  # 3 = cover image
+        desc='Cover',
+        data=thumbnail_data
+    ))
+    audio.save(v2_version=3)
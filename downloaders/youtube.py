@@ -1,20 +1,36 @@
+import copy
+import hashlib
 import os
 import time
-import yt_dlp
-from typing import Dict, List
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional
+from downloaders.bandwidth import BandwidthLease
 from downloaders.base import BaseDownloader
+from downloaders.formats import FormatIndex, get_audio_container, is_codec_compatible
+from downloaders.tuning import get_transfer_tuner
 from downloaders.utils import raise_on_error
-from downloaders.utils.ffmpeg_utils import get_ffmpeg_path
+from downloaders.utils.ffmpeg_utils import (ATTACHED_COVER_CONTAINERS, build_audio_command,
+                                            build_merge_command, get_ffmpeg_path, run_ffmpeg)
 from downloaders.utils.file_utils import get_downloader_paths, prepare_output_template
+from downloaders.utils.info_cache import get_info_cache
+from downloaders.utils.library import get_library
+from downloaders.utils.metrics import DOWNLOAD_SECONDS, POSTPROCESS_SECONDS
 from downloaders.utils.thumbnail_utils import embed_thumbnail, download_thumbnail
 from app.utils.formatters import format_duration, format_size
 
+if TYPE_CHECKING:
+    import yt_dlp
+
 
 class YouTubeDownloader(BaseDownloader):
     """YouTube video/audio downloader using yt-dlp"""
 
-    def __init__(self, url: str):
-        super().__init__(url)
+    def __init__(self, url: str, extractor: Optional[Callable[[str], Dict]] = None):
+        super().__init__(url, extractor)
+        self._format_index: Optional[FormatIndex] = None
+        self.pipeline: Optional[Dict] = None
+        self._active_options: Optional[Dict] = None  # Options of the running yt-dlp instance
+        self.bandwidth_lease: Optional[BandwidthLease] = None
+        self.cancelled = False
         self._setup_options()
 
     def _setup_options(self):
@@ -25,64 +41,152 @@ class YouTubeDownloader(BaseDownloader):
                 'thumbnail': get_downloader_paths()['thumbnail']
             },
             'ffmpeg_location': get_ffmpeg_path(),
-            'progress_hooks': [self.progress_hook],
+            'progress_hooks': [self._check_cancelled, self.progress_hook,
+                               self._tune_transfer, self._throttle],
+            **get_transfer_tuner().options(),
         }
 
+    def _check_cancelled(self, d: Dict):
+        """Progress hook stopping the download once it is cancelled.
+        The partial file stays in the temp folder, so a later run continues it."""
+        if self.cancelled:
+            import yt_dlp
+            raise yt_dlp.utils.DownloadCancelled('Download interrupted')
+
+    def _tune_transfer(self, d: Dict):
+        """Progress hook that retunes fragment parallelism and chunk size after each stream.
+        yt-dlp reads these per stream, so the next stream of this job picks them up."""
+        if d['status'] == 'finished' and self._active_options is not None:
+            self._active_options.update(get_transfer_tuner().record(
+                self.progress_hook.last_throughput, self.progress_hook.fragmented))
+
+    def _throttle(self, d: Dict):
+        """Progress hook holding the download to its share of the bandwidth"""
+        if self.bandwidth_lease is not None:
+            self.bandwidth_lease(d)
+
+    @property
+    def format_index(self) -> FormatIndex:
+        """Index of the formats of the current info, rebuilt when the info changes"""
+        if self._format_index is None or self._format_index.info is not self.info:
+            self._format_index = FormatIndex(self.info)
+        return self._format_index
+
     @raise_on_error()
     def _filter_formats(self, is_video: bool = True) -> List[Dict]:
         """Filter formats to avoid duplicates based on quality"""
         if not isinstance(is_video, bool):
             raise ValueError("is_video must be a boolean value")
 
-        format_qualities: Dict[int, Dict] = {}  # { height: fmt }
-        CODEC = {1: 'vcodec', 0: 'acodec'}
-        QUALITY = {1: 'height', 0: 'abr'}
+        return self.format_index.best_per_quality(is_video)
+
+    def select_format(self, kind: str = 'video', **constraints) -> Optional[Dict]:
+        """Pick the best format of a kind matching the constraints (see FormatIndex.filter)"""
+        constraints = {key: value for key,
+                       value in constraints.items() if value is not None}
+        return self.format_index.query(kind, **constraints)
+
+    def plan_video_pipeline(self, format_obj: Dict, container: str = 'mp4') -> Dict:
+        """Pick the audio stream to merge with a video format and how to mux them.
+        Streams the container can hold are copied; only the others are re-encoded."""
+        audio = self.format_index.merge_audio(container)
+
+        copy_video = is_codec_compatible(
+            format_obj.get('vcodec'), container, 'video')
+        copy_audio = audio is None or is_codec_compatible(
+            audio.get('acodec'), container, 'audio')
+
+        ffmpeg_args = []
+        if not copy_video:
+            ffmpeg_args += ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '20']
+        if not copy_audio:
+            ffmpeg_args += ['-c:a', 'aac', '-b:a', '192k']
+
+        return {
+            'mode': ('remux' if copy_video and copy_audio
+                     else 'transcode_audio' if copy_video else 'transcode'),
+            'container': container,
+            'video_format_id': format_obj.get('format_id'),
+            'video_codec': format_obj.get('vcodec'),
+            'audio_format_id': audio.get('format_id') if audio else None,
+            'audio_codec': audio.get('acodec') if audio else None,
+            'ffmpeg_args': ffmpeg_args,
+        }
+
+    def get_playlist_info(self) -> Dict:
+        """Get a flat listing of a playlist or channel without extracting each video"""
+        options = self.youtube_dl_options.copy()
+        options.update({
+            'extract_flat': 'in_playlist',
+            'quiet': True,
+        })
 
-        for f in self.info.get('formats', []):
-            if f.get(CODEC[int(is_video)], 'none') != 'none' and f.get(CODEC[int(not is_video)], 'none') == 'none':
+        import yt_dlp
+        with yt_dlp.YoutubeDL(options) as ydl:
+            info = ydl.extract_info(self.url, download=False) or {}
+            entries = list(self._flatten_entries(ydl, info.get('entries') or []))
 
-                if (f.get(QUALITY[int(is_video)], 0) or 0) not in format_qualities:
-                    format_qualities[f.get(QUALITY[int(is_video)], 0) or 0] = f
+        return {
+            'id': info.get('id'),
+            'title': info.get('title', 'Unknown Playlist'),
+            'uploader': info.get('uploader') or info.get('channel', ''),
+            'entries': entries,
+        }
 
-                else:
-                    if (not format_qualities[f.get(QUALITY[int(is_video)], 0) or 0].get('filesize', None) and
-                            f.get('filesize', None)):
-                        format_qualities[f.get(
-                            QUALITY[int(is_video)], 0) or 0] = f
+    def _flatten_entries(self, ydl: 'yt_dlp.YoutubeDL', entries, depth: int = 0) -> Iterator[Dict]:
+        """Yield video entries, expanding nested playlists and channel tabs"""
+        for entry in entries:
+            if not entry:
+                continue
 
-        return [fmt for fmt in format_qualities.values()]
+            if entry.get('_type') == 'playlist':
+                yield from self._flatten_entries(ydl, entry.get('entries') or [], depth + 1)
+            elif entry.get('ie_key') == 'YoutubeTab':
+                # Channel pages list their tabs (Videos, Shorts, ...) as nested playlists
+                if depth < 2:
+                    tab = ydl.extract_info(entry['url'], download=False) or {}
+                    yield from self._flatten_entries(ydl, tab.get('entries') or [], depth + 1)
+            elif entry.get('id'):
+                yield {
+                    'id': entry['id'],
+                    'url': f"https://www.youtube.com/watch?v={entry['id']}",
+                    'title': entry.get('title') or 'Unknown Title',
+                    'duration': format_duration(entry['duration']) if entry.get('duration') else '',
+                }
+
+    @staticmethod
+    def summarize_video_format(f: Dict) -> Dict:
+        """Get the display fields of a video format"""
+        return {
+            'format_id': f['format_id'],
+            'resolution': f.get('height', 'N/A'),
+            'quality': ('High Quality' if f.get('height', 0) >= 720
+                        else 'Medium Quality' if f.get('height', 0) >= 480
+                        else 'Low Quality'),
+            'ext': f.get('ext', 'N/A'),
+            'filesize': format_size(f.get('filesize', 0)),
+            'vcodec': f.get('vcodec', 'none'),
+        }
+
+    @staticmethod
+    def summarize_audio_format(f: Dict) -> Dict:
+        """Get the display fields of an audio format"""
+        return {
+            'format_id': f['format_id'],
+            'abr': f.get('abr', 0),
+            'quality': 'High Quality' if (f.get('abr', 0) or 0) >= 128 else 'Low Quality',
+            'ext': f.get('ext', 'N/A'),
+            'filesize': format_size(f.get('filesize', 0)),
+            'acodec': f.get('acodec', 'none'),
+        }
 
     def get_video_formats(self) -> List[Dict]:
         """Get available video formats"""
-        formats = []
-        for f in self._filter_formats():
-            formats.append({
-                'format_id': f['format_id'],
-                'resolution': f.get('height', 'N/A'),
-                'quality': ('High Quality' if f.get('height', 0) >= 720
-                            else 'Medium Quality' if f.get('height', 0) >= 480
-                            else 'Low Quality'),
-                'ext': f.get('ext', 'N/A'),
-                'filesize': format_size(f.get('filesize', 0)),
-                'vcodec': f.get('vcodec', 'none'),
-            })
-
-        return formats
+        return [self.summarize_video_format(f) for f in self._filter_formats()]
 
     def get_audio_formats(self) -> List[Dict]:
         """Get available audio formats"""
-        formats = []
-        for f in self._filter_formats(False):
-            formats.append({
-                'format_id': f['format_id'],
-                'abr': f.get('abr', 0),
-                'quality': 'High Quality' if (f.get('abr', 0) or 0) >= 128 else 'Low Quality',
-                'ext': f.get('ext', 'N/A'),
-                'filesize': format_size(f.get('filesize', 0)),
-                'acodec': f.get('acodec', 'none'),
-            })
-
-        return formats
+        return [self.summarize_audio_format(f) for f in self._filter_formats(False)]
 
     def get_thumbnail(self) -> Dict:
         """Get the best thumbnail for the video"""
@@ -112,89 +216,206 @@ class YouTubeDownloader(BaseDownloader):
             'audio_formats': self.get_audio_formats()
         }
 
-    def download(self, format_obj: Dict) -> str:
-        """Download the video/audio with specified format"""
+    def get_metadata(self) -> Dict[str, str]:
+        """Get the tags written into audio files"""
+        artist = ', '.join(
+            self.info.get('artists', []) or
+            [self.info.get('uploader', 'Unknown Artist')]
+        )
+        return {
+            'title': self.info.get('title', 'Unknown Title'),
+            'artist': artist,
+            'album_artist': artist.split(', ')[0],
+            'album': self.info.get('album', None) or self.info.get('title', 'Unknown Album'),
+            'date': str(self.info.get('release_year', None) or (self.info.get('upload_date') or '')[:4]),
+            'comment': '',  # Avoid adding URL as a comment
+        }
+
+    def plan_audio_pipeline(self, format_obj: Dict, passthrough: bool = False) -> Dict:
+        """Decide whether an audio format is kept as-is or re-encoded to MP3"""
+        container = get_audio_container(
+            format_obj.get('acodec')) if passthrough else None
+        abr = format_obj.get('abr') or 192
+
+        return {
+            'mode': 'passthrough' if container else 'transcode',
+            'container': container or 'mp3',
+            'audio_format_id': format_obj.get('format_id'),
+            'audio_codec': format_obj.get('acodec'),
+            'codec': 'copy' if container else 'libmp3lame',
+            'bitrate': None if container else f'{int(round(abr))}k',
+        }
+
+    def _output_container(self, format_obj: Dict, passthrough: bool = False) -> str:
+        """Get the container a format is saved in"""
+        if format_obj.get('vcodec') != 'none':
+            return 'mp4'
+        return self.plan_audio_pipeline(format_obj, passthrough)['container']
+
+    def get_downloaded_path(self, format_obj: Dict, passthrough: bool = False) -> Optional[str]:
+        """Get the file the library has for this video in this format, if it
+        is still on disk. Other files that merely share its name don't count."""
+        video_id = self.info.get('id')
+        if not video_id:
+            return None
+        entry = get_library().lookup(video_id, format_obj.get('format_id'),
+                                     self._output_container(format_obj, passthrough))
+        return entry['path'] if entry and os.path.exists(entry['path']) else None
+
+    def get_output_path(self, format_obj: Dict, passthrough: bool = False) -> str:
+        """Get the final path of a download: where the library already has it,
+        else a title-based name that no other file (another video's, another
+        format's or one saved by hand) has taken"""
         is_video = format_obj.get('vcodec') != 'none'
+        container = self._output_container(format_obj, passthrough)
+
+        library = get_library()
+        video_id = self.info.get('id')
+        if video_id:
+            entry = library.lookup(video_id, format_obj.get('format_id'), container)
+            if entry:
+                return entry['path']
 
-        # Setup output template
         outtmpl = prepare_output_template(
             format_obj=format_obj, is_video=is_video)
+        name = os.path.splitext(outtmpl)[0]
+        if not video_id:
+            return f'{name}.{container}'
+
+        candidates = [f'{name}.{container}', f'{name} [{video_id}].{container}']
+        for path in candidates:
+            if not os.path.exists(path) and library.owner(path) is None:
+                return path
+        # Both taken, e.g. by this video in another format
+        return f"{name} [{video_id}-{format_obj.get('format_id')}].{container}"
+
+    def download(self, format_obj: Dict, passthrough: bool = False) -> str:
+        """Download the video/audio with specified format.
+        With passthrough, audio keeps its original codec instead of becoming MP3."""
+        return self.postprocess(self.fetch(format_obj, passthrough))
+
+    def fetch(self, format_obj: Dict, passthrough: bool = False) -> Dict:
+        """Network stage of a download: fetch the raw streams and the cover art.
+        :return: What postprocess() needs to build the final file."""
+        is_video = format_obj.get('vcodec') != 'none'
+        final_path = self.get_output_path(format_obj, passthrough)
+
+        if is_video:
+            self.pipeline = self.plan_video_pipeline(format_obj)
+            formats = [format_obj.get('format_id', 'bestvideo')]
+            if self.pipeline['audio_format_id']:
+                formats.append(self.pipeline['audio_format_id'])
+        else:
+            self.pipeline = self.plan_audio_pipeline(format_obj, passthrough)
+            formats = [format_obj.get('format_id', 'bestaudio')]
 
-        # Update options for download
+        # Fetch the raw streams side by side; merging, encoding, tags and
+        # cover all happen afterwards in one ffmpeg pass. Raw names include the
+        # output so jobs sharing a stream (e.g. video and MP3) don't collide
+        output_key = hashlib.sha1(final_path.encode('utf-8')).hexdigest()[:8]
+        raw_name = f"{self.info.get('id', 'media')}.{output_key}.f%(format_id)s.%(ext)s"
         download_options = self.youtube_dl_options.copy()
         download_options.update({
-            'outtmpl': {'default': outtmpl},
+            'format': ','.join(formats),
+            'outtmpl': {'default': os.path.join(get_downloader_paths()['temp'], raw_name)},
         })
 
-        if is_video:
-            video_format = format_obj.get('format_id', 'bestvideo')
-            download_options.update({
-                'format': f'{video_format}+bestaudio',
-                'postprocessors': [{
-                    'key': 'FFmpegVideoConvertor',
-                    'preferedformat': 'mp4',
-                }],
-                'merge_output_format': 'mp4',
-                'postprocessor_args': [
-                    '-c:v', 'copy',
-                    '-c:a', 'aac',
-                    '-b:a', '192k',
-                ],
-            })
-        else:
-            # Get metadata from the video info
-            metadata = {
-                'title': self.info.get('title', 'Unknown Title'),
-                'artist': ', '.join(
-                    self.info.get('artists', []) or
-                    [self.info.get('uploader', 'Unknown Artist')]
-                ),
-                'album': self.info.get('album', None) or self.info.get('title', 'Unknown Album'),
-                'date': str(self.info.get('release_year', None) or self.info.get('upload_date', '')[:4]),
-            }
-
-            download_options.update({
-                'format': format_obj.get('format_id', 'bestaudio'),
-
-                'postprocessors': [
-                    {
-                        'key': 'FFmpegExtractAudio',
-                        'preferredcodec': 'mp3',
-                        'preferredquality': str(format_obj.get('abr', 192)),
-                    },
-                    {
-                        'key': 'FFmpegMetadata',  # Add metadata
-                        'add_metadata': True,
-                    },
-                ],
-
-                'postprocessor_args': [
-                    '-metadata', f'title={metadata["title"]}',
-                    '-metadata', f'artist={metadata["artist"]}',
-                    '-metadata', f'album_artist={metadata["artist"].split(", ")[0]}',
-                    '-metadata', f'album={metadata["album"]}',
-                    '-metadata', f'date={metadata["date"]}',
-                    '-metadata', f'comment=""',  # Avoid adding URL as a comment
-                ],
-            })
-
-        final_path = os.path.splitext(
-            outtmpl)[0] + ('.mp4' if is_video else '.mp3')
-
-        # Reset progress and download
+        # Reset progress and download from the already extracted info
+        import yt_dlp
         self.progress_hook.reset()
-        with yt_dlp.YoutubeDL(download_options) as ydl:
-            ydl.download([self.url])
+        self._active_options = download_options
+        try:
+            with DOWNLOAD_SECONDS.time(), yt_dlp.YoutubeDL(download_options) as ydl:
+                try:
+                    result = ydl.process_ie_result(
+                        copy.deepcopy(self.info), download=True)
+                except yt_dlp.utils.DownloadError:
+                    # Stream URLs in the cached info may have expired; re-extract
+                    get_info_cache().invalidate(self.url)
+                    self.progress_hook.reset()
+                    result = ydl.extract_info(self.url, download=True)
+                    # Postprocessing and later jobs use the fresh info from now on
+                    self.info = {key: value for key, value in result.items()
+                                 if key != 'requested_downloads'}
+                    get_info_cache().set(self.url, self.info)
+        finally:
+            self._active_options = None
 
-        # Download and embed thumbnail if available
-        thumbnail = download_thumbnail(
-            self.get_thumbnail().get('url', ''), self.info.get('title', 'thumbnail'))
+        # Download thumbnail if available (cached, so audio and video jobs of
+        # the same video fetch it once)
+        try:
+            thumbnail = download_thumbnail(self.get_thumbnail().get('url', ''))
+        except Exception as e:
+            print(f"[Thumbnail] Skipping cover art: {e}")
+            thumbnail = None
+
+        return {
+            'final_path': final_path,
+            # The final file is built here and moved into place when complete
+            'work_path': os.path.join(get_downloader_paths()['temp'],
+                                      f"{self.info.get('id', 'media')}.{output_key}{os.path.splitext(final_path)[1]}"),
+            'raw_paths': [d['filepath'] for d in result['requested_downloads']],
+            'thumbnail': thumbnail,
+            'is_video': is_video,
+        }
 
-        embed_thumbnail(final_path, thumbnail)
+    def postprocess(self, fetched: Dict, threads: Optional[int] = None,
+                    nice: Optional[int] = None) -> str:
+        """CPU stage of a download: build the final file from the fetched streams.
+        :param threads: ffmpeg thread budget.
+        :param nice: Nice level of the ffmpeg process.
+        :return: The final file path."""
+        final_path = fetched['final_path']
+        work_path = fetched['work_path']
+        raw_paths = fetched['raw_paths']
+        thumbnail = fetched['thumbnail']
+
+        if fetched['is_video']:
+            self.progress_hook.set_stage('merge')
+            # The cover goes in with the merge, so the file is written only once
+            with_cover = bool(thumbnail) and self.pipeline['container'] in ATTACHED_COVER_CONTAINERS
+            with POSTPROCESS_SECONDS.time():
+                run_ffmpeg(
+                    build_merge_command(
+                        raw_paths[0], raw_paths[1] if len(raw_paths) > 1 else None,
+                        work_path, self.pipeline['ffmpeg_args'], with_cover=with_cover),
+                    input_data=thumbnail if with_cover else None,
+                    threads=threads, nice=nice,
+                )
+            for raw_path in raw_paths:
+                os.remove(raw_path)
+        else:
+            self.progress_hook.set_stage('postprocess')
+            self._mux_audio(raw_paths[0], work_path, thumbnail, threads, nice)
 
         # Update the file's modification time to the current time
         current_time = time.time()
-        os.utime(final_path, (current_time, current_time))
+        os.utime(work_path, (current_time, current_time))
+
+        # Only complete files ever appear at the final path
+        get_library().place(work_path, final_path)
 
         # Return the downloaded file path
         return final_path
+
+    def _mux_audio(self, raw_path: str, final_path: str, thumbnail: Optional[bytes],
+                   threads: Optional[int] = None, nice: Optional[int] = None):
+        """Write the final audio file, its tags and its cover art in one ffmpeg pass"""
+        with_cover = bool(
+            thumbnail) and self.pipeline['container'] in ATTACHED_COVER_CONTAINERS
+        with POSTPROCESS_SECONDS.time():
+            run_ffmpeg(
+                build_audio_command(
+                    raw_path, final_path,
+                    codec=self.pipeline['codec'],
+                    bitrate=self.pipeline['bitrate'],
+                    metadata=self.get_metadata(),
+                    with_cover=with_cover,
+                ),
+                input_data=thumbnail if with_cover else None,
+                threads=threads, nice=nice,
+            )
+        os.remove(raw_path)
+
+        if thumbnail and not with_cover:
+            embed_thumbnail(final_path, thumbnail)
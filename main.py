@@ -4,9 +4,12 @@ YouTube Downloader - Main Entry Point
 A cross-platform YouTube video/audio downloader with web interface
 """
 
+import argparse
 import os
+import signal
 import sys
 import socket
+import threading
 from app import create_app
 from downloaders.utils.file_utils import ensure_directories_exist
 from downloaders.utils.ffmpeg_utils import ensure_ffmpeg_available, verify_ffmpeg_installation
@@ -24,8 +27,75 @@ def find_available_port(start_port: int = 5000, max_attempts: int = 10) -> int |
     return None
 
 
+def warm_up():
+    """Index the library and load the heavy modules in the background, so the
+    server answers its first request without waiting for them"""
+    from downloaders.utils.library import get_library
+    changes = get_library().refresh()
+    print(f"Library indexed ({changes['added']} added, {changes['updated']} updated, "
+          f"{changes['removed']} removed)")
+
+    import mutagen  # noqa: F401
+    import requests  # noqa: F401
+    import yt_dlp  # noqa: F401
+    from PIL import Image  # noqa: F401
+
+
+def stop_on_sigterm():
+    """Stop on SIGTERM the way Ctrl+C does, so downloads are shut down gracefully"""
+    def stop(signum, frame):
+        # The servers stop serving on SystemExit just like on Ctrl+C
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    if hasattr(signal, 'SIGBREAK'):  # Ctrl+Break on Windows
+        signal.signal(signal.SIGBREAK, stop)
+
+
+def serve_production(app, host: str, port: int, threads: int):
+    """Serve the app with the waitress WSGI server until Ctrl+C or SIGTERM"""
+    try:
+        from waitress import create_server
+    except ImportError:
+        print("❌ Production mode needs waitress: pip install waitress")
+        sys.exit(1)
+
+    stop_on_sigterm()
+    server = create_server(app, host=host, port=port, threads=threads)
+    print(f"\n🚀 Serving on http://{host}:{port} with {threads} threads")
+    print("Press Ctrl+C to stop the server")
+    server.run()
+    server.close()
+
+
+def serve_asgi(app, host: str, port: int, threads: int):
+    """Serve the async API with uvicorn until Ctrl+C or SIGTERM"""
+    try:
+        import uvicorn
+    except ImportError:
+        print("❌ ASGI mode needs uvicorn: pip install uvicorn")
+        sys.exit(1)
+    from app.asgi import AsyncAPI
+
+    # uvicorn hands the signal back to these handlers once it has stopped
+    stop_on_sigterm()
+    print(f"\n🚀 Serving on http://{host}:{port} (ASGI, {threads} threads for blocking work)")
+    print("Press Ctrl+C to stop the server")
+    # Open progress streams would hold the shutdown forever; close them after 5 seconds
+    uvicorn.run(AsyncAPI(app, threads), host=host, port=port,
+                log_level='warning', timeout_graceful_shutdown=5)
+
+
 def main():
     """Main application entry point"""
+    parser = argparse.ArgumentParser(description="YouTube Downloader web interface")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--production', action='store_const', dest='mode', const='production',
+                      help="serve with waitress instead of Flask's development server")
+    mode.add_argument('--asgi', action='store_const', dest='mode', const='asgi',
+                      help="serve the async API with uvicorn, for many progress subscribers")
+    args = parser.parse_args()
+
     print("Starting YouTube Downloader...")
 
     # Ensure required directories exist
@@ -48,10 +118,25 @@ def main():
     app = create_app()
 
     # Get configuration
-    debug = app.config.get('DEBUG', True)
+    serve_mode = args.mode or app.config['SERVE_MODE']
+    debug = app.config.get('DEBUG', True) and serve_mode == 'development'
     host = os.environ.get('FLASK_HOST', '127.0.0.1')
     preferred_port = int(os.environ.get('FLASK_PORT', 5000))
 
+    # Resume downloads interrupted by the last shutdown and warm up.
+    # With the debug reloader only the child process serves requests.
+    serving = not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
+    if serving:
+        threading.Thread(target=warm_up, daemon=True).start()
+
+        from app.routes import download_service
+        resumed = download_service.resume_jobs()
+        if resumed:
+            print(f"Resuming {resumed} unfinished download(s)...")
+        download_service.start_sync(app.config['PROGRESS_SYNC_INTERVAL'],
+                                    app.config['JOB_STALE_AFTER'])
+        download_service.start_subscriptions()
+
     # Find available port
     port = find_available_port(preferred_port)
     if port is None:
@@ -68,7 +153,12 @@ def main():
     # print("Press Ctrl+C to stop the server")
 
     try:
-        app.run(host=host, port=port, debug=debug)
+        if serve_mode == 'production':
+            serve_production(app, host, port, app.config['SERVER_THREADS'])
+        elif serve_mode == 'asgi':
+            serve_asgi(app, host, port, app.config['SERVER_THREADS'])
+        else:
+            app.run(host=host, port=port, debug=debug)
     except OSError as e:
         if "permission" in str(e).lower() or "access" in str(e).lower():
             print(f"❌ Permission error: {e}")
@@ -83,6 +173,13 @@ def main():
     except Exception as e:
         print(f"❌ Error starting server: {e}")
         sys.exit(1)
+    finally:
+        # Let running downloads finish and hand the rest back to the journal.
+        # The reloader restarts the development server at once, so don't wait there.
+        if serving:
+            left = download_service.shutdown(app.config['SHUTDOWN_TIMEOUT'] if not debug else 0)
+            if left:
+                print(f"Saved {left} unfinished download(s) for the next start")
 
 
 if __name__ == '__main__':
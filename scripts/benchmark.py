@@ -0,0 +1,698 @@
+#!/usr/bin/env python3
+"""
+Benchmark Script
+Offline benchmarks of the download pipeline: microbenchmarks of the format,
+info and thumbnail code paths, end-to-end runs of 1..N concurrent jobs
+against a local HTTP server serving synthetic media, and startup time.
+
+    python scripts/benchmark.py all --jobs 1 2 4 --save baseline.json
+    python scripts/benchmark.py startup --startup-target 1000
+    python scripts/benchmark.py all --compare baseline.json
+    python scripts/benchmark.py record "https://www.youtube.com/watch?v=..." fixture.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+# Add the project root to the Python path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# Modules that must not be loaded just to start the app
+HEAVY_MODULES = ('yt_dlp', 'PIL', 'mutagen', 'requests')
+
+VIDEO_HEIGHTS = (144, 240, 360, 480, 720, 1080, 1440, 2160)
+VIDEO_CODECS = ('avc1.640028', 'vp09.00.40.08', 'av01.0.08M.08')
+AUDIO_LANGUAGES = ('en', 'es', 'fr', 'de', 'it', 'pt', 'ja', 'ko', 'hi', 'ru', 'ar', 'id')
+
+
+# --- Local media server ---
+
+class MediaRequestHandler(BaseHTTPRequestHandler):
+    """Serve the synthetic media with Range support and optional added latency"""
+
+    directory = '.'
+    latency = 0.0
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _serve(self, send_body: bool):
+        if self.latency:
+            time.sleep(self.latency)
+
+        path = os.path.join(self.directory, os.path.basename(self.path.split('?')[0]))
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        range_header = self.headers.get('Range', '')
+        if range_header.startswith('bytes='):
+            first, _, last = range_header[6:].split(',')[0].partition('-')
+            start = int(first) if first else max(0, size - int(last))
+            end = min(int(last), size - 1) if first and last else end
+            if start >= size:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            self.send_response(200)
+
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        if not send_body:
+            return
+
+        with open(path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start + 1
+            try:
+                while remaining > 0:
+                    chunk = f.read(min(64 * 1024, remaining))
+                    if not chunk:
+                        break
+                    self.wfile.write(chunk)
+                    remaining -= len(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_media_server(directory: str, latency: float = 0.0) -> ThreadingHTTPServer:
+    """Serve a directory on a free local port in a background thread"""
+    handler = type('Handler', (MediaRequestHandler,), {
+        'directory': directory, 'latency': latency})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# --- Synthetic media and fixtures ---
+
+def generate_media(directory: str, duration: int) -> Dict[str, int]:
+    """Create a video, an HLS rendition of it, an audio track and a cover image.
+    :return: The size of each media file by name."""
+    from PIL import Image
+    from downloaders.utils.ffmpeg_utils import get_ffmpeg_path
+
+    ffmpeg = get_ffmpeg_path()
+    if not ffmpeg:
+        raise RuntimeError("FFmpeg is required to generate the benchmark media")
+
+    def run(*args: str):
+        subprocess.run([ffmpeg, '-y', '-loglevel', 'error', *args], check=True)
+
+    video = os.path.join(directory, 'video.mp4')
+    # A keyframe every two seconds, so the HLS rendition splits into fragments
+    source = ['-f', 'lavfi', '-i', f'testsrc2=size=1280x720:rate=30:duration={duration}', '-g', '60']
+    try:
+        run(*source, '-c:v', 'libx264', '-preset', 'ultrafast', '-b:v', '4M', video)
+    except subprocess.CalledProcessError:
+        run(*source, '-c:v', 'mpeg4', '-b:v', '4M', video)
+    run('-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}',
+        '-c:a', 'aac', '-b:a', '128k', os.path.join(directory, 'audio.m4a'))
+    run('-i', video, '-c', 'copy', '-f', 'hls', '-hls_time', '2', '-hls_playlist_type', 'vod',
+        '-hls_segment_filename', os.path.join(directory, 'segment%03d.ts'),
+        os.path.join(directory, 'video.m3u8'))
+
+    # Noise doesn't compress, so the cover conversion does real work
+    Image.effect_noise((1280, 720), 64).convert('RGB').save(os.path.join(directory, 'cover.png'))
+
+    sizes = {name: os.path.getsize(os.path.join(directory, name))
+             for name in ('video.mp4', 'audio.m4a', 'cover.png')}
+    # Everything an HLS download fetches: the playlist and its segments
+    sizes['video.m3u8'] = sum(os.path.getsize(os.path.join(directory, name))
+                              for name in os.listdir(directory) if name.startswith(('video.m3u8', 'segment')))
+    return sizes
+
+
+def make_info(video_id: str, base_url: str, media: Dict[str, int], format_count: int = 400) -> Dict:
+    """Build a yt-dlp info dict shaped like a YouTube video with a long format list.
+    Every format points at the local media of its kind, whatever its codec."""
+    rng = random.Random(video_id)
+    formats: List[Dict] = [
+        {'format_id': f'sb{i}', 'format_note': 'storyboard', 'ext': 'mhtml', 'protocol': 'mhtml',
+         'vcodec': 'none', 'acodec': 'none', 'url': f'{base_url}/storyboard{i}.mhtml'}
+        for i in range(4)
+    ]
+
+    formats.append({'format_id': '140', 'ext': 'm4a', 'protocol': 'http', 'vcodec': 'none',
+                    'acodec': 'mp4a.40.2', 'abr': 129.5, 'asr': 44100, 'audio_channels': 2,
+                    'filesize': media['audio.m4a'], 'url': f'{base_url}/audio.m4a'})
+    for height in VIDEO_HEIGHTS:
+        for codec in VIDEO_CODECS:
+            is_h264 = codec.startswith('avc1')
+            formats.append({
+                'format_id': f'{height}-{codec.split(".")[0]}', 'ext': 'mp4' if is_h264 else 'webm',
+                'protocol': 'http', 'vcodec': codec, 'acodec': 'none', 'height': height,
+                'width': height * 16 // 9, 'fps': 30, 'tbr': height * 4.0,
+                'filesize': media['video.mp4'], 'url': f'{base_url}/video.mp4',
+            })
+        formats.append({
+            'format_id': f'hls-{height}', 'ext': 'mp4', 'protocol': 'm3u8_native',
+            'vcodec': 'avc1.640028', 'acodec': 'none', 'height': height, 'width': height * 16 // 9,
+            'fps': 30, 'tbr': height * 4.0, 'url': f'{base_url}/video.m3u8',
+        })
+
+    # Dubbed audio tracks and their variants are what make real format lists long
+    while len(formats) < format_count:
+        language = rng.choice(AUDIO_LANGUAGES)
+        abr = rng.choice((48, 64, 128, 160))
+        formats.append({
+            'format_id': f'{len(formats)}-{language}', 'ext': rng.choice(('m4a', 'webm')),
+            'protocol': 'http', 'vcodec': 'none', 'acodec': rng.choice(('mp4a.40.5', 'opus')),
+            'abr': abr - rng.random(), 'language': language, 'language_preference': -1,
+            'filesize': media['audio.m4a'], 'url': f'{base_url}/audio.m4a',
+        })
+
+    thumbnails = [{'url': f'{base_url}/cover.png?{size}', 'width': size, 'height': size}
+                  for size in (120, 360, 720)]
+    thumbnails.append({'url': f'{base_url}/cover.png', 'width': 1280, 'height': 720})
+
+    return {
+        'id': video_id,
+        'title': f'Benchmark {video_id}',
+        'uploader': 'Benchmark',
+        'upload_date': '20240101',
+        'duration': 30,
+        'extractor': 'youtube',
+        'extractor_key': 'Youtube',
+        'webpage_url': f'https://www.youtube.com/watch?v={video_id}',
+        'thumbnail': f'{base_url}/cover.png',
+        'thumbnails': thumbnails,
+        'formats': formats,
+    }
+
+
+def localize_fixture(info: Dict, video_id: str, base_url: str, media: Dict[str, int]) -> Dict:
+    """Point a recorded info dict at the local media server"""
+    info = json.loads(json.dumps(info))
+    for key in ('requested_formats', 'requested_downloads', 'format_id', 'url', 'ext'):
+        info.pop(key, None)
+    info['id'] = video_id
+    info['title'] = f"{info.get('title', 'Benchmark')} {video_id}"
+    info['webpage_url'] = f'https://www.youtube.com/watch?v={video_id}'
+    info['thumbnail'] = f'{base_url}/cover.png'
+    info['thumbnails'] = [{'url': f'{base_url}/cover.png', 'width': 1280, 'height': 720}]
+
+    for fmt in info.get('formats', []):
+        for key in ('fragments', 'fragment_base_url', 'manifest_url', 'downloader_options'):
+            fmt.pop(key, None)
+        is_hls = fmt.get('protocol', '').startswith('m3u8')
+        if fmt.get('vcodec', 'none') != 'none':
+            fmt['url'] = f"{base_url}/{'video.m3u8' if is_hls else 'video.mp4'}"
+            fmt['filesize'] = None if is_hls else media['video.mp4']
+        elif fmt.get('acodec', 'none') != 'none':
+            fmt['url'] = f'{base_url}/audio.m4a'
+            fmt['filesize'] = media['audio.m4a']
+        else:
+            fmt['url'] = f'{base_url}/missing'
+        fmt['protocol'] = 'm3u8_native' if is_hls else 'http'
+    return info
+
+
+def load_fixture(path: Optional[str]) -> Optional[Dict]:
+    """Load a recorded info JSON fixture"""
+    if not path:
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def pick_format(info: Dict, kind: str) -> Dict:
+    """Pick the format an end-to-end job downloads: the best H.264 stream for
+    video (progressive or HLS), else the best AAC track"""
+    def is_h264(fmt):
+        return (fmt.get('vcodec') or '').startswith(('avc1', 'h264'))
+
+    if kind == 'video':
+        candidates = [f for f in info['formats'] if is_h264(f) and f['protocol'] == 'http']
+    elif kind == 'hls':
+        candidates = [f for f in info['formats'] if is_h264(f) and f['protocol'] == 'm3u8_native']
+    else:
+        candidates = [f for f in info['formats']
+                      if f.get('vcodec') == 'none' and (f.get('acodec') or '').startswith('mp4a')
+                      and not f.get('language_preference')]
+    if not candidates:
+        raise ValueError(f"The fixture has no format for '{kind}' jobs")
+    return max(candidates, key=lambda f: (f.get('height') or 0, f.get('abr') or 0))
+
+
+# --- Measurements ---
+
+def peak_rss_mb() -> Optional[float]:
+    """Get the peak resident memory of this process in MB"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def histogram_totals() -> Dict[str, List[float]]:
+    """Get [count, sum] of every pipeline stage histogram"""
+    from downloaders.utils.metrics import registry
+    totals: Dict[str, List[float]] = {}
+    for line in registry.render().splitlines():
+        name, _, value = line.rpartition(' ')
+        for suffix, position in (('_count', 0), ('_sum', 1)):
+            if name.endswith('_seconds' + suffix):
+                stage = name[len('ytdl_'):-len('_seconds' + suffix)]
+                totals.setdefault(stage, [0, 0.0])[position] = float(value)
+    return totals
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Get a percentile by linear interpolation"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def measure(func, min_time: float = 0.2, repeat: int = 5) -> Dict[str, float]:
+    """Time a callable with timeit.
+    :return: The best and median time per call in microseconds."""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    runs = [elapsed / number * 1e6 for elapsed in timer.repeat(repeat, number)]
+    return {'best_us': min(runs), 'median_us': statistics.median(runs), 'calls': number}
+
+
+# --- Microbenchmarks ---
+
+def run_microbenchmarks(base_url: str, media_dir: str, media: Dict[str, int],
+                        format_count: int, fixture: Optional[Dict]) -> Dict[str, Dict]:
+    """Time the hot paths that run on every page load and download"""
+    from downloaders.utils.thumbnail_utils import ThumbnailCache, embed_thumbnail, to_jpeg
+    from downloaders.youtube import YouTubeDownloader
+
+    info = (localize_fixture(fixture, 'benchvid000', base_url, media) if fixture
+            else make_info('benchvid000', base_url, media, format_count))
+    url = info['webpage_url']
+    results: Dict[str, Dict] = {}
+
+    downloader = YouTubeDownloader(url)
+    downloader.info = info
+
+    def cold(method):
+        # Drop the format index, as for a video seen for the first time
+        downloader._format_index = None
+        return method()
+
+    results['filter_formats (cold)'] = measure(lambda: cold(downloader._filter_formats))
+    results['filter_formats (warm)'] = measure(lambda: downloader._filter_formats())
+    results['get_video_info (cold)'] = measure(lambda: cold(downloader.get_video_info))
+    results['get_video_info (warm)'] = measure(lambda: downloader.get_video_info())
+
+    with open(os.path.join(media_dir, 'cover.png'), 'rb') as f:
+        cover = f.read()
+    results['to_jpeg'] = measure(lambda: to_jpeg(cover, 1280))
+
+    cache = ThumbnailCache(directory=tempfile.mkdtemp(prefix='thumbnails-'))
+    cache.get(f'{base_url}/cover.png')
+    results['thumbnail cache hit'] = measure(lambda: cache.get(f'{base_url}/cover.png'))
+    misses = iter(range(10 ** 9))
+    results['thumbnail cache miss'] = measure(
+        lambda: cache.get(f'{base_url}/cover.png?miss={next(misses)}'), repeat=3)
+
+    jpeg = to_jpeg(cover, 1280)
+    target = os.path.join(tempfile.mkdtemp(prefix='embed-'), 'audio.m4a')
+    shutil.copy(os.path.join(media_dir, 'audio.m4a'), target)
+    results['embed_thumbnail (m4a)'] = measure(lambda: embed_thumbnail(target, jpeg), repeat=3)
+
+    return results
+
+
+# --- End-to-end runs ---
+
+def _e2e_worker(spec: Dict, results: 'multiprocessing.Queue'):
+    """Run one concurrency level in a fresh process, so peak RSS and CPU time
+    belong to that level alone"""
+    if not spec['verbose']:
+        sys.stdout = sys.stderr = open(os.devnull, 'w')
+    try:
+        results.put(_run_e2e_level(spec))
+    except Exception as e:
+        results.put({'jobs': spec['jobs'], 'error': f'{type(e).__name__}: {e}'})
+
+
+def _run_e2e_level(spec: Dict) -> Dict:
+    from app.services.download_service import DownloadService
+    from downloaders.utils.info_cache import get_info_cache
+
+    fixture = load_fixture(spec['fixture'])
+    service = DownloadService(max_workers=spec['workers'] or spec['jobs'])
+    cache = get_info_cache()
+
+    # The info cache stands in for extraction, so no request leaves the machine
+    downloads = []
+    for index in range(spec['jobs']):
+        video_id = f'bench{index:06d}'
+        info = (localize_fixture(fixture, video_id, spec['base_url'], spec['media']) if fixture
+                else make_info(video_id, spec['base_url'], spec['media'], spec['formats']))
+        cache.set(info['webpage_url'], info)
+        downloads.append((info['webpage_url'], pick_format(info, spec['kind'])['format_id']))
+
+    before = histogram_totals()
+    cpu_before = os.times()
+    started = time.perf_counter()
+    job_ids = [service.start_download(url, format_id, passthrough=spec['kind'] == 'passthrough')['job_id']
+               for url, format_id in downloads]
+    jobs = [service.job_queue.get(job_id) for job_id in job_ids]
+    while any(job.status not in ('done', 'error') for job in jobs):
+        time.sleep(0.01)
+    wall = time.perf_counter() - started
+    cpu_after = os.times()
+    after = histogram_totals()
+    service.job_queue.shutdown()
+
+    done = [job for job in jobs if job.status == 'done']
+    media = spec['media']
+    job_bytes = {'video': media['video.mp4'] + media['audio.m4a'],
+                 'hls': media['video.m3u8'] + media['audio.m4a']}.get(spec['kind'], media['audio.m4a'])
+    downloaded = job_bytes * len(done)
+
+    stages = {}
+    for stage, (count, total) in after.items():
+        count_delta = count - before.get(stage, [0, 0.0])[0]
+        if count_delta:
+            stages[stage] = (total - before[stage][1]) / count_delta
+
+    latencies = [job.finished_at - job.created_at for job in done]
+    return {
+        'jobs': spec['jobs'],
+        'failed': len(jobs) - len(done),
+        'errors': sorted({job.error for job in jobs if job.error}),
+        'wall_s': wall,
+        'throughput_mb_s': downloaded / wall / (1024 * 1024) if wall else 0.0,
+        'jobs_per_s': len(done) / wall if wall else 0.0,
+        'latency_p50_s': percentile(latencies, 0.5),
+        'latency_p95_s': percentile(latencies, 0.95),
+        'latency_max_s': max(latencies, default=0.0),
+        'queue_wait_s': statistics.mean(job.started_at - job.created_at for job in done) if done else 0.0,
+        'stage_mean_s': stages,
+        'cpu_user_s': cpu_after.user - cpu_before.user,
+        'cpu_system_s': cpu_after.system - cpu_before.system,
+        'cpu_ffmpeg_s': (cpu_after.children_user + cpu_after.children_system
+                         - cpu_before.children_user - cpu_before.children_system),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def run_e2e(levels: List[int], spec: Dict, workdir: str) -> List[Dict]:
+    """Run every concurrency level in its own process and sandboxed download folder"""
+    context = multiprocessing.get_context('spawn')
+    runs = []
+    for jobs in levels:
+        # Downloads, caches and the journal of each run go to a throwaway home
+        home = tempfile.mkdtemp(prefix=f'jobs{jobs}-', dir=workdir)
+        os.environ['HOME'] = os.environ['USERPROFILE'] = home
+        queue = context.Queue()
+        process = context.Process(target=_e2e_worker, args=(dict(spec, jobs=jobs), queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        runs.append(result)
+        print_e2e_run(result)
+    return runs
+
+
+# --- Startup ---
+
+STARTUP_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+from app import create_app
+create_app()
+print(json.dumps({'create_app_ms': (time.perf_counter() - start) * 1000,
+                  'heavy_modules': [name for name in %r if name in sys.modules]}))
+'''
+
+
+def _time_first_response() -> float:
+    """Start main.py and wait for its first answer to GET /.
+    :return: Milliseconds from launching the process to the response."""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+
+    env = dict(os.environ, FLASK_DEBUG='false', FLASK_PORT=str(port))
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.join(project_root, 'main.py')],
+                               cwd=project_root, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < 60:
+            if process.poll() is not None:
+                raise RuntimeError(f"main.py exited with code {process.returncode}")
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=5) as response:
+                    if response.status == 200:
+                        return (time.perf_counter() - start) * 1000
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError("main.py did not answer within 60 seconds")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def run_startup(runs: int = 3) -> Dict:
+    """Time create_app() in a fresh interpreter and the time to first response
+    of main.py (the median of several runs, after one to warm the disk cache)"""
+    probe = subprocess.run([sys.executable, '-c', STARTUP_PROBE % (HEAVY_MODULES,)],
+                           cwd=project_root, capture_output=True, text=True, check=True)
+    result = json.loads(probe.stdout.strip().splitlines()[-1])
+
+    _time_first_response()
+    result['first_response_ms'] = statistics.median(_time_first_response() for _ in range(runs))
+    return result
+
+
+# --- Reporting ---
+
+def print_microbenchmarks(results: Dict[str, Dict]):
+    print(f"\n{'Microbenchmark':<28}{'best':>12}{'median':>12}")
+    for name, result in results.items():
+        print(f"{name:<28}{result['best_us']:>10.1f}µs{result['median_us']:>10.1f}µs")
+
+
+def print_e2e_run(result: Dict):
+    if 'error' in result:
+        print(f"\n{result['jobs']} job(s): failed to run: {result['error']}")
+        return
+
+    rss = f"{result['peak_rss_mb']:.0f} MB" if result['peak_rss_mb'] is not None else 'n/a'
+    stages = ', '.join(f'{stage} {seconds:.2f}s' for stage, seconds in result['stage_mean_s'].items())
+    failed = f", {result['failed']} failed" if result['failed'] else ''
+    print(f"\n{result['jobs']} job(s) in {result['wall_s']:.2f}s{failed}")
+    print(f"  throughput  {result['throughput_mb_s']:.1f} MB/s, {result['jobs_per_s']:.2f} jobs/s")
+    print(f"  latency     p50 {result['latency_p50_s']:.2f}s, p95 {result['latency_p95_s']:.2f}s, "
+          f"max {result['latency_max_s']:.2f}s, queued {result['queue_wait_s']:.2f}s")
+    print(f"  stage mean  {stages or 'n/a'}")
+    print(f"  cpu         {result['cpu_user_s']:.2f}s user, {result['cpu_system_s']:.2f}s system, "
+          f"{result['cpu_ffmpeg_s']:.2f}s ffmpeg")
+    print(f"  peak RSS    {rss}")
+    for error in result['errors']:
+        print(f"  error       {error}")
+
+
+def print_startup(result: Dict, target: float):
+    heavy = ', '.join(result['heavy_modules']) or 'none'
+    status = '✅' if result['first_response_ms'] <= target else '❌'
+    print(f"\nStartup")
+    print(f"  create_app      {result['create_app_ms']:.0f} ms (heavy modules loaded: {heavy})")
+    print(f"  first response  {result['first_response_ms']:.0f} ms {status} target {target:.0f} ms")
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Find the measurements that got worse than the baseline by more than the tolerance"""
+    regressions = []
+
+    def check(label: str, value, reference, higher_is_better: bool = False):
+        if value is None or not reference:
+            return
+        change = (value - reference) / reference
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append(f'{label}: {reference:.2f} -> {value:.2f} ({change:+.0%})')
+
+    for name, result in results.get('micro', {}).items():
+        if name in baseline.get('micro', {}):
+            check(f'{name} best µs', result['best_us'], baseline['micro'][name]['best_us'])
+
+    reference_runs = {run['jobs']: run for run in baseline.get('e2e', []) if 'error' not in run}
+    for run in results.get('e2e', []):
+        reference = reference_runs.get(run['jobs'])
+        if 'error' in run or not reference:
+            continue
+        label = f"{run['jobs']} job(s)"
+        check(f'{label} throughput MB/s', run['throughput_mb_s'],
+              reference['throughput_mb_s'], higher_is_better=True)
+        check(f'{label} p95 latency s', run['latency_p95_s'], reference['latency_p95_s'])
+        check(f'{label} peak RSS MB', run['peak_rss_mb'], reference['peak_rss_mb'])
+
+    if 'startup' in results and 'startup' in baseline:
+        check('first response ms', results['startup']['first_response_ms'],
+              baseline['startup']['first_response_ms'])
+    return regressions
+
+
+def record_fixture(url: str, output: str):
+    """Save the info of a real video as a fixture (the only command that uses the network)"""
+    from yt_dlp import YoutubeDL
+
+    with YoutubeDL({'quiet': True}) as ydl:
+        info = ydl.sanitize_info(ydl.extract_info(url, download=False))
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(info, f)
+    print(f"✅ Saved {len(info.get('formats', []))} formats of \"{info.get('title')}\" to {output}")
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    options = argparse.ArgumentParser(add_help=False)
+    options.add_argument('--fixture', help='Recorded yt-dlp info JSON to use instead of the synthetic one')
+    options.add_argument('--formats', type=int, default=400,
+                         help='Formats in the synthetic info (default: 400)')
+    options.add_argument('--duration', type=int, default=30,
+                         help='Seconds of synthetic media (default: 30)')
+    options.add_argument('--latency', type=float, default=0.0,
+                         help='Milliseconds added to every request of the media server')
+    options.add_argument('--jobs', type=int, nargs='+', default=[1, 2, 4],
+                         help='Concurrent jobs of each end-to-end run (default: 1 2 4)')
+    options.add_argument('--kind', choices=('video', 'hls', 'audio', 'passthrough'), default='video',
+                         help='What each end-to-end job downloads (default: video)')
+    options.add_argument('--workers', type=int, default=0,
+                         help='Download workers (default: one per job)')
+    options.add_argument('--save', help='Write the results to a JSON file')
+    options.add_argument('--compare', help='Exit with an error when worse than these saved results')
+    options.add_argument('--tolerance', type=float, default=0.2,
+                         help='Allowed slowdown before --compare fails (default: 0.2)')
+    options.add_argument('--startup-target', type=float, default=1000,
+                         help='Most milliseconds main.py may take to answer its first request (default: 1000)')
+    options.add_argument('--verbose', action='store_true', help='Show the output of the downloads')
+
+    for name, help_text in (('all', 'Run every benchmark'),
+                            ('micro', 'Run the microbenchmarks'),
+                            ('e2e', 'Run the end-to-end runs'),
+                            ('startup', 'Time the startup of the app')):
+        subparsers.add_parser(name, parents=[options], help=help_text)
+    record = subparsers.add_parser('record', help='Save the info of a real video as a fixture')
+    record.add_argument('url')
+    record.add_argument('output')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        record_fixture(args.url, args.output)
+        return
+
+    print("⏱️  Download Pipeline Benchmark")
+    print("=" * 40)
+
+    workdir = tempfile.mkdtemp(prefix='ytdl-benchmark-')
+    os.environ['HOME'] = os.environ['USERPROFILE'] = os.path.join(workdir, 'home')
+    # Send anything that isn't local to a dead proxy, so a fallback to the real
+    # site fails at once instead of skewing the numbers
+    for name in ('HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy'):
+        os.environ[name] = 'http://127.0.0.1:9'
+    os.environ['NO_PROXY'] = os.environ['no_proxy'] = '127.0.0.1,localhost'
+    media_dir = os.path.join(workdir, 'media')
+    os.makedirs(media_dir)
+    try:
+        media = generate_media(media_dir, args.duration)
+        server = start_media_server(media_dir, args.latency / 1000)
+        base_url = f'http://127.0.0.1:{server.server_address[1]}'
+        fixture = load_fixture(args.fixture)
+        print(f"Media: {media['video.mp4'] / (1024 * 1024):.1f} MB video, "
+              f"{media['audio.m4a'] / (1024 * 1024):.1f} MB audio served at {base_url}")
+
+        results: Dict = {}
+        if args.command in ('all', 'startup'):
+            results['startup'] = run_startup()
+            print_startup(results['startup'], args.startup_target)
+
+        if args.command in ('all', 'micro'):
+            stdout, sys.stdout = sys.stdout, (sys.stdout if args.verbose else open(os.devnull, 'w'))
+            try:
+                results['micro'] = run_microbenchmarks(
+                    base_url, media_dir, media, args.formats, fixture)
+            finally:
+                sys.stdout = stdout
+            print_microbenchmarks(results['micro'])
+
+        if args.command in ('all', 'e2e'):
+            results['e2e'] = run_e2e(args.jobs, {
+                'base_url': base_url, 'media': media, 'kind': args.kind,
+                'formats': args.formats, 'fixture': args.fixture,
+                'workers': args.workers, 'verbose': args.verbose,
+            }, workdir)
+
+        server.shutdown()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Saved results to {args.save}")
+
+    failed = 'startup' in results and results['startup']['first_response_ms'] > args.startup_target
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for regression in regressions:
+                print(f"   {regression}")
+            failed = True
+        else:
+            print(f"\n✅ No regressions beyond {args.tolerance:.0%}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()